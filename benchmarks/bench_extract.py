@@ -0,0 +1,57 @@
+"""Benchmark: tag extraction on files carrying large cover art.
+
+Generates a synthetic MP3/FLAC library where every file embeds a cover image
+and times reading the tags of every file with mutagen's File() (which loads the
+whole tag, pictures included) against the fast ID3v2/FLAC readers (which seek
+past picture frames and blocks). Both paths must return the same fields.
+
+Usage: python benchmarks/bench_extract.py [--tracks 500] [--cover-size 1048576] [--repeat 3]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rockbox_db_manager import bench, scanner, tags
+
+
+def time_reader(reader, files, repeat):
+    """Return the best wall time of reading every file's tags with reader, and the last results."""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        results = [reader(path) for path in files]
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=500)
+    parser.add_argument("--cover-size", type=int, default=1 << 20)
+    parser.add_argument("--flac-ratio", type=float, default=0.5)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    with tempfile.TemporaryDirectory() as tmp:
+        bench.generate_library(tmp, args.tracks, flac_ratio=args.flac_ratio, cover_size=args.cover_size)
+        files = list(scanner.iter_music_files(tmp))
+
+        print(f"{len(files)} files, {args.cover_size} byte cover art each")
+        print(f"{'reader':<10} {'seconds':>10} {'us/file':>10}")
+        baseline, expected = time_reader(tags.read_tags_mutagen, files, args.repeat)
+        fast, results = time_reader(tags.read_tags, files, args.repeat)
+        assert results == expected, "fast readers disagree with mutagen"
+        print(f"{'mutagen':<10} {baseline:>10.3f} {baseline / len(files) * 1e6:>10.1f}")
+        print(f"{'fast':<10} {fast:>10.3f} {fast / len(files) * 1e6:>10.1f}")
+        print(f"speedup: {baseline / fast:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
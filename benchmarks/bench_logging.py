@@ -0,0 +1,84 @@
+"""Benchmark: what logging costs in scan time.
+
+Scans a synthetic library with a fully warm metadata cache and verbose output,
+so every file produces a per-file log message, under several logging setups:
+logging off, rate-limited per-file messages written to a log file (the
+default), the same messages without the rate limit, and the same at DEBUG
+level, which adds a "Processing file" line per file. The difference with the
+first row is the cost of logging.
+
+Usage: python benchmarks/bench_logging.py [--files 20000] [--repeat 3]
+"""
+import argparse
+import logging
+import math
+import os
+import sys
+import tempfile
+import time
+from unittest.mock import patch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench_scan import build_library
+from rockbox_db_manager import cache, logs, scanner
+
+# (name, level, per-file burst); a burst of None keeps the default rate limit
+SETUPS = [
+    ("off", logging.WARNING, None),
+    ("info, rate limited", logging.INFO, None),
+    ("info, every file", logging.INFO, math.inf),
+    ("debug, every file", logging.DEBUG, math.inf),
+]
+
+
+def time_scan(music_dir, log_file, level, burst):
+    """Return the wall time of a verbose scan with logging to log_file at the given level."""
+    logging.basicConfig(level=level, format=logs.LOG_FORMAT, handlers=[logging.FileHandler(log_file)], force=True)
+    with patch.object(logs, "PER_FILE_BURST", burst if burst is not None else logs.PER_FILE_BURST):
+        logs._per_file.clear()
+        store = cache.get_cache(root=music_dir)
+        start = time.perf_counter()
+        count = sum(1 for _ in scanner.iter_tracks(music_dir, store, verbose=True))
+        logs.flush_per_file()
+        elapsed = time.perf_counter() - start
+    for handler in logging.getLogger().handlers:
+        handler.close()
+    return elapsed, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=20000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        music_dir = os.path.join(tmp, "music")
+        entries = build_library(music_dir, args.files)
+        cache.CACHE_FILE = os.path.join(tmp, "metadata_cache.db")
+        cache.JSON_CACHE_FILE = os.path.join(tmp, "metadata_cache.json")
+        cache.CACHE_DIR = None
+        warm = cache.load_cache()
+        warm.update(entries)
+        warm.commit()
+        warm.close()
+        cache._shared_cache = None
+
+        print(f"{'setup':<20} {'seconds':>10} {'us/file':>10} {'log bytes':>12}")
+        for name, level, burst in SETUPS:
+            log_file = os.path.join(tmp, "bench.log")
+            runs = []
+            for _ in range(args.repeat):
+                if os.path.exists(log_file):
+                    os.remove(log_file)
+                elapsed, count = time_scan(music_dir, log_file, level, burst)
+                assert count == args.files
+                runs.append(elapsed)
+            best = min(runs)
+            print(f"{name:<20} {best:>10.3f} {best / args.files * 1e6:>10.1f} {os.path.getsize(log_file):>12}")
+        cache.clear_cache()
+
+
+if __name__ == "__main__":
+    main()
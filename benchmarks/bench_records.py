@@ -0,0 +1,66 @@
+"""Benchmark: memory held by track metadata for a large library.
+
+Decodes a synthetic set of cached metadata lists (500k tracks by default), the
+way the cache hands them out, and keeps them all alive: once as the legacy
+9-tuples with JSON-decoded strings and lists, once as interned TrackRecords.
+Reports the memory traced by tracemalloc for each representation.
+
+Usage: python benchmarks/bench_records.py [--tracks 500000]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rockbox_db_manager.track import TrackRecord
+
+
+def synthetic_rows(num_tracks):
+    """Yield JSON-encoded cache rows; most tracks carry default values like a real, badly tagged library."""
+    for i in range(num_tracks):
+        tagged = i % 4 == 0
+        artist = f"Artist {i % 2000}" if tagged else "Unknown Artist"
+        yield json.dumps([
+            f"Title {i}" if tagged else "Unknown Title",
+            [artist],
+            f"Album {i % 8000}" if tagged else "Unknown Album",
+            ["Rock", "Jazz", "Pop", "Electronic"][i % 4] if tagged else "Unknown Genre",
+            f"track_{i:06d}.mp3",
+            "Unknown Composer",
+            "Unknown Comment",
+            artist if tagged else "Unknown",
+            "Unknown",
+        ])
+
+
+def measure(build, num_tracks):
+    """Return the traced memory, in bytes, of the records produced by build()."""
+    gc.collect()
+    tracemalloc.start()
+    records = [build(json.loads(row)) for row in synthetic_rows(num_tracks)]
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del records
+    return current
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tracks", type=int, default=500000)
+    args = parser.parse_args()
+
+    legacy = measure(tuple, args.tracks)
+    records = measure(TrackRecord.from_list, args.tracks)
+
+    print(f"{'representation':>16} {'MiB':>10} {'bytes/track':>12}")
+    print(f"{'9-tuple + lists':>16} {legacy / 2**20:>10.1f} {legacy / args.tracks:>12.0f}")
+    print(f"{'TrackRecord':>16} {records / 2**20:>10.1f} {records / args.tracks:>12.0f}")
+    print(f"saved: {(1 - records / legacy) * 100:.0f}%")
+
+
+if __name__ == "__main__":
+    main()
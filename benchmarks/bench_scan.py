@@ -0,0 +1,74 @@
+"""Benchmark: scan time as the library grows.
+
+Builds synthetic libraries of increasing size with a fully warm metadata cache
+and times a filtered scan over each of them. With the cache loaded once per
+process the time per file should stay flat, i.e. total scan time grows linearly
+with library size.
+
+Usage: python benchmarks/bench_scan.py [--sizes 1000 2000 4000 8000]
+"""
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rockbox_db_manager import cache, scanner
+
+
+def build_library(root, num_files, files_per_dir=100):
+    """Create num_files empty .mp3 files and a matching warm cache entry for each."""
+    entries = {}
+    for i in range(num_files):
+        album_dir = os.path.join(root, f"artist_{i // 1000:03d}", f"album_{i // files_per_dir:05d}")
+        os.makedirs(album_dir, exist_ok=True)
+        path = os.path.join(album_dir, f"track_{i:06d}.mp3")
+        open(path, "wb").close()
+        entries[path] = {
+            "mtime": os.path.getmtime(path),
+            "version": cache.METADATA_VERSION,
+            "metadata": [f"Title {i}", [f"Artist {i // 1000}"], f"Album {i // files_per_dir}", "Genre",
+                         os.path.basename(path), "Composer", "Comment", f"Artist {i // 1000}", "Grouping"],
+        }
+    return entries
+
+
+def time_scan(num_files):
+    """Return the wall time of a filtered scan over a synthetic library of num_files files."""
+    with tempfile.TemporaryDirectory() as tmp:
+        music_dir = os.path.join(tmp, "music")
+        entries = build_library(music_dir, num_files)
+        cache.CACHE_FILE = os.path.join(tmp, "metadata_cache.db")
+        cache.JSON_CACHE_FILE = os.path.join(tmp, "metadata_cache.json")
+        cache.CACHE_DIR = None
+        warm = cache.load_cache()
+        warm.update(entries)
+        warm.commit()
+        warm.close()
+        cache._shared_cache = None
+
+        start = time.perf_counter()
+        found = scanner.scan_music_directory(music_dir, only_artist="Artist 0")
+        elapsed = time.perf_counter() - start
+        assert len(found) == min(num_files, 1000)
+        cache.clear_cache()
+        return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 2000, 4000, 8000])
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    print(f"{'files':>8} {'seconds':>10} {'us/file':>10}")
+    for size in args.sizes:
+        elapsed = time_scan(size)
+        print(f"{size:>8} {elapsed:>10.3f} {elapsed / size * 1e6:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,84 @@
+"""Benchmark: directory walk on a synthetic tree of 100k files.
+
+Compares the previous os.walk walker, followed by the extra os.path.getmtime
+the cache used to perform for every file, with the scandir walker that prunes
+excluded subtrees and hands its stat results to the cache.
+
+Usage: python benchmarks/bench_walk.py [--files 100000] [--repeat 3]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from rockbox_db_manager.scanner import SUPPORTED_FORMATS, iter_music_entries
+
+EXTENSIONS = [".mp3", ".flac", ".m4a", ".ogg", ".jpg", ".txt"]
+
+
+def build_tree(root, num_files, files_per_dir=50):
+    """Create num_files empty files spread over artist/album folders, 10% of them under an excluded folder."""
+    created = set()
+    for i in range(num_files):
+        top = "Podcasts" if i % 10 == 0 else f"artist_{i // 2000:03d}"
+        album_dir = os.path.join(root, top, f"album_{i // files_per_dir:05d}")
+        if album_dir not in created:
+            os.makedirs(album_dir, exist_ok=True)
+            created.add(album_dir)
+        open(os.path.join(album_dir, f"track_{i:06d}{EXTENSIONS[i % len(EXTENSIONS)]}"), "wb").close()
+
+
+def legacy_walk(directory, exclude):
+    """The os.walk-based walker plus the per-file getmtime the cache used to do."""
+    found = []
+    for root, dirs, files in os.walk(directory):
+        if any(ex_dir in root for ex_dir in exclude):
+            continue
+        for file in files:
+            if file.lower().endswith(SUPPORTED_FORMATS) and not any(file.lower().endswith(ext) for ext in exclude):
+                full_path = os.path.join(root, file)
+                found.append((full_path, os.path.getmtime(full_path)))
+    return found
+
+
+def scandir_walk(directory, exclude):
+    """The scandir walker; the stat result already carries the mtime."""
+    return [(path, st.st_mtime) for path, st in iter_music_entries(directory, exclude)]
+
+
+def best_of(func, repeat, *args):
+    """Return the best wall time over repeat runs and the last result."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        print(f"Building synthetic tree of {args.files} files...")
+        build_tree(tmp, args.files)
+        exclude = [os.path.join(tmp, "Podcasts"), ".ogg"]
+
+        legacy_time, legacy = best_of(legacy_walk, args.repeat, tmp, exclude)
+        scandir_time, current = best_of(scandir_walk, args.repeat, tmp, exclude)
+        assert sorted(legacy) == sorted(current)
+
+        print(f"{'walker':>10} {'seconds':>10} {'files':>8}")
+        print(f"{'os.walk':>10} {legacy_time:>10.3f} {len(legacy):>8}")
+        print(f"{'scandir':>10} {scandir_time:>10.3f} {len(current):>8}")
+        print(f"speedup: {legacy_time / scandir_time:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,66 +1,83 @@
 import os
-import struct
 import logging
 import string
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError, index_track_count
+from rockbox_db_manager.tcd_writer import TAG_FILES, INDEX_FILE
 
-# Set up logging
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+# Tag files of length-prefixed strings; database_12.tcd is only written by some Rockbox versions
+SUPPORTED_TCD_FILES = list(TAG_FILES.values()) + ["database_12.tcd"]
 
-# Updated list of supported .tcd files based on the new information
-SUPPORTED_TCD_FILES = [f"database_{i}.tcd" for i in range(9)] + ["database_12.tcd", "database_idx.tcd"]
+# Number of entries shown per file in the analysis report
+SAMPLE_SIZE = 10
+
+def iter_tcd_entries(filepath):
+    """Lazily yield the decoded entries of a .tcd file, stopping at the first malformed entry."""
+    try:
+        with TcdReader(filepath) as reader:
+            logging.info("Read %s bytes from %s", len(reader), os.path.basename(filepath))
+            try:
+                for _, _, entry in reader.iter_strings():
+                    yield entry
+            except TcdFormatError as e:
+                logging.warning("Failed to parse entry at position %s in %s: %s", e.offset, filepath, e)
+    except OSError as e:
+        logging.error("Failed to read %s: %s", filepath, e)
 
 def read_tcd_file(filepath):
     """Read and decode the binary data from a .tcd file."""
-    try:
-        with open(filepath, 'rb') as f:
-            content = f.read()
-            logging.info(f"Read {len(content)} bytes from {os.path.basename(filepath)}")
-            
-            # Example: Decode binary data (this will depend on Rockbox's format)
-            entries = []
-            idx = 0
-            while idx < len(content):
-                try:
-                    str_len = struct.unpack('<I', content[idx:idx+4])[0]  # Read the length (4 bytes)
-                    idx += 4
-                    entry = content[idx:idx+str_len].decode('utf-8', errors='ignore')
-                    entries.append(entry)
-                    idx += str_len
-                except Exception as e:
-                    logging.warning(f"Failed to parse entry at position {idx} in {filepath}: {e}")
-                    break
-            return entries
-    except Exception as e:
-        logging.error(f"Failed to read {filepath}: {e}")
-        return []
+    return list(iter_tcd_entries(filepath))
 
 def clean_text(text):
     """Remove non-printable characters from the text."""
     # Only keep printable characters (letters, digits, punctuation, whitespace)
     return ''.join(char if char in string.printable else '?' for char in text)
 
+def analyze_index(filepath, out):
+    """Report the track and offset counts of the master index, which holds offsets, not strings."""
+    try:
+        tracks = index_track_count(filepath)
+    except (OSError, TcdFormatError) as e:
+        logging.warning("Failed to parse %s: %s", filepath, e)
+        out.write(f"\n{INDEX_FILE} could not be read: {e}\n")
+        return
+    logging.info("Found %s tracks in %s", tracks, INDEX_FILE)
+    out.write(f"\n{INDEX_FILE} contains {tracks} tracks, {tracks * len(TAG_FILES)} offsets "
+              f"({len(TAG_FILES)} per track).\n")
+
 def analyze_database(db_dir, output_file):
-    """Analyze all .tcd files in the directory and save the report to a file."""
-    report = {}
+    """Analyze all .tcd files in the directory and save the report to a file.
+
+    Each file is streamed once: entries are counted and only the first few are decoded and kept
+    as samples, so memory use does not depend on the size of the database. The master index is
+    summarized by its track count.
+    """
     # Open the output file with utf-8 encoding to avoid encoding issues
     with open(output_file, 'w', encoding='utf-8') as out:
         for tcd_file in SUPPORTED_TCD_FILES:
             filepath = os.path.join(db_dir, tcd_file)
-            if os.path.exists(filepath):
-                logging.info(f"Analyzing {tcd_file}")
-                entries = read_tcd_file(filepath)
-                report[tcd_file] = entries
-                logging.info(f"Found {len(entries)} entries in {tcd_file}")
-            else:
-                logging.warning(f"{tcd_file} not found in {db_dir}")
-        
-        # Write the report to the file with utf-8 encoding
-        for tcd_file, entries in report.items():
-            out.write(f"\n{tcd_file} contains {len(entries)} entries:\n")
-            for entry in entries[:10]:  # Show the first 10 entries as a sample
+            if not os.path.exists(filepath):
+                logging.warning("%s not found in %s", tcd_file, db_dir)
+                continue
+
+            logging.info("Analyzing %s", tcd_file)
+            samples = []
+            count = 0
+            for entry in iter_tcd_entries(filepath):
+                if count < SAMPLE_SIZE:
+                    samples.append(entry)
+                count += 1
+            logging.info("Found %s entries in %s", count, tcd_file)
+
+            # Write the report to the file with utf-8 encoding
+            out.write(f"\n{tcd_file} contains {count} entries:\n")
+            for entry in samples:  # Show the first entries as a sample
                 cleaned_entry = clean_text(entry)  # Clean the entry text
                 out.write(f"  - {cleaned_entry}\n")
-            if len(entries) > 10:
-                out.write(f"  ...and {len(entries) - 10} more.\n")
-
+            if count > SAMPLE_SIZE:
+                out.write(f"  ...and {count - SAMPLE_SIZE} more.\n")
 
+        index_path = os.path.join(db_dir, INDEX_FILE)
+        if os.path.exists(index_path):
+            analyze_index(index_path, out)
+        else:
+            logging.warning("%s not found in %s", INDEX_FILE, db_dir)
@@ -0,0 +1,140 @@
+import os
+import asyncio
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from rockbox_db_manager import profiling, scanner, logs
+from rockbox_db_manager.cache import get_file_metadata_from_cache, update_file_metadata_in_cache, safe_fingerprint
+from rockbox_db_manager.metadata import timed_read_metadata, count_parsed, split_entry
+
+# Default number of filesystem calls (listings, stats, tag reads) in flight at once
+ASYNC_CONCURRENCY = 16
+# Threads running the blocking calls; a network round trip holds a thread without using the CPU
+ASYNC_THREADS = 16
+
+class LocalFileSystem:
+    """The blocking filesystem calls made by the asyncio scanner, each one round trip on a network mount."""
+
+    def list_dir(self, path):
+        """Return the (name, path, is_dir, is_file) of every entry of a directory, in name order."""
+        with os.scandir(path) as it:
+            entries = sorted(it, key=lambda entry: entry.name)
+        return [(entry.name, entry.path, entry.is_dir(follow_symlinks=False), entry.is_file()) for entry in entries]
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def read_metadata(self, path):
+        """Read a file's tags; returns (metadata, error, seconds) like timed_read_metadata."""
+        return timed_read_metadata(path)
+
+    def fingerprint(self, path, size):
+        return safe_fingerprint(path, size)
+
+async def scan_tracks_async(directory, cache, exclude=None, files=None, concurrency=ASYNC_CONCURRENCY, threads=ASYNC_THREADS, fs=None, verbose=False, skip=None):
+    """Extract the metadata of every file under the directory, overlapping the filesystem calls.
+
+    Directory listings, stats and tag reads run on a small thread pool, with at most concurrency
+    calls in flight, so the round trips of a network mount or slow removable drive overlap instead
+    of adding up. Every directory is listed as soon as its parent is, and listed files are handed
+    to concurrency workers through a bounded queue. The cache is only touched from one dedicated
+    thread, so its lookups, which may hash files to recognize moves, never block the event loop.
+    Returns (path, metadata) pairs in the order of the serial walk, or of files when an already
+    walked list of paths or (path, stat_result) pairs is given. Files for which
+    skip(path, stat_result) is true are left out once stat'ed.
+    """
+    fs = fs or LocalFileSystem()
+    loop = asyncio.get_running_loop()
+    limit = asyncio.Semaphore(concurrency)
+    queue = asyncio.Queue(maxsize=concurrency * 4)
+    extensions, dir_pattern = scanner.compile_exclusions(exclude)
+    results = {}
+
+    with ThreadPoolExecutor(max_workers=min(threads, concurrency)) as executor, ThreadPoolExecutor(max_workers=1) as cache_executor:
+
+        async def call(func, *args):
+            async with limit:
+                return await loop.run_in_executor(executor, func, *args)
+
+        async def cached(func, *args):
+            # Cache backends are not safe for concurrent use, so every cache call runs on this one thread
+            return await loop.run_in_executor(cache_executor, func, *args)
+
+        async def walk(path):
+            try:
+                entries = await call(fs.list_dir, path)
+            except OSError as e:
+                logs.per_file(logging.ERROR, "Failed to list directory %s: %s", path, e)
+                return
+            subdirs = []
+            for name, entry_path, is_dir, is_file in entries:
+                if is_dir:
+                    # Exclude directories
+                    if not (dir_pattern and dir_pattern.search(entry_path)):
+                        subdirs.append(walk(entry_path))
+                elif is_file and os.path.splitext(name)[1].lower() in extensions:
+                    await queue.put((entry_path, None))
+            await asyncio.gather(*subdirs)
+
+        async def process(path, st):
+            if st is None:
+                st = await call(fs.stat, path)
+            if skip is not None and skip(path, st):
+                return None
+            cached_metadata = await cached(get_file_metadata_from_cache, cache, path, st)
+            if cached_metadata:
+                profiling.count("cache_hits")
+                if verbose:
+                    logs.per_file(logging.INFO, "Using cached metadata for %s", path)
+                return cached_metadata
+
+            profiling.count("cache_misses")
+            metadata, error, seconds = await call(fs.read_metadata, path)
+            profiling.add_time("parse", seconds, path)
+            count_parsed(st, error)
+            if error:
+                logs.per_file(logging.ERROR, "Error extracting metadata from file %s: %s", path, error)
+                return metadata
+            fingerprint = await call(fs.fingerprint, path, st.st_size)
+            await cached(update_file_metadata_in_cache, cache, path, metadata, st, fingerprint)
+            return metadata
+
+        async def worker():
+            while True:
+                item = await queue.get()
+                if item is None:
+                    return
+                path, st = item
+                try:
+                    file_metadata = await process(path, st)
+                    if file_metadata is not None:
+                        results[path] = file_metadata
+                except Exception as e:
+                    logs.per_file(logging.ERROR, "Failed to process file %s: %s", path, e)
+
+        workers = [asyncio.create_task(worker()) for _ in range(concurrency)]
+        try:
+            if files is not None:
+                for entry in files:
+                    await queue.put(split_entry(entry))
+            elif not (dir_pattern and dir_pattern.search(directory)):
+                await walk(directory)
+            for _ in workers:
+                await queue.put(None)
+            await asyncio.gather(*workers)
+        finally:
+            for task in workers:
+                task.cancel()
+
+    if files is not None:
+        paths = [split_entry(entry)[0] for entry in files]
+        return [(path, results[path]) for path in paths if path in results]
+    return [(path, results[path]) for path in sorted(results, key=scanner.walk_order_key)]
+
+def iter_tracks(directory, cache, show_songs=False, exclude=None, only_artist=None, only_album=None, verbose=False, files=None, concurrency=ASYNC_CONCURRENCY):
+    """scanner.iter_tracks on the asyncio path: the library is read as a whole, then filtered."""
+    if files is not None:
+        files = list(files)
+    with profiling.stage("async_scan"):
+        skip = scanner.indexed_filter(cache, only_artist, only_album)
+        tracks = asyncio.run(scan_tracks_async(directory, cache, exclude=exclude, files=files, concurrency=concurrency, verbose=verbose, skip=skip))
+    return scanner.filter_tracks(tracks, show_songs, only_artist, only_album)
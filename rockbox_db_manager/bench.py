@@ -0,0 +1,205 @@
+import os
+import sys
+import json
+import time
+import random
+import struct
+import logging
+import platform
+import statistics
+import tempfile
+from mutagen.id3 import ID3, TIT2, TPE1, TPE2, TALB, TCON, TCOM, APIC
+from mutagen.flac import FLAC, Picture
+from rockbox_db_manager import cache, scanner
+from rockbox_db_manager.analyzer import analyze_database, iter_tcd_entries
+from rockbox_db_manager.config import load_config
+from rockbox_db_manager.database import build_tag_data, write_tag_files, create_master_index_file, TAG_FILES
+
+# Bump when the set or meaning of the measured stages changes, so old results are not compared blindly
+BENCH_FORMAT_VERSION = 1
+BENCH_TRACKS = 2000
+BENCH_REPEAT = 3
+
+# A silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz) so mutagen recognizes the file
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+# fLaC marker and a STREAMINFO block (44.1 kHz, stereo, 16 bit, no samples); mutagen adds the tags
+FLAC_HEADER = (
+    b'fLaC' + b'\x80' + (34).to_bytes(3, 'big') + struct.pack('>HH', 4096, 4096) + b'\x00' * 6
+    + ((44100 << 44) | (1 << 41) | (15 << 36)).to_bytes(8, 'big') + b'\x00' * 16
+)
+GENRES = ["Rock", "Pop", "Jazz", "Classical", "Electronic", "Hip-Hop", "Folk", "Metal", "Blues", "Reggae", "Soul", "Ambient"]
+
+def write_mp3(path, tags, cover=b''):
+    """Write a tiny MP3 file with ID3v2 tags."""
+    with open(path, 'wb') as f:
+        f.write(MP3_FRAME * 4)
+    id3 = ID3()
+    id3.add(TIT2(encoding=3, text=tags["title"]))
+    id3.add(TPE1(encoding=3, text=", ".join(tags["artists"])))
+    id3.add(TPE2(encoding=3, text=tags["albumartist"]))
+    id3.add(TALB(encoding=3, text=tags["album"]))
+    id3.add(TCON(encoding=3, text=tags["genre"]))
+    id3.add(TCOM(encoding=3, text=tags["composer"]))
+    if cover:
+        id3.add(APIC(encoding=3, mime='image/jpeg', type=3, desc='Cover', data=cover))
+    id3.save(path)
+
+def write_flac(path, tags, cover=b''):
+    """Write a tiny FLAC file with Vorbis comments."""
+    with open(path, 'wb') as f:
+        f.write(FLAC_HEADER)
+    flac = FLAC(path)
+    flac["title"] = tags["title"]
+    flac["artist"] = tags["artists"]
+    flac["albumartist"] = tags["albumartist"]
+    flac["album"] = tags["album"]
+    flac["genre"] = tags["genre"]
+    flac["composer"] = tags["composer"]
+    if cover:
+        picture = Picture()
+        picture.type = 3
+        picture.mime = 'image/jpeg'
+        picture.data = cover
+        flac.add_picture(picture)
+    flac.save()
+
+def generate_library(root, tracks, flac_ratio=0.25, tracks_per_album=10, albums_per_artist=4, cover_size=0, seed=0):
+    """Generate a synthetic tagged library of MP3 and FLAC files laid out as Artist/Album/track.
+
+    The content is fully determined by the arguments, so runs on different machines and versions
+    measure the same library. Returns the number of files written.
+    """
+    rng = random.Random(seed)
+    cover = bytes(rng.getrandbits(8) for _ in range(cover_size))
+    for i in range(tracks):
+        album_index = i // tracks_per_album
+        artist_index = album_index // albums_per_artist
+        artist = f"Artist {artist_index:04d}"
+        artists = [artist]
+        if rng.random() < 0.1:
+            # Some tracks feature a second artist
+            artists.append(f"Artist {rng.randrange(max(1, tracks // (tracks_per_album * albums_per_artist))):04d}")
+        tags = {
+            "title": f"Track {i % tracks_per_album + 1:02d} of {artist} album {album_index}",
+            "artists": artists,
+            "albumartist": artist,
+            "album": f"Album {album_index:05d}",
+            "genre": GENRES[artist_index % len(GENRES)],
+            "composer": f"Composer {rng.randrange(50):02d}",
+        }
+        album_dir = os.path.join(root, artist, tags["album"])
+        os.makedirs(album_dir, exist_ok=True)
+        if rng.random() < flac_ratio:
+            write_flac(os.path.join(album_dir, f"{i % tracks_per_album + 1:02d}.flac"), tags, cover)
+        else:
+            write_mp3(os.path.join(album_dir, f"{i % tracks_per_album + 1:02d}.mp3"), tags, cover)
+    return tracks
+
+def use_cache_files(directory):
+    """Point the metadata cache at files in directory. Returns the previous settings.
+
+    The loaded cache is saved and closed first; get_cache() opens it again once the previous
+    settings are restored.
+    """
+    previous = (cache.CACHE_FILE, cache.JSON_CACHE_FILE, cache.CACHE_DIR)
+    if hasattr(cache._shared_cache, "commit"):
+        cache._shared_cache.commit()
+    reset_shared_cache()
+    cache.CACHE_FILE = os.path.join(directory, "metadata_cache.db")
+    cache.JSON_CACHE_FILE = os.path.join(directory, "metadata_cache.json")
+    cache.CACHE_DIR = None
+    return previous
+
+def reset_shared_cache():
+    """Close the shared cache so the next get_cache() reads it from disk, as a new process would."""
+    if hasattr(cache._shared_cache, "close"):
+        cache._shared_cache.close()
+    cache._shared_cache = None
+
+def timed(stage, results, func):
+    """Run func, record its wall time under stage and return its result."""
+    start = time.perf_counter()
+    value = func()
+    results.setdefault(stage, []).append(time.perf_counter() - start)
+    return value
+
+def scan(music_dir, jobs):
+    """Walk the library and extract every track's metadata through the shared cache."""
+    store = cache.get_cache(root=music_dir)
+    tracks = list(scanner.iter_tracks(music_dir, store, jobs=jobs))
+    cache.save_cache(store)
+    return tracks
+
+def write_database(output_dir, tracks, config):
+    """Aggregate the scanned tracks and write the tag files and master index."""
+    tag_data, _ = build_tag_data(tracks, config)
+    offsets, _, _ = write_tag_files(output_dir, tag_data)
+    create_master_index_file(output_dir, tag_data, offsets)
+
+def read_database(output_dir):
+    """Decode every entry of the generated tag files."""
+    return sum(1 for filename in TAG_FILES.values() for _ in iter_tcd_entries(os.path.join(output_dir, filename)))
+
+def run_benchmarks(tracks=BENCH_TRACKS, repeat=BENCH_REPEAT, jobs=1, flac_ratio=0.25, cover_size=0, library_dir=None, config_file="config.json"):
+    """Time the main stages of a database build on a synthetic library.
+
+    Stages: a scan with an empty cache (every file parsed), a scan with a warm cache reopened
+    from disk, writing the tag files and master index, reading every tag file back, and
+    analyze-db. Each stage runs `repeat` times; the results hold every run plus the minimum and
+    median. The library is generated in a temporary directory unless library_dir is given, in
+    which case it is reused when it already exists.
+    """
+    config = load_config(config_file)
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        music_dir = library_dir or os.path.join(tmp, "music")
+        if not os.path.isdir(music_dir) or not os.listdir(music_dir):
+            logging.info("Generating %s tracks in %s", tracks, music_dir)
+            timed("generate", results, lambda: generate_library(music_dir, tracks, flac_ratio=flac_ratio, cover_size=cover_size))
+        music_dir = os.path.abspath(music_dir)
+        output_dir = os.path.join(tmp, "db")
+        previous = use_cache_files(tmp)
+        try:
+            for _ in range(max(1, repeat)):
+                cache.clear_cache()
+                timed("cold_scan", results, lambda: scan(music_dir, jobs))
+                reset_shared_cache()
+                scanned = timed("warm_scan", results, lambda: scan(music_dir, jobs))
+                timed("write_tcd", results, lambda: write_database(output_dir, scanned, config))
+                timed("read_tcd", results, lambda: read_database(output_dir))
+                timed("analyze_db", results, lambda: analyze_database(output_dir, os.path.join(tmp, "report.txt")))
+            cache.clear_cache()
+        finally:
+            reset_shared_cache()
+            cache.CACHE_FILE, cache.JSON_CACHE_FILE, cache.CACHE_DIR = previous
+
+    return {
+        "format_version": BENCH_FORMAT_VERSION,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "parameters": {"tracks": len(scanned), "repeat": repeat, "jobs": jobs, "flac_ratio": flac_ratio, "cover_size": cover_size},
+        "stages": {
+            stage: {
+                "runs": [round(seconds, 6) for seconds in runs],
+                "min": round(min(runs), 6),
+                "median": round(statistics.median(runs), 6),
+                "us_per_track": round(min(runs) / max(1, len(scanned)) * 1e6, 2),
+            }
+            for stage, runs in results.items()
+        },
+    }
+
+def run_bench_command(output_file=None, **options):
+    """Run the benchmarks, print a summary table and save the results as JSON."""
+    results = run_benchmarks(**options)
+    print(f"{'stage':<12} {'min (s)':>10} {'median (s)':>11} {'us/track':>10}")
+    for stage, result in results["stages"].items():
+        print(f"{stage:<12} {result['min']:>10.4f} {result['median']:>11.4f} {result['us_per_track']:>10.1f}")
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as out:
+            json.dump(results, out, indent=2)
+        logging.info("Benchmark results written to %s", output_file)
+    else:
+        print(json.dumps(results, indent=2))
+    return results
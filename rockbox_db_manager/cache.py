@@ -1,45 +1,682 @@
 import os
+import re
 import json
+import hashlib
 import logging
+import sqlite3
+from collections import defaultdict
+from collections.abc import MutableMapping
+from contextlib import contextmanager
+from rockbox_db_manager import profiling, logs
+from rockbox_db_manager.track import TRACK_FIELDS, TrackRecord, as_record, encode_record
 
-CACHE_FILE = "metadata_cache.json"
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
 
-def load_cache():
-    """Load the metadata cache from a JSON file."""
-    if os.path.exists(CACHE_FILE):
-        with open(CACHE_FILE, 'r') as f:
-            try:
+# Cache backend used by load_cache(): "sqlite" (indexed, per-entry upserts) or "json" (legacy single blob)
+CACHE_BACKEND = "sqlite"
+CACHE_FILE = "metadata_cache.db"
+JSON_CACHE_FILE = "metadata_cache.json"
+# Directory of a sharded cache, one store per library root; None keeps the single files above
+CACHE_DIR = os.environ.get("ROCKBOX_DB_CACHE_DIR") or None
+# Shard holding the entries of files outside the library root
+DEFAULT_SHARD = "default"
+# File of a sharded cache directory recording the library root of every shard
+LIBRARIES_FILE = "libraries.json"
+# Seconds a process waits for another one to release a cache store before giving up
+LOCK_TIMEOUT = 30.0
+# Bytes hashed at each end of a file for its content fingerprint; tags live at the start or end
+FINGERPRINT_CHUNK = 64 << 10
+# Version of the metadata extraction; entries written by another version are parsed again
+METADATA_VERSION = 2
+
+# Fields of the inverted indexes used by filtered builds (--only-artist, --only-album)
+INDEXED_FIELDS = ("artist", "album", "albumartist")
+
+# Process-wide cache shared by the scanner, tagcache generation and list-tags
+_shared_cache = None
+
+def index_terms(metadata):
+    """The (field, value) pairs an entry is indexed under: each artist, the album and album artist, case-folded."""
+    record = as_record(metadata)
+    terms = {("artist", artist.casefold()) for artist in record.artists}
+    terms.add(("album", record.album.casefold()))
+    terms.add(("albumartist", record.albumartist.casefold()))
+    return terms
+
+@contextmanager
+def file_lock(path):
+    """Hold an exclusive lock on path for as long as the block runs, blocking other processes."""
+    with open(path, 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+class JsonCache(dict):
+    """Legacy cache backend: the whole cache lives in one JSON file, rewritten on commit.
+
+    Changes are tracked, and commit() merges them into the file as it is on disk under a lock, so
+    processes sharing the file keep each other's entries instead of the last writer winning.
+    """
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        self._by_size = None
+        self._by_tag = None
+        self._dirty = set()
+        self._deleted = set()
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                try:
+                    self.update(json.load(f))
+                except json.JSONDecodeError:
+                    logging.warning("Cache file is corrupted. Starting with a new cache.")
+
+    def __setitem__(self, key, entry):
+        super().__setitem__(key, entry)
+        self._dirty.add(key)
+        self._deleted.discard(key)
+        if self._by_size is not None and entry.get("size") is not None:
+            self._by_size[entry["size"]].add(key)
+        if self._by_tag is not None:
+            for term in index_terms(entry["metadata"]):
+                self._by_tag[term].add(key)
+
+    def entries_with_size(self, size):
+        """Yield (key, entry) for every entry of the given file size.
+
+        The size index is built on first use and kept up to date by __setitem__; keys that were
+        removed or rewritten since are filtered out when read.
+        """
+        if self._by_size is None:
+            self._by_size = defaultdict(set)
+            for key, entry in self.items():
+                if entry.get("size") is not None:
+                    self._by_size[entry["size"]].add(key)
+        for key in list(self._by_size.get(size, ())):
+            entry = self.get(key)
+            if entry is not None and entry.get("size") == size:
+                yield key, entry
+
+    def keys_with_tag(self, field, values):
+        """Return the keys of the entries whose field (see INDEXED_FIELDS) is one of the case-folded values.
+
+        Like the size index, the tag index is built on first use and kept up to date by
+        __setitem__; keys whose entry was removed or rewritten since are filtered out when read.
+        """
+        if self._by_tag is None:
+            self._by_tag = defaultdict(set)
+            for key, entry in self.items():
+                for term in index_terms(entry["metadata"]):
+                    self._by_tag[term].add(key)
+        keys = set()
+        for value in values:
+            term = (field, value)
+            keys.update(key for key in self._by_tag.get(term, ()) if key in self and term in index_terms(self[key]["metadata"]))
+        return keys
+
+    def entry_stamps(self):
+        """Map every key to the (mtime, version) of its entry."""
+        return {key: (entry["mtime"], entry.get("version")) for key, entry in self.items()}
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._dirty.discard(key)
+        self._deleted.add(key)
+
+    def commit(self):
+        """Merge the changes into the file on disk, written atomically so a crash never truncates it.
+
+        Nothing is written when nothing changed. Entries other processes committed in the meantime
+        are kept, and picked up by this cache as well.
+        """
+        if not self._dirty and not self._deleted:
+            return
+        with file_lock(self.path + ".lock"):
+            current = {}
+            if os.path.exists(self.path):
+                with open(self.path, 'r') as f:
+                    try:
+                        current = json.load(f)
+                    except json.JSONDecodeError:
+                        logging.warning("Cache file is corrupted. Overwriting it.")
+            for key in self._deleted:
+                current.pop(key, None)
+            for key in self._dirty:
+                current[key] = self[key]
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(current, f, default=encode_record)
+            os.replace(tmp_path, self.path)
+        for key, entry in current.items():
+            if key not in self:
+                dict.__setitem__(self, key, entry)
+        self._by_size = None
+        self._by_tag = None
+        self._dirty.clear()
+        self._deleted.clear()
+
+    def close(self):
+        pass
+
+class SQLiteCache(MutableMapping):
+    """Cache backend storing one row per file in SQLite, keyed by path.
+
+    Lookups query a single row, so nothing is loaded up front. Updates are staged in memory and
+    upserted in one transaction by commit(); an interrupted run leaves the previous commit intact.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._pending = {}
+        self._deleted = set()
+        # SQLite locks the store itself; concurrent writers wait for each other up to the timeout.
+        # The store is used by one thread at a time, but not always the one that opened it (async_scan)
+        self._conn = sqlite3.connect(path, timeout=LOCK_TIMEOUT, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS tracks ("
+            "path TEXT PRIMARY KEY, mtime REAL NOT NULL, size INTEGER, inode INTEGER, fingerprint TEXT, "
+            "version INTEGER, metadata TEXT NOT NULL, tag_keys TEXT)"
+        )
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(tracks)")}
+        for column, column_type in (("fingerprint", "TEXT"), ("version", "INTEGER"), ("tag_keys", "TEXT")):
+            if column not in columns:
+                # Stores created before the column was added
+                self._conn.execute(f"ALTER TABLE tracks ADD COLUMN {column} {column_type}")
+        # Secondary index used to find the entry of a renamed or moved file
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tracks_size ON tracks (size)")
+        # Inverted indexes over the metadata, one row per (field, case-folded value, path)
+        has_tags = self._conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'tags'").fetchone()
+        self._conn.execute("CREATE TABLE IF NOT EXISTS tags (field TEXT NOT NULL, value TEXT NOT NULL, path TEXT NOT NULL)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tags_value ON tags (field, value)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS tags_path ON tags (path)")
+        if not has_tags:
+            # Stores created before the indexes existed
+            rows = self._conn.execute("SELECT path, metadata FROM tracks").fetchall()
+            self._conn.executemany(
+                "INSERT INTO tags (field, value, path) VALUES (?, ?, ?)",
+                [(field, value, filepath) for filepath, metadata in rows for field, value in index_terms(json.loads(metadata))]
+            )
+        self._conn.commit()
+
+    @staticmethod
+    def _entry(mtime, size, inode, fingerprint, version, metadata, tag_keys=None):
+        return {"mtime": mtime, "size": size, "inode": inode, "fingerprint": fingerprint, "version": version,
+                "metadata": json.loads(metadata), "tag_keys": json.loads(tag_keys) if tag_keys else None}
+
+    def __getitem__(self, filepath):
+        if filepath in self._pending:
+            return self._pending[filepath]
+        if filepath in self._deleted:
+            raise KeyError(filepath)
+        row = self._conn.execute(
+            "SELECT mtime, size, inode, fingerprint, version, metadata, tag_keys FROM tracks WHERE path = ?", (filepath,)
+        ).fetchone()
+        if row is None:
+            raise KeyError(filepath)
+        return self._entry(*row)
+
+    def __setitem__(self, filepath, entry):
+        self._deleted.discard(filepath)
+        self._pending[filepath] = entry
+
+    def __delitem__(self, filepath):
+        if filepath not in self:
+            raise KeyError(filepath)
+        self._pending.pop(filepath, None)
+        self._deleted.add(filepath)
+
+    def __iter__(self):
+        yield from self._pending
+        for (filepath,) in self._conn.execute("SELECT path FROM tracks"):
+            if filepath not in self._pending and filepath not in self._deleted:
+                yield filepath
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def entries_with_size(self, size):
+        """Yield (key, entry) for every committed entry of the given file size."""
+        rows = self._conn.execute(
+            "SELECT path, mtime, size, inode, fingerprint, version, metadata, tag_keys FROM tracks WHERE size = ?", (size,)
+        ).fetchall()
+        for filepath, *row in rows:
+            if filepath not in self._pending and filepath not in self._deleted:
+                yield filepath, self._entry(*row)
+
+    def keys_with_tag(self, field, values):
+        """Return the keys of the entries whose field (see INDEXED_FIELDS) is one of the case-folded values."""
+        keys = set()
+        for value in values:
+            rows = self._conn.execute("SELECT path FROM tags WHERE field = ? AND value = ?", (field, value))
+            keys.update(filepath for (filepath,) in rows if filepath not in self._pending and filepath not in self._deleted)
+        for filepath, entry in self._pending.items():
+            if any(term_value in values for term_field, term_value in index_terms(entry["metadata"]) if term_field == field):
+                keys.add(filepath)
+        return keys
+
+    def entry_stamps(self):
+        """Map every key to the (mtime, version) of its entry, in one query."""
+        stamps = {
+            filepath: (mtime, version)
+            for filepath, mtime, version in self._conn.execute("SELECT path, mtime, version FROM tracks")
+            if filepath not in self._deleted
+        }
+        for filepath, entry in self._pending.items():
+            stamps[filepath] = (entry["mtime"], entry.get("version"))
+        return stamps
+
+    def commit(self):
+        """Upsert the staged entries, their index rows and deletions in a single transaction."""
+        if not self._pending and not self._deleted:
+            return
+        rows = [
+            (filepath, entry["mtime"], entry.get("size"), entry.get("inode"), entry.get("fingerprint"),
+             entry.get("version"), json.dumps(entry["metadata"], default=encode_record),
+             json.dumps(entry["tag_keys"]) if entry.get("tag_keys") else None)
+            for filepath, entry in self._pending.items()
+        ]
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO tracks (path, mtime, size, inode, fingerprint, version, metadata, tag_keys) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                rows
+            )
+            self._conn.executemany("DELETE FROM tracks WHERE path = ?", [(p,) for p in self._deleted])
+            self._conn.executemany("DELETE FROM tags WHERE path = ?", [(p,) for p in self._deleted | self._pending.keys()])
+            self._conn.executemany(
+                "INSERT INTO tags (field, value, path) VALUES (?, ?, ?)",
+                [(field, value, filepath) for filepath, entry in self._pending.items() for field, value in index_terms(entry["metadata"])]
+            )
+        logging.info("Cache committed: %s updated, %s removed", len(rows), len(self._deleted))
+        self._pending.clear()
+        self._deleted.clear()
+
+    def close(self):
+        self._conn.close()
+
+class ShardedCache(MutableMapping):
+    """Cache split into one store per library root under a cache directory.
+
+    Keys relative to the root (see cache_key) live in the library's own shard, named after the
+    root, so libraries laid out alike and runs on different libraries never touch each other's
+    entries; absolute keys live in a shared default shard. The root of every shard is recorded in
+    LIBRARIES_FILE, so that a library moved elsewhere can take over the entries of its old shard
+    (see entries_with_size). Shards are opened on first use and commit() only writes the shards
+    that changed.
+    """
+
+    def __init__(self, directory, backend="sqlite"):
+        os.makedirs(directory, exist_ok=True)
+        self.path = directory
+        self.backend = backend
+        self.root = None
+        self._shards = {}
+        self._names = {}
+        self._libraries = None
+        # Absolute path -> (shard name, key) of the entries of other shards yielded by entries_with_size
+        self._elsewhere = {}
+
+    def shard_name(self, root):
+        """Name of the shard of a library root: its base name plus a hash of the full path."""
+        if root is None:
+            return DEFAULT_SHARD
+        if root not in self._names:
+            name = re.sub(r'[^A-Za-z0-9_.-]+', '_', os.path.basename(root)) or "root"
+            self._names[root] = f"{name}-{hashlib.sha1(root.encode('utf-8', 'surrogateescape')).hexdigest()[:12]}"
+        return self._names[root]
+
+    def libraries(self):
+        """Map the name of every library shard to its root, as recorded in LIBRARIES_FILE."""
+        if self._libraries is None:
+            self._libraries = self._read_libraries()
+        return self._libraries
+
+    def _read_libraries(self):
+        path = os.path.join(self.path, LIBRARIES_FILE)
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
                 return json.load(f)
-            except json.JSONDecodeError:
-                logging.warning("Cache file is corrupted. Starting with a new cache.")
-                return {}
-    return {}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            logging.warning("Failed to read %s: %s", path, e)
+            return {}
+
+    def _register(self, name, root):
+        """Record the root of a shard in LIBRARIES_FILE, keeping the shards other runs recorded."""
+        path = os.path.join(self.path, LIBRARIES_FILE)
+        with file_lock(path + ".lock"):
+            libraries = self._read_libraries()
+            libraries[name] = root
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(libraries, f, indent=2)
+            os.replace(tmp_path, path)
+        self._libraries = libraries
+
+    def _shard_path(self, name):
+        return os.path.join(self.path, name + (".json" if self.backend == "json" else ".db"))
+
+    def _open(self, name):
+        if name not in self._shards:
+            path = self._shard_path(name)
+            self._shards[name] = JsonCache(path) if self.backend == "json" else SQLiteCache(path)
+        return self._shards[name]
+
+    def shard(self, root):
+        """Open (once) and return the shard of a library root, or the default shard for None."""
+        name = self.shard_name(root)
+        if root is not None and self.libraries().get(name) != root:
+            self._register(name, root)
+        return self._open(name)
+
+    def _shard_for(self, key):
+        if key in self._elsewhere:
+            name, key = self._elsewhere[key]
+            return self._open(name), key
+        return self.shard(None if os.path.isabs(key) else self.root), key
+
+    def __getitem__(self, key):
+        shard, key = self._shard_for(key)
+        return shard[key]
+
+    def __setitem__(self, key, entry):
+        shard, key = self._shard_for(key)
+        shard[key] = entry
+
+    def __delitem__(self, key):
+        shard, key = self._shard_for(key)
+        del shard[key]
+
+    def __iter__(self):
+        for shard in list(self._shards.values()):
+            yield from shard
+
+    def __len__(self):
+        return sum(len(shard) for shard in self._shards.values())
+
+    def entries_with_size(self, size):
+        """Yield (key, entry) for every entry of the given size, from the library's shard first.
+
+        The entries of the other shards follow under their absolute path, so a library that was
+        moved or remounted finds the entries it had at its old root (see find_moved_entry).
+        """
+        current = self.shard_name(self.root)
+        yield from self.shard(self.root).entries_with_size(size)
+        others = [(name, root) for name, root in self.libraries().items() if name != current]
+        if current != DEFAULT_SHARD:
+            others.append((DEFAULT_SHARD, None))
+        for name, root in others:
+            if name not in self._shards and not os.path.exists(self._shard_path(name)):
+                continue
+            for key, entry in self._open(name).entries_with_size(size):
+                if root is not None and not os.path.isabs(key):
+                    path = os.path.join(root, *key.split("/"))
+                    self._elsewhere[path] = (name, key)
+                    key = path
+                yield key, entry
+
+    def keys_with_tag(self, field, values):
+        """Return the keys of the library's entries whose field is one of the case-folded values."""
+        return self.shard(self.root).keys_with_tag(field, values)
+
+    def entry_stamps(self):
+        return self.shard(self.root).entry_stamps()
+
+    def commit(self):
+        for shard in self._shards.values():
+            shard.commit()
+
+    def close(self):
+        for shard in self._shards.values():
+            shard.close()
+        self._shards.clear()
+
+def migrate_json_cache(json_path, cache):
+    """Copy every entry of a legacy JSON cache file into the given cache and commit it."""
+    legacy = JsonCache(json_path)
+    for filepath, entry in legacy.items():
+        cache[filepath] = entry
+    cache.commit()
+    logging.info("Migrated %s entries from %s to %s", len(legacy), json_path, cache.path)
+    return len(legacy)
+
+def load_cache(backend=None):
+    """Open the metadata cache using the configured backend, sharded when CACHE_DIR is set."""
+    backend = backend or CACHE_BACKEND
+    if backend not in ("sqlite", "json"):
+        raise ValueError(f"Unknown cache backend: {backend}")
+    if CACHE_DIR:
+        return ShardedCache(CACHE_DIR, backend)
+    if backend == "json":
+        return JsonCache(JSON_CACHE_FILE)
+
+    is_new = not os.path.exists(CACHE_FILE)
+    cache = SQLiteCache(CACHE_FILE)
+    # One-time migration of the legacy JSON cache when the SQLite store is first created
+    if is_new and os.path.exists(JSON_CACHE_FILE):
+        migrate_json_cache(JSON_CACHE_FILE, cache)
+    return cache
+
+def set_cache_dir(directory):
+    """Use a sharded cache in directory from now on; None goes back to the single cache files."""
+    global CACHE_DIR, _shared_cache
+    if hasattr(_shared_cache, "close"):
+        _shared_cache.close()
+    _shared_cache = None
+    CACHE_DIR = directory
+
+def get_cache(root=None):
+    """Return the process-wide metadata cache, loading it from disk only on first use.
+
+    When root is given and the cache has a store per library (see set_cache_root), entries for
+    files under it are keyed by their path relative to it.
+    """
+    global _shared_cache
+    if _shared_cache is None:
+        with profiling.stage("cache_load"):
+            _shared_cache = load_cache()
+    if root is not None:
+        set_cache_root(_shared_cache, root)
+    return _shared_cache
+
+def set_cache_root(cache, root):
+    """Key the cache's entries relative to the library root, so it survives a move of the library.
+
+    Only a sharded cache is keyed this way, as its library's store holds no other library. The
+    single cache files are shared by every library, where libraries laid out alike would have the
+    same relative keys; they keep absolute keys and follow moves through the fingerprint index.
+    """
+    if isinstance(cache, ShardedCache):
+        cache.root = os.path.abspath(root)
 
 def save_cache(cache):
-    """Save the metadata cache to a JSON file."""
-    with open(CACHE_FILE, 'w') as f:
-        json.dump(cache, f)
-
-def get_file_metadata_from_cache(cache, filepath):
-    """Check if metadata for a file is cached and still valid (based on modification time)."""
-    if filepath in cache:
-        cached_entry = cache[filepath]
-        last_modified_time = os.path.getmtime(filepath)
-        if cached_entry["mtime"] == last_modified_time:
-            return cached_entry["metadata"]
+    """Persist the metadata cache."""
+    with profiling.stage("cache_save"):
+        if hasattr(cache, "commit"):
+            cache.commit()
+            return
+        # Plain dictionaries are written in the legacy JSON format
+        with open(JSON_CACHE_FILE, 'w') as f:
+            json.dump(cache, f, default=encode_record)
+
+def cache_key(cache, filepath):
+    """Key of a file in the cache: its path relative to the cache root when it lies under it."""
+    root = getattr(cache, "root", None)
+    if root:
+        relative = os.path.relpath(filepath, root)
+        if relative != os.pardir and not relative.startswith(os.pardir + os.sep):
+            return relative.replace(os.sep, "/")
+    return filepath
+
+def key_path(cache, key):
+    """Inverse of cache_key: the filesystem path a cache key refers to."""
+    root = getattr(cache, "root", None)
+    if root and not os.path.isabs(key):
+        return os.path.join(root, *key.split("/"))
+    return key
+
+def file_fingerprint(filepath, size):
+    """Cheap content fingerprint: a hash of the file size and its first and last FINGERPRINT_CHUNK bytes."""
+    digest = hashlib.blake2b(str(size).encode(), digest_size=16)
+    with open(filepath, 'rb') as f:
+        digest.update(f.read(FINGERPRINT_CHUNK))
+        if size > FINGERPRINT_CHUNK:
+            f.seek(max(FINGERPRINT_CHUNK, size - FINGERPRINT_CHUNK))
+            digest.update(f.read(FINGERPRINT_CHUNK))
+    return digest.hexdigest()
+
+def safe_fingerprint(filepath, size):
+    """file_fingerprint, or None when the file cannot be read."""
+    try:
+        return file_fingerprint(filepath, size)
+    except OSError:
+        return None
+
+def find_moved_entry(cache, filepath, st):
+    """Find the cached entry of a file that was renamed or moved to filepath.
+
+    Only entries of the same size whose file no longer exists are candidates, so identical files
+    side by side never share an entry. One with the same inode and modification time is the file
+    itself, renamed on the same filesystem. Otherwise the content fingerprint has to match, which
+    also recognizes a library moved to another disk or machine; the file is only hashed when a
+    candidate exists. Returns (key, entry) or None.
+    """
+    if not hasattr(cache, "entries_with_size"):
+        return None
+    candidates = [
+        (key, entry) for key, entry in cache.entries_with_size(st.st_size)
+        if entry.get("version") == METADATA_VERSION and not os.path.exists(key_path(cache, key))
+    ]
+    for key, entry in candidates:
+        if entry.get("inode") == st.st_ino and entry["mtime"] == st.st_mtime:
+            return key, entry
+
+    fingerprint = None
+    for key, entry in candidates:
+        if entry.get("fingerprint"):
+            fingerprint = fingerprint or file_fingerprint(filepath, st.st_size)
+            if entry["fingerprint"] == fingerprint:
+                return key, entry
     return None
 
-def update_file_metadata_in_cache(cache, filepath, metadata):
-    """Update the cache with new metadata for a file."""
-    last_modified_time = os.path.getmtime(filepath)
-    cache[filepath] = {
-        "mtime": last_modified_time,
-        "metadata": metadata
+def get_file_metadata_from_cache(cache, filepath, st=None):
+    """Check if metadata for a file is cached and still valid (based on modification time).
+
+    Pass the file's stat result when the caller already has one to avoid stat'ing it again. A file
+    without an entry of its own reuses the entry it had before being renamed or moved, which is
+    then re-keyed to the new path.
+    """
+    key = cache_key(cache, filepath)
+    cached_entry = cache.get(key)
+    if cached_entry is None and key != filepath:
+        # Entry stored under the absolute path before the cache had a root
+        cached_entry = cache.get(filepath)
+        if cached_entry is not None:
+            del cache[filepath]
+            cache[key] = cached_entry
+    if cached_entry is not None:
+        last_modified_time = st.st_mtime if st is not None else os.path.getmtime(filepath)
+        if cached_entry["mtime"] == last_modified_time and cached_entry.get("version") == METADATA_VERSION:
+            return as_record(cached_entry["metadata"])
+        return None
+
+    if st is None:
+        st = os.stat(filepath)
+    moved = find_moved_entry(cache, filepath, st)
+    if moved is None:
+        return None
+    old_key, entry = moved
+    profiling.count("cache_moved")
+    # A new record: the old one may still be shared with the entry it came from
+    values = list(as_record(entry["metadata"]))
+    values[TRACK_FIELDS.index("filename")] = os.path.basename(filepath)
+    metadata = TrackRecord(*values)
+    logs.per_file(logging.INFO, "Reusing cached metadata of %s for %s", key_path(cache, old_key), filepath)
+    del cache[old_key]
+    cache[key] = {
+        "mtime": st.st_mtime,
+        "size": st.st_size,
+        "inode": st.st_ino,
+        "fingerprint": entry.get("fingerprint"),
+        "version": METADATA_VERSION,
+        "metadata": metadata,
+        "tag_keys": entry.get("tag_keys")
     }
+    return metadata
+
+def get_tag_keys_from_cache(cache, filepath, st):
+    """Return the cached (format, keys) listing of a file's tags, or None when missing or out of date."""
+    cached_entry = cache.get(cache_key(cache, filepath))
+    if cached_entry is None or not cached_entry.get("tag_keys"):
+        return None
+    if cached_entry["mtime"] != st.st_mtime or cached_entry.get("version") != METADATA_VERSION:
+        return None
+    tag_format, keys = cached_entry["tag_keys"]
+    return tag_format, keys
+
+def store_tag_keys_in_cache(cache, filepath, tag_keys):
+    """Add the (format, keys) listing of a file's tags to its existing cache entry."""
+    key = cache_key(cache, filepath)
+    entry = dict(cache[key])
+    entry["tag_keys"] = tag_keys
+    cache[key] = entry
+
+def update_file_metadata_in_cache(cache, filepath, metadata, st=None, fingerprint=None, tag_keys=None):
+    """Update the cache with new metadata for a file.
+
+    The content fingerprint is computed here unless the caller already has it. tag_keys is the
+    (format, keys) listing of the file's tags when list-tags read it.
+    """
+    if st is None:
+        st = os.stat(filepath)
+    if fingerprint is None:
+        fingerprint = safe_fingerprint(filepath, st.st_size)
+    cache[cache_key(cache, filepath)] = {
+        "mtime": st.st_mtime,
+        "size": st.st_size,
+        "inode": st.st_ino,
+        "fingerprint": fingerprint,
+        "version": METADATA_VERSION,
+        "metadata": metadata,
+        "tag_keys": tag_keys
+    }
+
 def clear_cache():
-    """Clear the metadata cache by removing the cache file."""
-    if os.path.exists(CACHE_FILE):
-        os.remove(CACHE_FILE)
-        logging.info(f"Cache cleared: {CACHE_FILE}")
+    """Clear the metadata cache by removing the cache files."""
+    global _shared_cache
+    if hasattr(_shared_cache, "close"):
+        _shared_cache.close()
+    _shared_cache = None
+
+    removed = False
+    paths = [CACHE_FILE, CACHE_FILE + "-wal", CACHE_FILE + "-shm", JSON_CACHE_FILE, JSON_CACHE_FILE + ".lock"]
+    if CACHE_DIR and os.path.isdir(CACHE_DIR):
+        paths += [os.path.join(CACHE_DIR, name) for name in os.listdir(CACHE_DIR)
+                  if name.endswith((".db", ".db-wal", ".db-shm", ".json", ".json.lock"))]
+    for path in paths:
+        if os.path.exists(path):
+            os.remove(path)
+            removed = True
+    if removed:
+        logging.info("Cache cleared: %s", CACHE_DIR or CACHE_FILE)
     else:
-        logging.info("Cache file not found.")
\ No newline at end of file
+        logging.info("Cache file not found.")
@@ -1,5 +1,6 @@
 import argparse
-from rockbox_db_manager import database, scanner, sync, cache, analyzer, comparator, read_binary
+import logging
+from rockbox_db_manager import database, scanner, sync, cache, analyzer, comparator, read_binary, watcher, bench, profiling, async_scan, logs
 
 
 def prompt_if_missing(args):
@@ -21,6 +22,9 @@ def main():
         description="Rockbox Database Manager - A tool to manage your Rockbox music database"
     )
     
+    parser.add_argument("--cache-dir", help="Keep the metadata cache in this directory, one shard per library, safe to share between concurrent runs (default: $ROCKBOX_DB_CACHE_DIR, or metadata_cache.db in the working directory)")
+    parser.add_argument("--log-file", help="Also write the log to this file")
+    parser.add_argument("--log-level", default="INFO", choices=["DEBUG", "INFO", "WARNING", "ERROR"], help="Least severe messages to log (default: INFO)")
     subparsers = parser.add_subparsers(dest="command", help="Commands")
     
     # Command to create/update the database
@@ -32,8 +36,26 @@ def main():
     db_parser.add_argument("--show-songs", action="store_true", help="Display each song found during scanning")    
     db_parser.add_argument("--dry-run", action="store_true", help="Perform a dry run without generating database files")
     db_parser.add_argument("--exclude", nargs='+', help="Exclude specific file types or directories")
-    db_parser.add_argument("--only-artist", help="Filter and generate database only for a specific artist")
-    db_parser.add_argument("--only-album", help="Filter and generate database only for a specific album")
+    db_parser.add_argument("--only-artist", nargs='+', help="Filter and generate database only for these artists or album artists (case-insensitive)")
+    db_parser.add_argument("--only-album", nargs='+', help="Filter and generate database only for these albums (case-insensitive)")
+    db_parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes for metadata extraction (default: 1)")
+    db_parser.add_argument("--async-io", type=int, nargs='?', const=async_scan.ASYNC_CONCURRENCY, default=0, metavar="N", help=f"Overlap directory listings, stats and tag reads with up to N calls in flight, for network or removable storage (default N: {async_scan.ASYNC_CONCURRENCY})")
+    db_parser.add_argument("--incremental", action="store_true", help="Only re-extract changed files and rewrite changed tag files since the previous run")
+    db_parser.add_argument("--offset-tables", action="store_true", help="Write a sidecar offset table next to every tag file for fast lookups")
+    db_parser.add_argument("--profile", metavar="REPORT", help="Write per-stage timings, counters and the slowest files to this JSON file")
+    db_parser.add_argument("--pstats", metavar="FILE", help="Also run under cProfile and dump the statistics to this file")
+
+    # Command to keep the database updated as the music directory changes
+    watch_parser = subparsers.add_parser("watch", help="Keep the database up to date as the music directory changes")
+    watch_parser.add_argument("db_file", help="Path to the output directory for database files")
+    watch_parser.add_argument("music_dir", help="Path to the music directory")
+    watch_parser.add_argument("--config", default="config.json", help="Path to the configuration file for tag mappings")
+    watch_parser.add_argument("--exclude", nargs='+', help="Exclude specific file types or directories")
+    watch_parser.add_argument("--only-artist", nargs='+', help="Filter and generate database only for these artists or album artists (case-insensitive)")
+    watch_parser.add_argument("--only-album", nargs='+', help="Filter and generate database only for these albums (case-insensitive)")
+    watch_parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes for metadata extraction (default: 1)")
+    watch_parser.add_argument("--debounce", type=float, default=watcher.DEBOUNCE_SECONDS, help=f"Seconds without changes before the database is updated (default: {watcher.DEBOUNCE_SECONDS})")
+    watch_parser.add_argument("--poll-interval", type=float, default=watcher.POLL_INTERVAL, help=f"Seconds between library snapshots when watchdog is not installed (default: {watcher.POLL_INTERVAL})")
 
     # Command to scan music directory
     scan_parser = subparsers.add_parser("scan", help="Scan a music directory for audio files")
@@ -48,20 +70,28 @@ def main():
     
     # Command to sync database to Rockbox device
     sync_parser = subparsers.add_parser("sync", help="Sync the database to your Rockbox device")
-    sync_parser.add_argument("source", help="Path to the source database file")
+    sync_parser.add_argument("source", help="Path to the source database file or directory")
     sync_parser.add_argument("destination", help="Path to the Rockbox device directory")
+    sync_parser.add_argument("--jobs", type=int, default=sync.SYNC_THREADS, help=f"Number of parallel copies (default: {sync.SYNC_THREADS})")
     
     # Command to validate the database files
     validate_parser = subparsers.add_parser("validate", help="Validate the generated Rockbox database files")
     validate_parser.add_argument("db_dir", help="Path to the directory containing the generated .tcd files")
+    validate_parser.add_argument("--deep", action="store_true", help="Also check every length prefix, UTF-8 entry and index offset")
+    validate_parser.add_argument("--jobs", type=int, help="Number of worker processes for --deep, one file each (default: one per CPU)")
 
     # Command to list all tags in the music files
     list_tags_parser = subparsers.add_parser("list-tags", help="List all available tags in the music files")
     list_tags_parser.add_argument("music_dir", help="Path to the music directory")
+    list_tags_parser.add_argument("--jobs", type=int, help="Number of worker processes reading tag headers (default: one per CPU)")
+    list_tags_parser.add_argument("--exclude", nargs='+', help="Exclude specific file types or directories")
+    list_tags_parser.add_argument("--output", help="Also write the key counts to this JSON file")
 
     # Command to show stats about the database
     stats_parser = subparsers.add_parser("stats", help="Show statistics about the generated database")
     stats_parser.add_argument("db_dir", help="Path to the directory containing the generated .tcd files")
+    stats_parser.add_argument("--jobs", type=int, help="Number of worker processes, one tag file each (default: one per CPU)")
+    stats_parser.add_argument("--output", help="Also write the statistics to this JSON file")
     
     # Command to analyze an existing database with an option to specify an output file
     analyze_parser = subparsers.add_parser("analyze-db", help="Analyze an existing Rockbox database")
@@ -72,11 +102,29 @@ def main():
     compare_parser = subparsers.add_parser("compare-db", help="Compare two Rockbox databases")
     compare_parser.add_argument("working_db_dir", help="Path to the working Rockbox database directory")
     compare_parser.add_argument("generated_db_dir", help="Path to the generated Rockbox database directory")
+    compare_parser.add_argument("--output", help="Write the JSON report to this file instead of printing it")
+    compare_parser.add_argument("--limit", type=int, default=comparator.DIFF_LIMIT, help=f"Maximum strings listed per change type and file (default: {comparator.DIFF_LIMIT})")
+
+    # Command to benchmark the main stages on a synthetic library
+    bench_parser = subparsers.add_parser("bench", help="Benchmark scanning, writing and reading on a synthetic music library")
+    bench_parser.add_argument("--tracks", type=int, default=bench.BENCH_TRACKS, help=f"Number of tracks in the synthetic library (default: {bench.BENCH_TRACKS})")
+    bench_parser.add_argument("--repeat", type=int, default=bench.BENCH_REPEAT, help=f"Number of runs per stage (default: {bench.BENCH_REPEAT})")
+    bench_parser.add_argument("--jobs", type=int, default=1, help="Number of worker processes for metadata extraction (default: 1)")
+    bench_parser.add_argument("--flac-ratio", type=float, default=0.25, help="Share of FLAC files in the library (default: 0.25)")
+    bench_parser.add_argument("--cover-size", type=int, default=0, help="Size in bytes of the cover art embedded in every file (default: 0, none)")
+    bench_parser.add_argument("--library", help="Generate the library here and reuse it on later runs instead of a temporary directory")
+    bench_parser.add_argument("--config", default="config.json", help="Path to the configuration file for tag mappings")
+    bench_parser.add_argument("--output", help="Write the JSON results to this file instead of printing them")
 
     # Command to read binary .tcd file
     read_binary_parser = subparsers.add_parser("read-binary", help="Read and analyze a binary .tcd file")
     read_binary_parser.add_argument("filepath", help="Path to the .tcd file")
 
+    # Command to look up a string in a .tcd file
+    lookup_parser = subparsers.add_parser("lookup", help="Find a string in a .tcd tag file, ignoring case")
+    lookup_parser.add_argument("filepath", help="Path to the .tcd file")
+    lookup_parser.add_argument("value", help="String to look up")
+
     # Command to clear the metadata cache
     # clear_cache_parser = subparsers.add_parser("clear-cache", help="Clear the metadata cache")
 
@@ -88,31 +136,59 @@ def main():
     if args.command is None:
         parser.print_help()
         return
-    
+
+    logs.setup_logging(getattr(logging, args.log_level), args.log_file)
+    if args.cache_dir:
+        cache.set_cache_dir(args.cache_dir)
+    try:
+        run_command(args)
+    finally:
+        # Counts of the per-file messages held back by the rate limit
+        logs.flush_per_file()
+
+def run_command(args):
+    """Run the command selected on the command line."""
     if args.command == "create-db":
         args = prompt_if_missing(args)
-        database.create_rockbox_database(
+        with profiling.profile_run(args.profile, args.pstats, command="create-db", jobs=args.jobs, incremental=args.incremental):
+            database.create_rockbox_database(
+                args.db_file,
+                args.music_dir,
+                args.config,
+                verbose=args.verbose,
+                show_songs=args.show_songs,
+                dry_run=args.dry_run,
+                exclude=args.exclude,
+                only_artist=args.only_artist,
+                only_album=args.only_album,
+                jobs=args.jobs,
+                incremental=args.incremental,
+                offset_tables=args.offset_tables,
+                async_io=args.async_io
+            )
+    
+    elif args.command == "watch":
+        watcher.watch_library(
             args.db_file,
             args.music_dir,
             args.config,
-            verbose=args.verbose,
-            show_songs=args.show_songs,
-            dry_run=args.dry_run,
             exclude=args.exclude,
             only_artist=args.only_artist,
-            only_album=args.only_album
+            only_album=args.only_album,
+            jobs=args.jobs,
+            debounce=args.debounce,
+            poll_interval=args.poll_interval
         )
-    
     elif args.command == "scan":
         scanner.scan_music_directory(args.directory)
     elif args.command == "sync":
-        sync.sync_database(args.source, args.destination)
+        sync.sync_database(args.source, args.destination, jobs=args.jobs)
     elif args.command == "validate":
-        database.validate_database(args.db_dir)
+        database.validate_database(args.db_dir, deep=args.deep, jobs=args.jobs)
     elif args.command == "list-tags":
-        database.list_tags(args.music_dir)
+        database.list_tags(args.music_dir, jobs=args.jobs, exclude=args.exclude, output_file=args.output)
     elif args.command == "stats":
-        database.show_stats(args.db_dir)
+        database.show_stats(args.db_dir, jobs=args.jobs, output_file=args.output)
     elif args.command == "clear-cache":
         cache.clear_cache() 
     elif args.command == "list-supported-formats":
@@ -120,7 +196,20 @@ def main():
     elif args.command == "analyze-db":
         analyzer.analyze_database(args.db_dir, args.output_file)  # Call the analyzer with the output file
     elif args.command == "compare-db":
-        comparator.compare_databases(args.working_db_dir, args.generated_db_dir)
+        comparator.compare_databases(args.working_db_dir, args.generated_db_dir, output_file=args.output, limit=args.limit)
+    elif args.command == "bench":
+        bench.run_bench_command(
+            output_file=args.output,
+            tracks=args.tracks,
+            repeat=args.repeat,
+            jobs=args.jobs,
+            flac_ratio=args.flac_ratio,
+            cover_size=args.cover_size,
+            library_dir=args.library,
+            config_file=args.config
+        )
     elif args.command == "read-binary":
         read_binary.read_binary_tcd_file(args.filepath)
+    elif args.command == "lookup":
+        read_binary.lookup(args.filepath, args.value)
     
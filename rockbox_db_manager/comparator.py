@@ -1,18 +1,147 @@
 import os
+import json
+import zlib
+import struct
 import filecmp
+import logging
+import tempfile
+import unicodedata
+from collections import Counter, defaultdict
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError
+from rockbox_db_manager.tcd_writer import INDEX_FILE
 
-def compare_databases(working_db_dir, generated_db_dir):
-    """Compare files in the working and generated Rockbox databases."""
-    for tcd_file in os.listdir(working_db_dir):
+# Files larger than this are hash-partitioned to disk before diffing, so memory stays bounded
+PARTITION_THRESHOLD = 8 << 20
+# Target size of one partition; both sides of a partition are held in memory at once
+PARTITION_SIZE = 4 << 20
+# Maximum number of added/removed/changed strings listed per file (the counts are always complete)
+DIFF_LIMIT = 100
+
+_pack_length = struct.Struct('<I').pack
+
+def normalize_entry(entry):
+    """Key under which two spellings of the same string are considered a change rather than add + remove."""
+    return " ".join(unicodedata.normalize('NFC', entry).casefold().split())
+
+def is_string_table(name):
+    """Tag files hold length-prefixed strings; the master index and other files are only compared byte-wise."""
+    return name.endswith(".tcd") and name != INDEX_FILE
+
+def iter_strings(path):
+    """Yield the decoded entries of a .tcd file."""
+    with TcdReader(path) as reader:
+        for _, _, entry in reader.iter_strings(errors='replace'):
+            yield entry
+
+def partition_file(path, partition_dir, side, partitions):
+    """Spread a file's entries over partition files by the hash of their normalized form."""
+    paths = [os.path.join(partition_dir, f"{side}_{i}.tcd") for i in range(partitions)]
+    handles = [open(p, 'wb', buffering=1 << 16) for p in paths]
+    try:
+        for entry in iter_strings(path):
+            encoded = entry.encode('utf-8')
+            key = zlib.crc32(normalize_entry(entry).encode('utf-8')) % partitions
+            handles[key].write(_pack_length(len(encoded)) + encoded)
+    finally:
+        for handle in handles:
+            handle.close()
+    return paths
+
+def diff_entries(working_entries, generated_entries):
+    """Diff two streams of entries as multisets.
+
+    Returns the removed and added entries, with removed/added pairs that only differ in case,
+    whitespace or Unicode normalization reported as changed instead.
+    """
+    working = Counter(working_entries)
+    generated = Counter(generated_entries)
+    removed = working - generated
+    added = generated - working
+
+    removed_by_key = defaultdict(list)
+    for entry in sorted(removed.elements()):
+        removed_by_key[normalize_entry(entry)].append(entry)
+
+    changed = []
+    still_added = []
+    for entry in sorted(added.elements()):
+        candidates = removed_by_key.get(normalize_entry(entry))
+        if candidates:
+            changed.append({"working": candidates.pop(0), "generated": entry})
+        else:
+            still_added.append(entry)
+    still_removed = [entry for entries in removed_by_key.values() for entry in entries]
+    return still_removed, still_added, changed
+
+def diff_tag_file(working_file, generated_file, limit=DIFF_LIMIT):
+    """Entry-level diff of two tag files, streaming them and hash-partitioning large ones."""
+    result = {"status": "differs", "added": [], "removed": [], "changed": [],
+              "added_count": 0, "removed_count": 0, "changed_count": 0}
+
+    def collect(removed, added, changed):
+        for key, values in (("removed", removed), ("added", added), ("changed", changed)):
+            result[f"{key}_count"] += len(values)
+            result[key].extend(values[:max(0, limit - len(result[key]))])
+
+    largest = max(os.path.getsize(working_file), os.path.getsize(generated_file))
+    if largest <= PARTITION_THRESHOLD:
+        collect(*diff_entries(iter_strings(working_file), iter_strings(generated_file)))
+    else:
+        partitions = largest // PARTITION_SIZE + 1
+        with tempfile.TemporaryDirectory() as partition_dir:
+            working_parts = partition_file(working_file, partition_dir, "working", partitions)
+            generated_parts = partition_file(generated_file, partition_dir, "generated", partitions)
+            for working_part, generated_part in zip(working_parts, generated_parts):
+                collect(*diff_entries(iter_strings(working_part), iter_strings(generated_part)))
+
+    if not (result["added_count"] or result["removed_count"] or result["changed_count"]):
+        # Same strings, only the order differs
+        result["status"] = "reordered"
+    return result
+
+def compare_databases(working_db_dir, generated_db_dir, output_file=None, limit=DIFF_LIMIT):
+    """Compare files in the working and generated Rockbox databases.
+
+    Identical files are detected with a byte comparison first. Tag files that differ get an
+    entry-level diff listing added, removed and changed strings. The report is printed as JSON,
+    or written to output_file, and returned.
+    """
+    report = {"working_db_dir": working_db_dir, "generated_db_dir": generated_db_dir, "files": {}}
+    working_names = set(os.listdir(working_db_dir))
+    generated_names = set(os.listdir(generated_db_dir))
+
+    for tcd_file in sorted(working_names | generated_names):
         working_file = os.path.join(working_db_dir, tcd_file)
         generated_file = os.path.join(generated_db_dir, tcd_file)
 
-        if not os.path.exists(generated_file):
-            print(f"Missing generated file: {tcd_file}")
+        if tcd_file not in generated_names:
+            report["files"][tcd_file] = {"status": "missing_generated"}
+            continue
+        if tcd_file not in working_names:
+            report["files"][tcd_file] = {"status": "missing_working"}
+            continue
+        if not (os.path.isfile(working_file) and os.path.isfile(generated_file)):
             continue
 
-        # Compare the contents of the files
-        if filecmp.cmp(working_file, generated_file, shallow=False):
-            print(f"{tcd_file} is identical.")
+        entry = {"working_size": os.path.getsize(working_file), "generated_size": os.path.getsize(generated_file)}
+        # Short-circuit: identical files need no parsing
+        if entry["working_size"] == entry["generated_size"] and filecmp.cmp(working_file, generated_file, shallow=False):
+            entry["status"] = "identical"
+        elif is_string_table(tcd_file):
+            try:
+                entry.update(diff_tag_file(working_file, generated_file, limit))
+            except (OSError, TcdFormatError) as e:
+                logging.error("Failed to diff %s: %s", tcd_file, e)
+                entry.update({"status": "error", "error": str(e)})
         else:
-            print(f"{tcd_file} differs between the working and generated databases.")
+            entry["status"] = "differs"
+        report["files"][tcd_file] = entry
+        logging.info("%s: %s", tcd_file, entry['status'])
+
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as out:
+            json.dump(report, out, indent=2, ensure_ascii=False)
+        logging.info("Comparison report written to %s", output_file)
+    else:
+        print(json.dumps(report, indent=2, ensure_ascii=False))
+    return report
@@ -6,13 +6,13 @@ def load_config(config_file):
     try:
         with open(config_file, 'r') as f:
             config = json.load(f)
-            logging.info(f"Loaded config: {config_file}")
+            logging.info("Loaded config: %s", config_file)
             return config
     except FileNotFoundError:
-        logging.error(f"Config file not found: {config_file}")
+        logging.error("Config file not found: %s", config_file)
         return {}
     except json.JSONDecodeError as e:
-        logging.error(f"Error parsing config file {config_file}: {e}")
+        logging.error("Error parsing config file %s: %s", config_file, e)
         return {}
 
 def get_mapping(config, tag):
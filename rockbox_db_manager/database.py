@@ -1,208 +1,440 @@
 import logging
 import os
+from array import array
+from collections import Counter, defaultdict
+from itertools import islice
 from tqdm import tqdm
+import json
 import struct
-from rockbox_db_manager import metadata, scanner
+import hashlib
+from rockbox_db_manager import metadata, scanner, profiling, async_scan, stats, tags, validator, logs
 from rockbox_db_manager.config import load_config, get_mapping, get_default_value
-from rockbox_db_manager.cache import save_cache, load_cache
-
-# Set up logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler("rockbox_db_manager.log"),
-        logging.StreamHandler()
-    ]
-)
-def validate_database(db_dir):
-    """Validate the generated .tcd files."""
-    required_files = [f"database_{i}.tcd" for i in range(9)] + ["database_idx.tcd"]
+from rockbox_db_manager.cache import save_cache, get_cache
+from rockbox_db_manager.tcd_writer import AtomicTcdWriter, entry_offsets, write_tcd_entries, write_offset_table, collation_key, ENTRY_BATCH_SIZE, OFFSET_TABLE_SUFFIX, TAG_FILES, INDEX_FILE
+from rockbox_db_manager.manifest import load_manifest, save_manifest, remove_manifest, snapshot_listing, diff_listing, options_digest, tag_digest, MANIFEST_VERSION
+
+def validate_database(db_dir, deep=False, jobs=None):
+    """Validate the generated .tcd files.
+
+    With deep, the structure of every file is checked as well (see validator.deep_validate) and
+    the first bad offset of each file is reported.
+    """
+    required_files = list(TAG_FILES.values()) + [INDEX_FILE]
     missing_files = [f for f in required_files if not os.path.exists(os.path.join(db_dir, f))]
     
     if missing_files:
-        logging.error(f"Missing files: {missing_files}")
-        return False
-    logging.info("All required files are present.")
-    return True
-
-def list_tags(music_dir):
-    """List all available tags in the music files."""
-    music_files = scanner.scan_music_directory(music_dir)
-    tags = set()
-    
-    for file in music_files:
-        try:
-            _, artists, album, genre, _, composer, comment, albumartist, grouping = metadata.extract_full_metadata(file)
-            tags.update(["artist", "album", "genre", "composer", "comment", "albumartist", "grouping"])
-        except Exception as e:
-            logging.error(f"Failed to process file {file}: {e}")
-    
-    logging.info(f"Available tags: {', '.join(tags)}")
+        logging.error("Missing files: %s", missing_files)
+        if not deep:
+            return False
+    else:
+        logging.info("All required files are present.")
+    if not deep:
+        return True
+
+    results = validator.deep_validate(db_dir, jobs=jobs)
+    for file, result in results.items():
+        if file in missing_files:
+            continue
+        if result["error"]:
+            logging.error("%s: first bad offset %s: %s", file, result['bad_offset'], result['error'])
+        elif result["skipped"]:
+            logging.info("%s: unchanged since the last validation", file)
+        else:
+            logging.info("%s: OK, %s %s", file, result['entries'], 'tracks' if file == INDEX_FILE else 'entries')
+    valid = not missing_files and all(result["error"] is None for result in results.values())
+    logging.info("Database is valid." if valid else "Database is invalid.")
+    return valid
+
+def list_tags(music_dir, jobs=None, exclude=None, output_file=None):
+    """List the tag keys present in the music files, with how many files use each.
+
+    Files are streamed through a pool of worker processes that only read the tag headers (see
+    metadata.iter_tag_keys); listings are cached with the metadata, so unchanged files are not
+    opened again. Keys are counted per tag format, along with the number of files of every
+    format and extension. With output_file, the counts are also written there as JSON.
+    Returns the counts.
+    """
+    directory = scanner.resolve_music_directory(music_dir)
+    if directory is None:
+        return None
+    cache = get_cache(root=directory)
+    jobs = jobs or os.cpu_count() or 1
+    formats = Counter()
+    extensions = Counter()
+    keys = defaultdict(Counter)
+
+    files = profiling.timed_iter("walk", scanner.iter_music_entries(directory, exclude))
+    for file, tag_format, file_keys in tqdm(metadata.iter_tag_keys(files, cache, jobs=jobs), desc="Reading tags"):
+        formats[tag_format] += 1
+        extensions[os.path.splitext(file)[1].lower()] += 1
+        keys[tag_format].update(file_keys)
+    save_cache(cache)
+
+    logging.info("Files by extension: %s", ', '.join(f'{ext} {count}' for ext, count in extensions.most_common()))
+    for tag_format, files_count in formats.most_common():
+        logging.info("%s: %s files", tag_format, files_count)
+        for key, count in keys[tag_format].most_common():
+            field = tags.mapped_field(key)
+            mapped = f" (read as {field})" if field else ""
+            logging.info("  %s: %s files (%.0f%%)%s", key, count, 100 * count / files_count, mapped)
+
+    report = {
+        "extensions": dict(extensions.most_common()),
+        "formats": {tag_format: {"files": files_count, "keys": dict(keys[tag_format].most_common())}
+                    for tag_format, files_count in formats.most_common()},
+    }
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
+
+def show_stats(db_dir, jobs=None, output_file=None):
+    """Show statistics about the generated database.
+
+    Every tag file is streamed once, in parallel across files (see stats.database_stats). With
+    output_file, the full statistics are also written there as JSON. Returns the statistics.
+    """
+    report = stats.database_stats(db_dir, jobs=jobs)
 
-def show_stats(db_dir):
-    """Show statistics about the generated database."""
-    stats = {}
-    
-    for i in range(9):
-        filepath = os.path.join(db_dir, f"database_{i}.tcd")
-        if os.path.exists(filepath):
-            with open(filepath, 'rb') as f:
-                content = f.read()
-                stats[f"database_{i}.tcd"] = len(content)
-    
-    stats["database_idx.tcd"] = os.path.getsize(os.path.join(db_dir, "database_idx.tcd"))
-    
     logging.info("Database Stats:")
-    for file, size in stats.items():
-        logging.info(f"{file}: {size} bytes")
-# Helper functions for writing binary data
-def write_int(f, value):
-    """Write an integer in little-endian format."""
-    f.write(struct.pack('<I', value))
-
-def write_string(f, value):
-    """Write a string as a length-prefixed byte array."""
-    if not isinstance(value, str):
-        value = str(value)  # Ensure it's a string
-    encoded = value.encode('utf-8')
-    write_int(f, len(encoded))
-    f.write(encoded)
+    for file, file_stats in report["files"].items():
+        if file_stats["error"]:
+            logging.warning("Failed to parse %s: %s", file, file_stats['error'])
+        distinct = file_stats["distinct"] if file_stats["distinct_exact"] else f"~{file_stats['distinct']}"
+        unknown = f"{file_stats['unknown_entries']} Unknown defaults"
+        if "unknown_tracks" in file_stats:
+            unknown += f" used by {file_stats['unknown_tracks']} tracks"
+        logging.info("%s: %s bytes, %s entries, %s distinct, %s bytes of strings (average %.1f), %s",
+                     file, file_stats['size'], file_stats['entries'], distinct, file_stats['total_length'],
+                     file_stats['average_length'], unknown)
+        for length, entry in file_stats["longest"]:
+            logging.info("  longest (%s bytes): %s", length, entry)
+
+    index = report["index"]
+    if index["error"]:
+        logging.warning("%s: %s", INDEX_FILE, index['error'])
+    if index["tracks"] is not None:
+        logging.info("%s: %s tracks", INDEX_FILE, index['tracks'])
+
+    if output_file:
+        with open(output_file, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2, ensure_ascii=False)
+    return report
 
 def clean_metadata(metadata_value, default_value):
     """Clean the metadata value and return either a valid value or a default."""
     return metadata_value.strip() if metadata_value and metadata_value.strip() else default_value
 
 def create_tag_file(tag_file, tag_data):
-    """Creates a tag-specific .tcd file with the provided metadata."""
-    logging.info(f"Creating tag file: {tag_file}")
+    """Creates a tag-specific .tcd file with the provided metadata.
+
+    Entries are packed and flushed in large batches, and the file is replaced atomically.
+    Returns the byte offset of every entry, in the order the entries were written.
+    """
+    logging.info("Creating tag file: %s", tag_file)
     try:
-        with open(tag_file, 'wb') as f:
-            for entry in tag_data:
-                write_string(f, entry)
+        return write_tcd_entries(tag_file, tag_data)
     except Exception as e:
-        logging.error(f"Failed to create tag file {tag_file}: {e}")
+        logging.error("Failed to create tag file %s: %s", tag_file, e)
+        return array('I')
 
-from tqdm import tqdm
+class TagData:
+    """Distinct strings of every tag plus the link from each track to its strings.
 
-def create_rockbox_tagcache(output_dir, music_files, config_file, verbose=False):
-    """Generates Rockbox .tcd files for all tags based on music files metadata and configurable mappings."""
-    # Initialize the cache
-    cache = load_cache()
+    Each tag keeps its strings in first-seen order, mapped to a sequential id, and an array with the
+    id of every track's string. The arrays are what lets the master index point each track at its
+    entries once the tag files have been written in sorted order.
+    """
 
-    config = load_config(config_file)
-    
+    def __init__(self):
+        self.strings = {tag: {} for tag in TAG_FILES}
+        self.tracks = {tag: array('I') for tag in TAG_FILES}
+        self.track_count = 0
+
+    def __getitem__(self, tag):
+        # Iterating a tag yields its distinct strings in id order
+        return self.strings[tag]
+
+    def add_track(self, values):
+        """Register one track. values maps each tag to its strings; the index points at the first one."""
+        for tag, tag_values in values.items():
+            ids = self.strings[tag]
+            track_ids = [ids.setdefault(value, len(ids)) for value in tag_values]
+            self.tracks[tag].append(track_ids[0])
+        self.track_count += 1
+
+    def sorted_entries(self, tag):
+        """Return a tag's strings in tag file order (see collation_key) and the id of each one."""
+        ids = self.strings[tag]
+        entries = sorted(ids, key=collation_key)
+        return entries, array('I', [ids[entry] for entry in entries])
+
+def offsets_by_id(file_offsets, ids):
+    """Reorder the offsets of a sorted tag file's entries so they are indexed by string id."""
+    by_id = array('I', bytes(4 * len(ids)))
+    for string_id, offset in zip(ids, file_offsets):
+        by_id[string_id] = offset
+    return by_id
+
+def update_offset_table(tag_file, file_offsets, offset_tables):
+    """Write the sidecar offset table of a tag file, or remove a sidecar that would be stale."""
+    if offset_tables:
+        write_offset_table(tag_file, file_offsets, os.path.getsize(tag_file))
+    elif os.path.exists(tag_file + OFFSET_TABLE_SUFFIX):
+        os.remove(tag_file + OFFSET_TABLE_SUFFIX)
+
+def add_track_tags(tag_data, file_metadata, config):
+    """Clean a single TrackRecord's metadata and add its values to the tag data."""
+    # Clean metadata before processing
+    title = clean_metadata(file_metadata.title, get_default_value(config, 'title'))
+    album = clean_metadata(file_metadata.album, get_default_value(config, 'album'))
+    filename = clean_metadata(file_metadata.filename, file_metadata.filename)  # filename should not default
+    composer = clean_metadata(file_metadata.composer, get_default_value(config, 'composer'))
+    comment = clean_metadata(file_metadata.comment, get_default_value(config, 'comment'))
+    albumartist = clean_metadata(file_metadata.albumartist, get_default_value(config, 'albumartist'))
+    grouping = clean_metadata(file_metadata.grouping, title)  # If grouping is missing, use the title
+
+    # Use configurable mappings
+    title = grouping if get_mapping(config, 'grouping') == 'title' else title
+
+    # Write each artist separately, clean each artist string
+    artists = [clean_metadata(artist, get_default_value(config, 'artist')) for artist in file_metadata.artists]
+
+    tag_data.add_track({
+        'artist': artists or [get_default_value(config, 'artist')],
+        'album': [album],
+        'genre': [clean_metadata(file_metadata.genre, "Unknown Genre")],
+        'title': [title],
+        'filename': [filename],
+        'composer': [composer],
+        'comment': [comment],
+        'albumartist': [albumartist],
+        'grouping': [grouping]
+    })
+
+def build_tag_data(tracks, config, verbose=False):
+    """Aggregate a stream of (path, metadata) pairs into TagData.
+
+    Returns the tag data and the number of tracks that were aggregated.
+    """
+    tag_data = TagData()
+
+    # Stages are inclusive: "build_tag_data" contains the "scan" feeding it (walk, cache and parsing)
+    tracks = profiling.timed_iter("scan", tracks)
+
+    # Add progress bar for large libraries
+    with profiling.stage("build_tag_data"):
+        for file, file_metadata in tqdm(tracks, desc="Processing files"):
+            try:
+                if verbose:
+                    logs.per_file(logging.INFO, "Processing file: %s", file)
+                add_track_tags(tag_data, file_metadata, config)
+            except Exception as e:
+                logs.per_file(logging.ERROR, "Failed to process file %s: %s", file, e)
+
+    profiling.count("tracks", tag_data.track_count)
+    return tag_data, tag_data.track_count
+
+def write_tag_files(output_dir, tag_data, previous_digests=None, offset_tables=False):
+    """Write every tag's data to its .tcd file in the output directory.
+
+    Entries are written sorted by collation_key, so the files are the same from run to run and can
+    be binary searched; with offset_tables, a sidecar listing the offset of every entry is written
+    next to each file for that purpose.
+
+    Returns the byte offsets of every tag's entries (indexed by string id) for the master index.
+    When previous_digests is given (incremental mode), tag files whose content is unchanged since
+    the previous run are left untouched; the digest of every tag file and the names of the files
+    that were rewritten are returned as well. Raises OSError when a tag file cannot be written.
+    """
     if not os.path.exists(output_dir):
         os.makedirs(output_dir)
 
-    logging.info(f"Generating tagcache files in: {output_dir}")
-
-    # Paths for tag files
-    tag_files = {
-        'artist': os.path.join(output_dir, 'database_0.tcd'),
-        'album': os.path.join(output_dir, 'database_1.tcd'),
-        'genre': os.path.join(output_dir, 'database_2.tcd'),
-        'title': os.path.join(output_dir, 'database_3.tcd'),
-        'filename': os.path.join(output_dir, 'database_4.tcd'),
-        'composer': os.path.join(output_dir, 'database_5.tcd'),
-        'comment': os.path.join(output_dir, 'database_6.tcd'),
-        'albumartist': os.path.join(output_dir, 'database_7.tcd'),
-        'grouping': os.path.join(output_dir, 'database_8.tcd')
-    }
-    
-    # Initialize tag data storage
-    tag_data = {key: set() for key in tag_files}  # Use sets to avoid duplicate entries
-    
-    # Add progress bar for large libraries
-    for file in tqdm(music_files, desc="Processing files"):
-        try:
-            title, artists, album, genre, filename, composer, comment, albumartist, grouping = metadata.extract_full_metadata(file, cache, verbose=verbose)
-            
-            if verbose:
-                logging.info(f"Processing file: {file}")
-            
-            # Clean metadata before processing
-            title = clean_metadata(title, get_default_value(config, 'title'))
-            album = clean_metadata(album, get_default_value(config, 'album'))
-            filename = clean_metadata(filename, filename)  # filename should not default
-            composer = clean_metadata(composer, get_default_value(config, 'composer'))
-            comment = clean_metadata(comment, get_default_value(config, 'comment'))
-            albumartist = clean_metadata(albumartist, get_default_value(config, 'albumartist'))
-            grouping = clean_metadata(grouping, title)  # If grouping is missing, use the title
-            
-            # Use configurable mappings
-            title = grouping if get_mapping(config, 'grouping') == 'title' else title
-            
-            # Write each artist separately, clean each artist string
-            for artist in artists:
-                cleaned_artist = clean_metadata(artist, get_default_value(config, 'artist'))
-                tag_data['artist'].add(cleaned_artist)
-            
-            tag_data['album'].add(album)
-            tag_data['genre'].add(clean_metadata(genre, "Unknown Genre"))
-            tag_data['title'].add(title)
-            tag_data['filename'].add(filename)
-            tag_data['composer'].add(composer)
-            tag_data['comment'].add(comment)
-            tag_data['albumartist'].add(albumartist)
-            tag_data['grouping'].add(grouping)
-        
-        except Exception as e:
-            logging.error(f"Failed to process file {file}: {e}")
+    logging.info("Generating tagcache files in: %s", output_dir)
 
-    # Write data to individual tag files
-    for tag, filepath in tag_files.items():
-        create_tag_file(filepath, tag_data[tag])
+    # Write data to individual tag files, one at a time
+    offsets = {}
+    digests = {}
+    written = []
+    with profiling.stage("write_tags"):
+        for tag, filename in TAG_FILES.items():
+            tag_file = os.path.join(output_dir, filename)
+            entries, ids = tag_data.sorted_entries(tag)
+            if previous_digests is not None:
+                digests[filename] = tag_digest(entries)
+                if previous_digests.get(filename) == digests[filename] and os.path.exists(tag_file):
+                    logging.info("Tag file unchanged, skipping: %s", tag_file)
+                    file_offsets = entry_offsets(entries)
+                    if offset_tables and not os.path.exists(tag_file + OFFSET_TABLE_SUFFIX):
+                        update_offset_table(tag_file, file_offsets, offset_tables)
+                    offsets[tag] = offsets_by_id(file_offsets, ids)
+                    continue
+            file_offsets = create_tag_file(tag_file, entries)
+            if len(file_offsets) != len(entries):
+                # The previous file was kept: no index may point into it, and no manifest may claim it is new
+                raise OSError(f"Failed to write {tag_file}; the database was not updated")
+            update_offset_table(tag_file, file_offsets, offset_tables)
+            offsets[tag] = offsets_by_id(file_offsets, ids)
+            written.append(filename)
+
+    logging.info("Tagcache files generated in %s", output_dir)
+    return offsets, digests, written
+
+def create_rockbox_tagcache(output_dir, music_files, config_file, verbose=False, jobs=1):
+    """Generates Rockbox .tcd files for all tags based on music files metadata and configurable mappings."""
+    # Initialize the cache
+    cache = get_cache()
+
+    config = load_config(config_file)
+
+    tracks = metadata.iter_file_metadata(music_files, cache, jobs=jobs, verbose=verbose)
+    tag_data, track_count = build_tag_data(tracks, config, verbose=verbose)
+    offsets, _, _ = write_tag_files(output_dir, tag_data)
+    create_master_index_file(output_dir, tag_data, offsets)
 
     # Save the updated cache after processing
     save_cache(cache)
+    return track_count
+
+def iter_index_rows(tag_data, offsets):
+    """Yield the packed master index row of every track: the seek offset of its entry in each tag file."""
+    row = struct.Struct(f'<{len(TAG_FILES)}I')
+    columns = [(tag_data.tracks[tag], offsets[tag]) for tag in TAG_FILES]
+    for track in range(tag_data.track_count):
+        yield row.pack(*[tag_offsets[track_ids[track]] for track_ids, tag_offsets in columns])
+
+def index_digest(tag_data, offsets):
+    """Digest of the master index content, used to skip rewriting an unchanged index."""
+    digest = hashlib.sha1(struct.pack('<I', tag_data.track_count))
+    for row in iter_index_rows(tag_data, offsets):
+        digest.update(row)
+    return digest.hexdigest()
 
-    logging.info(f"Tagcache files generated in {output_dir}")
+def create_master_index_file(output_dir, tag_data, offsets):
+    """Creates the master index file (database_idx.tcd) for all tracks.
 
-def create_master_index_file(output_dir, num_entries):
-    """Creates the master index file (database_idx.tcd) for all tracks."""
-    index_file = os.path.join(output_dir, 'database_idx.tcd')
+    Layout: the number of tracks, then for every track one little-endian 32-bit seek offset per tag
+    file, in TAG_FILES order, pointing at the start of the track's entry in that file. Rows are
+    streamed to disk one track at a time.
+    """
+    index_file = os.path.join(output_dir, INDEX_FILE)
     
-    logging.info(f"Creating master index file: {index_file}")
+    logging.info("Creating master index file: %s", index_file)
     
     try:
-        with open(index_file, 'wb') as f:
+        with profiling.stage("write_index"), AtomicTcdWriter(index_file) as f:
             # Write the number of entries
-            write_int(f, num_entries)
+            f.write(struct.pack('<I', tag_data.track_count))
             
-            # Placeholder: Write index data for each entry (custom format)
-            for i in range(num_entries):
-                write_int(f, i)  # Placeholder for real index data
-        logging.info(f"Master index file created successfully: {index_file}")
+            # Write the seek offsets of each track, a batch of rows at a time
+            rows = iter_index_rows(tag_data, offsets)
+            while True:
+                chunk = b''.join(islice(rows, ENTRY_BATCH_SIZE))
+                if not chunk:
+                    break
+                f.write(chunk)
+        logging.info("Master index file created successfully: %s", index_file)
     except Exception as e:
-        logging.error(f"Failed to create master index file: {e}")
+        logging.error("Failed to create master index file: %s", e)
+
+def write_changed_database_files(output_dir, tag_data, previous_digests, offset_tables=False):
+    """Write the tag files and master index, skipping the files whose content is unchanged.
+
+    Returns the digest of every database file and the names of the files that were rewritten.
+    """
+    offsets, digests, written = write_tag_files(output_dir, tag_data, previous_digests, offset_tables)
+    digests[INDEX_FILE] = index_digest(tag_data, offsets)
+    if previous_digests.get(INDEX_FILE) != digests[INDEX_FILE] or not database_files_exist(output_dir):
+        create_master_index_file(output_dir, tag_data, offsets)
+        written.append(INDEX_FILE)
+    return digests, written
+
+def database_files_exist(output_dir, offset_tables=False):
+    """Check that every tag file and the master index, and optionally their offset tables, are present."""
+    required_files = list(TAG_FILES.values()) + [INDEX_FILE]
+    if offset_tables:
+        required_files += [filename + OFFSET_TABLE_SUFFIX for filename in TAG_FILES.values()]
+    return all(os.path.exists(os.path.join(output_dir, f)) for f in required_files)
+
+def create_rockbox_database(output_dir, music_dir, config_file, verbose=False, show_songs=False, dry_run=False, exclude=None, only_artist=None, only_album=None, jobs=1, incremental=False, offset_tables=False, async_io=0):
+    """Main function to create Rockbox database files.
 
-def create_rockbox_database(output_dir, music_dir, config_file, verbose=False, show_songs=False, dry_run=False, exclude=None, only_artist=None, only_album=None):
-    """Main function to create Rockbox database files."""
+    In incremental mode the directory listing is compared with the manifest of the previous run:
+    nothing is parsed or written when the library and options are unchanged, and only tag files
+    whose content changed are rewritten otherwise. With offset_tables, a sidecar offset table is
+    kept next to every tag file for lookups. With async_io, the library is read through the
+    asyncio path with up to that many filesystem calls in flight, for network mounts.
+    """
     
-    logging.info(f"Starting database generation for music directory: {music_dir}")
+    logging.info("Starting database generation for music directory: %s", music_dir)
     
     try:
-        music_files = scanner.scan_music_directory(music_dir, show_songs=show_songs, exclude=exclude, only_artist=only_artist, only_album=only_album)
-        
-        if not music_files:
-            logging.error(f"No supported audio files found in the directory: {music_dir}. Please check the directory or use the --exclude option if needed.")
+        music_dir = scanner.resolve_music_directory(music_dir)
+        if music_dir is None:
             return
-        
+
+        music_files = None
+        if incremental:
+            with profiling.stage("walk"):
+                entries = list(scanner.iter_music_entries(music_dir, exclude))
+            listing = snapshot_listing(entries)
+            previous = load_manifest(output_dir)
+            options = options_digest(config_file, exclude, only_artist, only_album)
+            added, removed, changed = diff_listing(previous["files"], listing)
+            logging.info("Incremental update: %s added, %s removed, %s changed", len(added), len(removed), len(changed))
+
+            if not dry_run and not (added or removed or changed) and previous["options"] == options and database_files_exist(output_dir, offset_tables):
+                logging.info("Library unchanged since the last run. Nothing to rewrite.")
+                return
+            music_files = entries
+
+        # Single pass: each file is walked, parsed, filtered and aggregated once
+        cache = get_cache(root=music_dir)
+        if async_io:
+            tracks = async_scan.iter_tracks(music_dir, cache, show_songs=show_songs, exclude=exclude, only_artist=only_artist, only_album=only_album, verbose=verbose, files=music_files, concurrency=async_io)
+        else:
+            tracks = scanner.iter_tracks(music_dir, cache, show_songs=show_songs, exclude=exclude, only_artist=only_artist, only_album=only_album, verbose=verbose, jobs=jobs, files=music_files)
+
         if dry_run:
             print(f"Dry run: Files to be processed:")
-            for file in music_files:
+            track_count = 0
+            for file, _ in tracks:
                 print(file)
+                track_count += 1
+            save_cache(cache)
+            if not track_count:
+                logging.error("No supported audio files found in the directory: %s. Please check the directory or use the --exclude option if needed.", music_dir)
+            return
+
+        config = load_config(config_file)
+        tag_data, track_count = build_tag_data(tracks, config, verbose=verbose)
+        save_cache(cache)
+
+        if not track_count:
+            logging.error("No supported audio files found in the directory: %s. Please check the directory or use the --exclude option if needed.", music_dir)
             return
 
         # Generate tagcache files
-        create_rockbox_tagcache(output_dir, music_files, config_file, verbose=verbose)
-        create_master_index_file(output_dir, len(music_files))
+        if not incremental:
+            # The manifest would describe the previous database; the next incremental run rebuilds instead
+            remove_manifest(output_dir)
+            offsets, _, _ = write_tag_files(output_dir, tag_data, offset_tables=offset_tables)
+            create_master_index_file(output_dir, tag_data, offsets)
+        else:
+            digests, written = write_changed_database_files(output_dir, tag_data, previous["tags"], offset_tables)
+            save_manifest(output_dir, {
+                "version": MANIFEST_VERSION,
+                "files": listing,
+                "tags": digests,
+                "options": options,
+                "track_count": track_count
+            })
+            logging.info("Rewrote %s of %s database files.", len(written), len(TAG_FILES) + 1)
         
         logging.info("Rockbox database generation complete.")
     except FileNotFoundError as e:
-        logging.error(f"File not found: {e}. Please check the provided paths.")
+        logging.error("File not found: %s. Please check the provided paths.", e)
     except PermissionError as e:
-        logging.error(f"Permission error: {e}. Please ensure you have access to the specified files or directories.")
+        logging.error("Permission error: %s. Please ensure you have access to the specified files or directories.", e)
     except Exception as e:
-        logging.error(f"Unexpected error during database generation: {e}")
\ No newline at end of file
+        logging.error("Unexpected error during database generation: %s", e)
\ No newline at end of file
@@ -0,0 +1,65 @@
+import logging
+import threading
+from time import monotonic
+
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+# Per-file messages of one kind logged in full per interval; the rest are counted and summarized
+PER_FILE_BURST = 20
+PER_FILE_INTERVAL = 10.0
+
+# (level, message template) -> [interval start, messages logged, messages suppressed]
+_per_file = {}
+_per_file_lock = threading.Lock()
+
+def setup_logging(level=logging.INFO, log_file=None):
+    """Configure logging for a CLI run: messages go to stderr, and also to log_file when given."""
+    handlers = [logging.StreamHandler()]
+    if log_file:
+        handlers.append(logging.FileHandler(log_file, encoding='utf-8'))
+    logging.basicConfig(level=level, format=LOG_FORMAT, handlers=handlers, force=True)
+    with _per_file_lock:
+        _per_file.clear()
+
+def _log_suppressed(level, msg, suppressed, seconds):
+    logging.log(level, "%d more messages like \"%s\" in the last %.0f seconds", suppressed, msg, seconds)
+
+def per_file(level, msg, *args):
+    """Log a message about a single file, rate limited per message template.
+
+    Each template is logged in full PER_FILE_BURST times per PER_FILE_INTERVAL seconds; past that
+    the messages are only counted, and the count is logged once the interval is over or when
+    flush_per_file() is called. Warnings and errors are never limited, so every file that failed
+    is named. Nothing is formatted when the level is disabled.
+    """
+    if not logging.getLogger().isEnabledFor(level):
+        return
+    if level >= logging.WARNING:
+        logging.log(level, msg, *args)
+        return
+    now = monotonic()
+    summary = None
+    with _per_file_lock:
+        state = _per_file.get((level, msg))
+        if state is None or now - state[0] >= PER_FILE_INTERVAL:
+            if state is not None and state[2]:
+                summary = (state[2], now - state[0])
+            state = _per_file[(level, msg)] = [now, 0, 0]
+        if state[1] < PER_FILE_BURST:
+            state[1] += 1
+            emit = True
+        else:
+            state[2] += 1
+            emit = False
+    if summary:
+        _log_suppressed(level, msg, *summary)
+    if emit:
+        logging.log(level, msg, *args)
+
+def flush_per_file():
+    """Log the counts of the per-file messages suppressed since their interval started."""
+    now = monotonic()
+    with _per_file_lock:
+        pending = [(level, msg, state[2], now - state[0]) for (level, msg), state in _per_file.items() if state[2]]
+        _per_file.clear()
+    for level, msg, suppressed, seconds in pending:
+        _log_suppressed(level, msg, suppressed, seconds)
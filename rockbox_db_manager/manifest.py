@@ -0,0 +1,86 @@
+import os
+import json
+import hashlib
+import logging
+
+MANIFEST_FILE = "database_manifest.json"
+MANIFEST_VERSION = 2
+# Checksums of the files that passed validate --deep
+CHECKSUM_FILE = "database_checksums.json"
+CHECKSUM_VERSION = 1
+
+def load_manifest(output_dir):
+    """Load the manifest left by the previous incremental run, or an empty one."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        with open(manifest_path, 'r') as f:
+            try:
+                manifest = json.load(f)
+                if manifest.get("version") == MANIFEST_VERSION:
+                    return manifest
+                logging.warning("Manifest version changed. Rebuilding the database.")
+            except json.JSONDecodeError:
+                logging.warning("Manifest file is corrupted. Rebuilding the database.")
+    return {"version": MANIFEST_VERSION, "files": {}, "tags": {}, "options": None, "track_count": 0}
+
+def save_manifest(output_dir, manifest):
+    """Write the manifest atomically next to the generated .tcd files."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f)
+    os.replace(tmp_path, manifest_path)
+
+def remove_manifest(output_dir):
+    """Drop the manifest of a database that is about to be rewritten without one, so it cannot go stale."""
+    manifest_path = os.path.join(output_dir, MANIFEST_FILE)
+    if os.path.exists(manifest_path):
+        os.remove(manifest_path)
+
+def load_checksums(db_dir):
+    """Load the checksum manifest left by the previous deep validation, or an empty one."""
+    checksum_path = os.path.join(db_dir, CHECKSUM_FILE)
+    if os.path.exists(checksum_path):
+        with open(checksum_path, 'r') as f:
+            try:
+                return json.load(f)
+            except json.JSONDecodeError:
+                logging.warning("Checksum manifest is corrupted. Validating every file.")
+    return {"version": CHECKSUM_VERSION, "files": {}}
+
+def save_checksums(db_dir, checksums):
+    """Write the checksum manifest atomically next to the .tcd files."""
+    checksum_path = os.path.join(db_dir, CHECKSUM_FILE)
+    tmp_path = checksum_path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(checksums, f)
+    os.replace(tmp_path, checksum_path)
+
+def snapshot_listing(entries):
+    """Map each (path, stat_result) entry to its [mtime, size] so runs can be compared without parsing any tags."""
+    return {file: [st.st_mtime, st.st_size] for file, st in entries}
+
+def diff_listing(previous_files, listing):
+    """Compare two listings and return the added, removed and changed paths."""
+    added = [file for file in listing if file not in previous_files]
+    removed = [file for file in previous_files if file not in listing]
+    changed = [file for file, stamp in listing.items() if file in previous_files and previous_files[file] != stamp]
+    return added, removed, changed
+
+def options_digest(config_file, exclude=None, only_artist=None, only_album=None):
+    """Fingerprint every option that affects the generated database besides the files themselves."""
+    digest = hashlib.sha1()
+    if config_file and os.path.exists(config_file):
+        with open(config_file, 'rb') as f:
+            digest.update(f.read())
+    digest.update(json.dumps([sorted(exclude or []), only_artist, only_album]).encode('utf-8'))
+    return digest.hexdigest()
+
+def tag_digest(entries):
+    """Digest of a tag file's content, computed from its entries in write order without writing it."""
+    digest = hashlib.sha1()
+    for entry in entries:
+        encoded = str(entry).encode('utf-8')
+        digest.update(len(encoded).to_bytes(4, 'little'))
+        digest.update(encoded)
+    return digest.hexdigest()
@@ -1,43 +1,231 @@
-from mutagen import File
 import os
 import logging
-from rockbox_db_manager.cache import get_file_metadata_from_cache, update_file_metadata_in_cache
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from time import perf_counter
+from rockbox_db_manager import profiling, logs
+from rockbox_db_manager.cache import get_file_metadata_from_cache, update_file_metadata_in_cache, get_tag_keys_from_cache, store_tag_keys_in_cache
+from rockbox_db_manager.tags import read_tags, list_tag_keys
+from rockbox_db_manager.track import TrackRecord
 
-def get_text(metadata_field):
-    """Helper function to extract text from mutagen metadata objects."""
-    if metadata_field:
-        if isinstance(metadata_field, list):
-            return metadata_field[0]
-        return str(metadata_field)
-    return "Unknown"
+# Number of files handed to the process pool at a time; bounds memory for huge libraries
+PARALLEL_BATCH_SIZE = 512
 
-def extract_full_metadata(file, cache, verbose=False):
+def default_metadata(file):
+    """Metadata used when a file cannot be parsed."""
+    return TrackRecord("Unknown Title", ["Unknown Artist"], "Unknown Album", "Unknown Genre", os.path.basename(file), "Unknown Composer", "Unknown Comment", "Unknown", "Unknown")
+
+def read_metadata(file):
+    """Parse the metadata of a file, bypassing the cache.
+
+    Returns a (TrackRecord, error) pair. On failure the metadata holds the default values and
+    error the message. This function only touches the file itself, so it is safe to run in
+    a worker process.
+    """
+    try:
+        fields = read_tags(file)
+
+        def first(field, default):
+            values = fields.get(field)
+            return values[0] if values and values[0] else default
+
+        # Several artists may be stored as separate values or joined with ", "
+        artists = [artist for value in fields.get("artist", []) for artist in value.split(", ") if artist]
+        return TrackRecord(
+            first("title", "Unknown Title"),
+            artists or ["Unknown Artist"],
+            first("album", "Unknown Album"),
+            first("genre", "Unknown Genre"),
+            os.path.basename(file),
+            first("composer", "Unknown Composer"),
+            first("comment", "Unknown Comment"),
+            first("albumartist", "Unknown"),
+            first("grouping", "Unknown")
+        ), None
+
+    except Exception as e:
+        return default_metadata(file), str(e)
+
+def timed_read_metadata(file):
+    """read_metadata for worker processes, also returning the time the parse took."""
+    start = perf_counter()
+    metadata, error = read_metadata(file)
+    return metadata, error, perf_counter() - start
+
+def count_parsed(st, error):
+    """Record a parsed file in the active profile."""
+    profiling.count("files_parsed")
+    if error:
+        profiling.count("parse_errors")
+    if st is not None:
+        profiling.count("bytes_parsed_files", st.st_size)
+
+def extract_full_metadata(file, cache, verbose=False, st=None):
     """Extract full metadata including title, artist, album, genre, etc., with caching."""
-    cached_metadata = get_file_metadata_from_cache(cache, file)
-    
+    with profiling.stage("cache_lookup"):
+        cached_metadata = get_file_metadata_from_cache(cache, file, st)
+
     if cached_metadata:
+        profiling.count("cache_hits")
         if verbose:  # Only log when verbose is True
-            logging.info(f"Using cached metadata for {file}")
+            logs.per_file(logging.INFO, "Using cached metadata for %s", file)
         return cached_metadata
 
-    try:
-        audio = File(file)
-        title = get_text(audio.get("TIT2", "Unknown Title"))
-        artist = get_text(audio.get("TPE1", "Unknown Artist"))
-        album = get_text(audio.get("TALB", "Unknown Album"))
-        genre = get_text(audio.get("TCON", "Unknown Genre"))
-        filename = os.path.basename(file)
-        composer = get_text(audio.get("TCOM", "Unknown Composer"))
-        comment = get_text(audio.get("COMM", "Unknown Comment"))
-        albumartist = get_text(audio.get("TPE2", None))
-        grouping = get_text(audio.get("TIT1", None))
-
-        metadata = (title, artist.split(", "), album, genre, filename, composer, comment, albumartist, grouping)
-        
-        # Update cache
-        update_file_metadata_in_cache(cache, file, metadata)
+    profiling.count("cache_misses")
+    with profiling.stage("parse", file):
+        metadata, error = read_metadata(file)
+    count_parsed(st, error)
+    if error:
+        logs.per_file(logging.ERROR, "Error extracting metadata from file %s: %s", file, error)
         return metadata
-    
+
+    # Update cache
+    with profiling.stage("cache_update"):
+        update_file_metadata_in_cache(cache, file, metadata, st)
+    return metadata
+
+def split_entry(entry):
+    """Accept either a path or a (path, stat_result) pair as produced by the scanner."""
+    if isinstance(entry, tuple):
+        return entry
+    return entry, None
+
+def iter_file_metadata(files, cache, jobs=1, verbose=False):
+    """Yield (file, metadata) pairs for the files, in input order.
+
+    Files may be given as paths or as (path, stat_result) pairs; attached stat results are reused
+    for cache validation. With jobs > 1, cache misses are parsed by a pool of worker processes and
+    the results are merged back into the cache by the caller's process. With jobs <= 1 every file
+    is extracted serially, exactly as extract_full_metadata does.
+    """
+    if jobs <= 1:
+        for entry in files:
+            file, st = split_entry(entry)
+            try:
+                yield file, extract_full_metadata(file, cache, verbose=verbose, st=st)
+            except Exception as e:
+                logs.per_file(logging.ERROR, "Failed to process file %s: %s", file, e)
+        return
+
+    files = iter(files)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        while True:
+            batch = [split_entry(entry) for entry in islice(files, PARALLEL_BATCH_SIZE)]
+            if not batch:
+                break
+
+            results = {}
+            misses = []
+            for file, st in batch:
+                try:
+                    with profiling.stage("cache_lookup"):
+                        cached_metadata = get_file_metadata_from_cache(cache, file, st)
+                except Exception as e:
+                    logs.per_file(logging.ERROR, "Failed to process file %s: %s", file, e)
+                    continue
+                if cached_metadata:
+                    profiling.count("cache_hits")
+                    if verbose:
+                        logs.per_file(logging.INFO, "Using cached metadata for %s", file)
+                    results[file] = cached_metadata
+                else:
+                    profiling.count("cache_misses")
+                    misses.append((file, st))
+
+            # Fan the misses out to the workers; map() keeps results in submission order
+            chunksize = max(1, len(misses) // (jobs * 4))
+            with profiling.stage("parse_pool_wait"):
+                # Workers report their own parse times, which add up to more than the wall time
+                parsed = list(pool.map(timed_read_metadata, [file for file, _ in misses], chunksize=chunksize))
+            for (file, st), (metadata, error, seconds) in zip(misses, parsed):
+                profiling.add_time("parse", seconds, file)
+                count_parsed(st, error)
+                if error:
+                    logs.per_file(logging.ERROR, "Error extracting metadata from file %s: %s", file, error)
+                else:
+                    try:
+                        with profiling.stage("cache_update"):
+                            update_file_metadata_in_cache(cache, file, metadata, st)
+                    except Exception as e:
+                        logs.per_file(logging.ERROR, "Failed to process file %s: %s", file, e)
+                        continue
+                results[file] = metadata
+
+            for file, _ in batch:
+                if file in results:
+                    yield file, results[file]
+
+def read_tag_listing(task):
+    """List a file's tag keys for list-tags, also parsing its metadata when the cache needs it.
+
+    task is a (file, need_metadata) pair. Returns ((format, keys), metadata, error); metadata is
+    None unless asked for. Safe to run in a worker process.
+    """
+    file, need_metadata = task
+    try:
+        tag_keys = list_tag_keys(file)
     except Exception as e:
-        logging.error(f"Error extracting metadata from file {file}: {e}")
-        return "Unknown Title", ["Unknown Artist"], "Unknown Album", "Unknown Genre", os.path.basename(file), "Unknown Composer", "Unknown Comment", "Unknown", "Unknown"
\ No newline at end of file
+        return None, None, str(e)
+    if not need_metadata:
+        return tag_keys, None, None
+    metadata, error = read_metadata(file)
+    return tag_keys, metadata, error
+
+def iter_tag_keys(files, cache, jobs=1):
+    """Yield (file, format, keys) for the files, in input order, reusing the listings in the cache.
+
+    Files whose cache entry is current and already lists their keys are not opened. The others
+    are read in batches by a pool of worker processes (or serially with jobs <= 1); files missing
+    from the cache have their metadata parsed as well, so the listing can be cached with it.
+    Files that cannot be read are logged and skipped.
+    """
+    pool = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    files = iter(files)
+    try:
+        while True:
+            batch = [split_entry(entry) for entry in islice(files, PARALLEL_BATCH_SIZE)]
+            if not batch:
+                break
+
+            results = {}
+            tasks = []
+            for file, st in batch:
+                try:
+                    st = st or os.stat(file)
+                    cached = get_tag_keys_from_cache(cache, file, st)
+                    has_metadata = cached is not None or get_file_metadata_from_cache(cache, file, st) is not None
+                except OSError as e:
+                    logs.per_file(logging.ERROR, "Failed to process file %s: %s", file, e)
+                    continue
+                if cached is not None:
+                    profiling.count("cache_hits")
+                    results[file] = cached
+                else:
+                    profiling.count("cache_misses")
+                    tasks.append((file, st, has_metadata))
+
+            work = [(file, not has_metadata) for file, _, has_metadata in tasks]
+            with profiling.stage("parse_pool_wait" if pool else "parse"):
+                if pool:
+                    listed = pool.map(read_tag_listing, work, chunksize=max(1, len(work) // (jobs * 4)))
+                else:
+                    listed = map(read_tag_listing, work)
+                listed = list(listed)
+            for (file, st, has_metadata), (tag_keys, metadata, error) in zip(tasks, listed):
+                if error:
+                    logs.per_file(logging.ERROR, "Error reading tags from file %s: %s", file, error)
+                if tag_keys is None:
+                    continue
+                results[file] = tag_keys
+                if has_metadata:
+                    store_tag_keys_in_cache(cache, file, tag_keys)
+                elif not error:
+                    update_file_metadata_in_cache(cache, file, metadata, st, tag_keys=tag_keys)
+
+            for file, _ in batch:
+                if file in results:
+                    tag_format, keys = results[file]
+                    yield file, tag_format, keys
+    finally:
+        if pool:
+            pool.shutdown()
@@ -0,0 +1,152 @@
+import json
+import heapq
+import logging
+import cProfile
+import contextlib
+from time import perf_counter
+from collections import Counter, defaultdict
+
+# Number of slowest items (e.g. files to parse) kept per stage
+SLOWEST_ITEMS = 20
+
+# Profile being recorded, or None when instrumentation is off
+_active = None
+
+class Profile:
+    """Wall time per stage, counters and the slowest items of a run."""
+
+    def __init__(self, slowest=SLOWEST_ITEMS):
+        self.seconds = defaultdict(float)
+        self.calls = Counter()
+        self.counters = Counter()
+        self.slowest = defaultdict(list)  # stage -> min-heap of (seconds, item)
+        self.max_slowest = slowest
+        self.started = perf_counter()
+
+    def add_time(self, name, seconds, item=None):
+        """Add a duration to a stage, keeping the item if it is among the stage's slowest."""
+        self.seconds[name] += seconds
+        self.calls[name] += 1
+        if item is not None:
+            heap = self.slowest[name]
+            if len(heap) < self.max_slowest:
+                heapq.heappush(heap, (seconds, item))
+            elif seconds > heap[0][0]:
+                heapq.heapreplace(heap, (seconds, item))
+
+    def report(self):
+        """Summarize the profile as a JSON-serializable dict."""
+        return {
+            "wall_seconds": round(perf_counter() - self.started, 6),
+            "stages": {
+                name: {"seconds": round(seconds, 6), "calls": self.calls[name]}
+                for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1])
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "slowest": {
+                name: [{"item": item, "seconds": round(seconds, 6)} for seconds, item in sorted(heap, reverse=True)]
+                for name, heap in self.slowest.items()
+            },
+        }
+
+class _NullStage:
+    """Shared do-nothing stage handed out while instrumentation is off."""
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_null_stage = _NullStage()
+
+class _Stage:
+    __slots__ = ("profile", "name", "item", "start")
+
+    def __init__(self, profile, name, item):
+        self.profile = profile
+        self.name = name
+        self.item = item
+
+    def __enter__(self):
+        self.start = perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profile.add_time(self.name, perf_counter() - self.start, self.item)
+        return False
+
+def is_active():
+    """Whether a profile is being recorded."""
+    return _active is not None
+
+def stage(name, item=None):
+    """Context manager adding the wall time of its block to a stage.
+
+    When item is given (e.g. a file path) it competes for the stage's slowest items. With
+    instrumentation off this returns a shared no-op context manager.
+    """
+    profile = _active
+    if profile is None:
+        return _null_stage
+    return _Stage(profile, name, item)
+
+def add_time(name, seconds, item=None):
+    """Add a duration measured elsewhere (e.g. in a worker process) to a stage."""
+    profile = _active
+    if profile is not None:
+        profile.add_time(name, seconds, item)
+
+def count(name, amount=1):
+    """Increment a counter."""
+    profile = _active
+    if profile is not None:
+        profile.counters[name] += amount
+
+def timed_iter(name, iterable):
+    """Wrap an iterable so the time spent producing each item is added to a stage."""
+    if _active is None:
+        return iterable
+    return _timed_iter(name, iterable)
+
+def _timed_iter(name, iterable):
+    iterator = iter(iterable)
+    while True:
+        with stage(name):
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+        yield item
+
+@contextlib.contextmanager
+def profile_run(report_file=None, pstats_file=None, **details):
+    """Record a profile of the enclosed block and write it as a JSON report.
+
+    When pstats_file is given the block also runs under cProfile and the statistics are dumped
+    there for pstats or snakeviz. Extra keyword arguments are added to the report as-is.
+    """
+    global _active
+    if not (report_file or pstats_file):
+        yield None
+        return
+
+    profile = Profile()
+    profiler = cProfile.Profile() if pstats_file else None
+    _active = profile
+    if profiler:
+        profiler.enable()
+    try:
+        yield profile
+    finally:
+        if profiler:
+            profiler.disable()
+            profiler.dump_stats(pstats_file)
+            logging.info("cProfile statistics written to %s", pstats_file)
+        _active = None
+        if report_file:
+            report = dict(details, **profile.report())
+            with open(report_file, 'w', encoding='utf-8') as out:
+                json.dump(report, out, indent=2)
+            logging.info("Profile report written to %s", report_file)
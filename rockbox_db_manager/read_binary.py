@@ -1,21 +1,52 @@
-import struct
+import os
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError, index_track_count, iter_index_rows
+from rockbox_db_manager.tcd_writer import TAG_FILES, INDEX_FILE
+
+def read_binary_index_file(filepath):
+    """Print the track count of a master index and each track's row of tag file offsets."""
+    print(f"File: {filepath}, Size: {os.path.getsize(filepath)} bytes")
+    try:
+        tracks = index_track_count(filepath)
+    except TcdFormatError as e:
+        print(f"Failed to parse at index {e.offset}: {e}")
+        return
+    columns = len(TAG_FILES)
+    print(f"Tracks: {tracks}, Offsets: {tracks * columns} ({columns} per track)")
+    track = 0
+    for rows in iter_index_rows(filepath):
+        for start in range(0, len(rows), columns):
+            print(f"Track {track}: {list(rows[start:start + columns])}")
+            track += 1
 
 def read_binary_tcd_file(filepath):
     """Read and analyze the binary structure of a .tcd file."""
-    with open(filepath, 'rb') as f:
-        content = f.read()
-        print(f"File: {filepath}, Size: {len(content)} bytes")
+    if os.path.basename(filepath) == INDEX_FILE:
+        read_binary_index_file(filepath)
+        return
+    with TcdReader(filepath) as reader:
+        print(f"File: {filepath}, Size: {len(reader)} bytes")
 
-        idx = 0
-        while idx < len(content):
-            try:
-                # Assuming the first 4 bytes represent the length of the following string
-                entry_len = struct.unpack('<I', content[idx:idx+4])[0]
-                idx += 4
-                entry = content[idx:idx+entry_len].decode('utf-8', errors='ignore')
-                idx += entry_len
+        try:
+            # The first 4 bytes of each entry hold the length of the following string
+            for _, entry_len, entry in reader.iter_strings():
                 print(f"Entry (Length: {entry_len}): {entry}")
-            except Exception as e:
-                print(f"Failed to parse at index {idx}: {e}")
-                break
+        except TcdFormatError as e:
+            print(f"Failed to parse at index {e.offset}: {e}")
+
+def lookup(filepath, value):
+    """Print the entries of a .tcd file equal to value, ignoring case, with their offsets.
 
+    Sorted tag files with an offset table (create-db --offset-tables) are binary searched;
+    others are scanned.
+    """
+    with TcdReader(filepath) as reader:
+        method = "binary search" if reader.offset_table() is not None else "linear scan"
+        try:
+            matches = reader.lookup(value)
+        except TcdFormatError as e:
+            print(f"Failed to parse at index {e.offset}: {e}")
+            return []
+        print(f"File: {filepath}, {len(matches)} match(es) for {value!r} ({method})")
+        for offset, entry in matches:
+            print(f"Offset {offset}: {entry}")
+        return matches
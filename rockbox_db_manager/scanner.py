@@ -1,50 +1,195 @@
 import os
+import re
 import logging
-from rockbox_db_manager import metadata
-from rockbox_db_manager.cache import load_cache
+from rockbox_db_manager import metadata, profiling, logs
+from rockbox_db_manager.cache import get_cache, cache_key, METADATA_VERSION
 
 SUPPORTED_FORMATS = (".mp3", ".flac", ".wav", ".ogg", ".wma", ".aac", ".m4a", ".alac", ".aiff", ".ape", ".wv", ".mod", ".spc")
 
+def resolve_music_directory(directory):
+    """Normalize the music directory path, returning None if it is not a valid directory."""
+    # Ensure the directory path is correctly formatted
+    directory = os.path.abspath(directory.strip('"'))  # Remove any extraneous quotes
+    if not os.path.isdir(directory):
+        logging.error("Error: %s is not a valid directory.", directory)
+        return None
+    return directory
+
+def compile_exclusions(exclude=None):
+    """Pre-compile the --exclude rules into a single lookup.
+
+    Entries that look like extensions (".flac") are removed from the set of accepted extensions;
+    every other entry is a directory pattern, matched as a substring of the directory path.
+    Returns the accepted extensions and a compiled directory pattern (or None).
+    """
+    excluded_extensions = set()
+    excluded_dirs = []
+    for rule in exclude or []:
+        if rule.startswith(".") and "/" not in rule and os.sep not in rule:
+            excluded_extensions.add(rule.lower())
+        else:
+            excluded_dirs.append(rule)
+
+    extensions = frozenset(ext for ext in SUPPORTED_FORMATS if ext not in excluded_extensions)
+    dir_pattern = re.compile("|".join(re.escape(d) for d in excluded_dirs)) if excluded_dirs else None
+    return extensions, dir_pattern
+
+def iter_music_entries(directory, exclude=None):
+    """Yield a (path, stat_result) pair for every supported audio file under the directory.
+
+    The tree is walked with os.scandir: excluded directories are pruned before they are entered,
+    and the stat result of each file is passed along so it never has to be stat'ed again.
+    Entries are visited in name order so the output is stable from run to run.
+    """
+    extensions, dir_pattern = compile_exclusions(exclude)
+    if dir_pattern and dir_pattern.search(directory):
+        return
+
+    stack = [directory]
+    while stack:
+        root = stack.pop()
+        try:
+            with os.scandir(root) as it:
+                entries = sorted(it, key=lambda entry: entry.name)
+        except OSError as e:
+            logs.per_file(logging.ERROR, "Failed to list directory %s: %s", root, e)
+            continue
+
+        subdirs = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    # Exclude directories
+                    if not (dir_pattern and dir_pattern.search(entry.path)):
+                        subdirs.append(entry.path)
+                    continue
+                # Exclude specific file types
+                if os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file():
+                    yield entry.path, entry.stat()
+            except OSError as e:
+                logs.per_file(logging.ERROR, "Failed to stat %s: %s", entry.path, e)
+
+        # Visit subdirectories in name order
+        stack.extend(reversed(subdirs))
+
+def walk_order_key(path):
+    """Sort key reproducing the order of iter_music_entries: a directory's files by name, then its subdirectories."""
+    *dirs, name = path.split(os.sep)
+    return [(1, d) for d in dirs] + [(0, name)]
+
+def iter_music_files(directory, exclude=None):
+    """Yield the path of every supported audio file under the directory, applying exclusion rules."""
+    for full_path, _ in iter_music_entries(directory, exclude):
+        yield full_path
+
+def filter_values(values):
+    """Normalize an --only-artist/--only-album value (one string or several) to a set of case-folded strings."""
+    if not values:
+        return None
+    if isinstance(values, frozenset):
+        # Already normalized
+        return values
+    if isinstance(values, str):
+        values = [values]
+    return frozenset(value.casefold() for value in values)
+
+def matches_filters(file_metadata, only_artist=None, only_album=None):
+    """Check whether the extracted metadata passes the artist and album filters.
+
+    Matching ignores case, and a filter with several values matches any of them. A track passes
+    the artist filter through any of its artists or its album artist.
+    """
+    artists = filter_values(only_artist)
+    if artists and not any(artist.casefold() in artists for artist in (*file_metadata.artists, file_metadata.albumartist)):
+        return False
+    albums = filter_values(only_album)
+    if albums and file_metadata.album.casefold() not in albums:
+        return False
+    return True
+
+def indexed_filter(cache, only_artist=None, only_album=None):
+    """Build a predicate telling which files can be skipped by a filtered build without being looked up.
+
+    The matching files are found in the cache's inverted indexes. A file is skipped when it is not
+    among them and its cache entry is up to date, so its metadata is known not to match; new,
+    changed and moved files are still looked up, parsed and filtered as usual. Returns None when
+    there is no filter or the cache has no indexes.
+    """
+    artists = filter_values(only_artist)
+    albums = filter_values(only_album)
+    if not (artists or albums) or not hasattr(cache, "keys_with_tag"):
+        return None
+    with profiling.stage("filter_index"):
+        matching = None
+        if artists:
+            matching = cache.keys_with_tag("artist", artists) | cache.keys_with_tag("albumartist", artists)
+        if albums:
+            album_keys = cache.keys_with_tag("album", albums)
+            matching = album_keys if matching is None else matching & album_keys
+        stamps = cache.entry_stamps()
+
+    def skip(path, st):
+        key = cache_key(cache, path)
+        if st is None or key in matching:
+            return False
+        stamp = stamps.get(key)
+        if stamp is None or stamp != (st.st_mtime, METADATA_VERSION):
+            return False
+        profiling.count("filter_skipped")
+        return True
+    return skip
+
+def iter_tracks(directory, cache, show_songs=False, exclude=None, only_artist=None, only_album=None, verbose=False, jobs=1, files=None):
+    """Stream (path, metadata) pairs for the directory, extracting each file's metadata exactly once.
+
+    This is a generator: files are walked, parsed and filtered one at a time so that callers can
+    aggregate tags without holding the full file list in memory. With jobs > 1 cache misses are
+    parsed by a process pool. An already walked list of files can be passed to skip the walk.
+    """
+    if files is None:
+        # The walk is interleaved with parsing, so it is timed item by item
+        files = profiling.timed_iter("walk", iter_music_entries(directory, exclude))
+    skip = indexed_filter(cache, only_artist, only_album)
+    if skip is not None:
+        files = (entry for entry in files if not skip(*metadata.split_entry(entry)))
+    tracks = metadata.iter_file_metadata(files, cache, jobs=jobs, verbose=verbose)
+    yield from filter_tracks(tracks, show_songs, only_artist, only_album)
+
+def filter_tracks(tracks, show_songs=False, only_artist=None, only_album=None):
+    """Apply the artist and album filters to a stream of (path, metadata) pairs."""
+    only_artist = filter_values(only_artist)
+    only_album = filter_values(only_album)
+    for full_path, file_metadata in tracks:
+        logs.per_file(logging.DEBUG, "Processing file: %s", full_path)
+
+        # Apply artist and album filters
+        if not matches_filters(file_metadata, only_artist, only_album):
+            continue
+
+        if show_songs:
+            print(f"Found song: {full_path}")
+
+        yield full_path, file_metadata
+
 def scan_music_directory(directory, show_songs=False, exclude=None, only_artist=None, only_album=None):
     """Scans the directory for supported audio files and filters by artist, album, and exclusion rules."""
     music_files = []
-    exclude = exclude or []
-    logging.basicConfig(level=logging.DEBUG)  # Ensure logging is configured
-    logging.info(f"Scanning directory: {directory}")
+    logging.info("Scanning directory: %s", directory)
 
-    # Ensure the directory path is correctly formatted
-    directory = os.path.abspath(directory.strip('"'))  # Remove any extraneous quotes
-    if not os.path.isdir(directory):
-        logging.error(f"Error: {directory} is not a valid directory.")
+    directory = resolve_music_directory(directory)
+    if directory is None:
         return music_files
 
-    for root, dirs, files in os.walk(directory):
-        # Exclude directories
-        if any(ex_dir in root for ex_dir in exclude):
-            continue
-        for file in files:
-            # Exclude specific file types
-            if file.lower().endswith(SUPPORTED_FORMATS) and not any(file.lower().endswith(ext) for ext in exclude):
-                full_path = os.path.join(root, file)
-                logging.debug(f"Processing file: {full_path}")
-
-                try:
-                    # Extract metadata for the file
-                    file_metadata = metadata.extract_full_metadata(full_path, load_cache())
-                    
-                    # Apply artist and album filters
-                    if only_artist and only_artist not in file_metadata[1]:
-                        continue
-                    if only_album and file_metadata[2] != only_album:
-                        continue
-
-                    music_files.append(full_path)
-                    
-                    if show_songs:
-                        print(f"Found song: {full_path}")
-                
-                except Exception as e:
-                    logging.error(f"Failed to process file {file}: {e}")
-    
-    logging.info(f"Total files found: {len(music_files)}")
+    if only_artist or only_album:
+        # Metadata is only needed when filtering
+        tracks = iter_tracks(directory, get_cache(root=directory), show_songs=show_songs, exclude=exclude, only_artist=only_artist, only_album=only_album)
+        music_files = [full_path for full_path, _ in tracks]
+    else:
+        for full_path in iter_music_files(directory, exclude):
+            logs.per_file(logging.DEBUG, "Processing file: %s", full_path)
+            music_files.append(full_path)
+            if show_songs:
+                print(f"Found song: {full_path}")
+
+    logging.info("Total files found: %s", len(music_files))
     return music_files
\ No newline at end of file
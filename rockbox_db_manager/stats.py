@@ -0,0 +1,149 @@
+import os
+import math
+import heapq
+from concurrent.futures import ProcessPoolExecutor
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError, index_track_count, iter_index_rows
+from rockbox_db_manager.tcd_writer import TAG_FILES, INDEX_FILE
+
+# Tag files summarized by stats, in the order of the master index columns
+TAG_FILE_NAMES = list(TAG_FILES.values())
+# Longest entries listed per tag file
+LONGEST_ENTRIES = 5
+# Distinct values are counted exactly up to this many, then estimated with HyperLogLog
+EXACT_DISTINCT_LIMIT = 1 << 16
+# HyperLogLog with 2**14 one-byte registers: 16 KiB per file and about 1% standard error
+HLL_BITS = 14
+HLL_REGISTERS = 1 << HLL_BITS
+
+class DistinctCounter:
+    """Count distinct values in bounded memory.
+
+    Values are counted exactly by their 64-bit hash until there are more than EXACT_DISTINCT_LIMIT
+    of them; the hashes seen so far then seed HyperLogLog registers, which give the estimate.
+    """
+
+    def __init__(self):
+        self.exact = set()
+        self.registers = None
+
+    def add(self, value):
+        # The built-in hash is enough here: the counter never leaves its process
+        h = hash(value) & 0xFFFFFFFFFFFFFFFF
+        if self.exact is not None:
+            self.exact.add(h)
+            if len(self.exact) > EXACT_DISTINCT_LIMIT:
+                self.registers = bytearray(HLL_REGISTERS)
+                for seen in self.exact:
+                    self._add_hash(seen)
+                self.exact = None
+            return
+        self._add_hash(h)
+
+    def _add_hash(self, h):
+        index = h & (HLL_REGISTERS - 1)
+        rank = 64 - HLL_BITS - (h >> HLL_BITS).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        """Return the number of distinct values and whether it is exact."""
+        if self.exact is not None:
+            return len(self.exact), True
+        m = HLL_REGISTERS
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Small range correction: linear counting
+            estimate = m * math.log(m / zeros)
+        return round(estimate), False
+
+def is_default(entry):
+    """Whether a raw entry is one of the "Unknown ..." defaults filled in for missing tags."""
+    return entry == b"Unknown" or entry.startswith(b"Unknown ")
+
+def tag_file_stats(filepath):
+    """Summarize one tag file in a single streaming pass; runs in a worker process.
+
+    Memory does not depend on the size of the file: entries are read through the mapping, only
+    the longest few are kept and distinct values go through a DistinctCounter. Lengths are in
+    UTF-8 bytes. The offsets of the default entries are returned for the index pass.
+    """
+    stats = {"file": os.path.basename(filepath), "size": 0, "entries": 0, "distinct": 0, "distinct_exact": True,
+             "total_length": 0, "average_length": 0.0, "longest": [], "unknown_entries": 0, "error": None}
+    unknown_offsets = []
+    longest = []
+    distinct = DistinctCounter()
+    try:
+        with TcdReader(filepath) as reader:
+            stats["size"] = len(reader)
+            try:
+                for offset, entry in reader.iter_raw():
+                    entry = bytes(entry)
+                    length = len(entry)
+                    stats["entries"] += 1
+                    stats["total_length"] += length
+                    distinct.add(entry)
+                    if len(longest) < LONGEST_ENTRIES:
+                        heapq.heappush(longest, (length, offset))
+                    elif length > longest[0][0]:
+                        heapq.heapreplace(longest, (length, offset))
+                    if is_default(entry):
+                        stats["unknown_entries"] += 1
+                        unknown_offsets.append(offset)
+            except TcdFormatError as e:
+                stats["error"] = str(e)
+            stats["longest"] = [(length, reader.decode_entry(offset)) for length, offset in sorted(longest, reverse=True)]
+    except OSError as e:
+        stats["error"] = str(e)
+    stats["distinct"], stats["distinct_exact"] = distinct.count()
+    if stats["entries"]:
+        stats["average_length"] = stats["total_length"] / stats["entries"]
+    return stats, unknown_offsets
+
+def index_stats(index_path, unknown_offsets):
+    """Read the track count from the master index and count the tracks pointing at default entries.
+
+    unknown_offsets maps each column of the index to the offsets of the defaults in its tag file.
+    Each column is counted with array.count, without a Python-level loop over the tracks.
+    """
+    stats = {"tracks": None, "unknown_tracks": {}, "error": None}
+    if not os.path.exists(index_path):
+        stats["error"] = f"{INDEX_FILE} not found"
+        return stats
+    columns = len(TAG_FILE_NAMES)
+    counts = {column: 0 for column, offsets in unknown_offsets.items() if offsets}
+    try:
+        stats["tracks"] = index_track_count(index_path)
+        for rows in iter_index_rows(index_path):
+            for column in counts:
+                values = rows[column::columns]
+                counts[column] += sum(values.count(offset) for offset in unknown_offsets[column])
+    except (OSError, TcdFormatError) as e:
+        stats["error"] = str(e)
+        return stats
+    stats["unknown_tracks"] = {TAG_FILE_NAMES[column]: count for column, count in counts.items()}
+    return stats
+
+def database_stats(db_dir, jobs=None):
+    """Summarize every tag file and the master index of a database directory.
+
+    Tag files are summarized in parallel, one worker process per file. Returns a dict with the
+    per-file statistics and the index statistics.
+    """
+    paths = [os.path.join(db_dir, name) for name in TAG_FILE_NAMES if os.path.exists(os.path.join(db_dir, name))]
+    jobs = jobs or min(len(paths), os.cpu_count() or 1)
+    if jobs > 1 and len(paths) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            results = list(pool.map(tag_file_stats, paths))
+    else:
+        results = [tag_file_stats(path) for path in paths]
+
+    files = {}
+    unknown_offsets = {}
+    for stats, offsets in results:
+        files[stats["file"]] = stats
+        unknown_offsets[TAG_FILE_NAMES.index(stats["file"])] = offsets
+    index = index_stats(os.path.join(db_dir, INDEX_FILE), unknown_offsets)
+    for name, count in index["unknown_tracks"].items():
+        files[name]["unknown_tracks"] = count
+    return {"files": files, "index": index}
@@ -1,10 +1,116 @@
 import shutil
 import os
+import hashlib
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from rockbox_db_manager.manifest import MANIFEST_FILE, CHECKSUM_FILE
+from rockbox_db_manager.tcd_writer import OFFSET_TABLE_SUFFIX, INDEX_FILE
 
-def sync_database(source, destination):
-    """Copies the database to the Rockbox device."""
-    if os.path.exists(source):
-        shutil.copy(source, destination)
-        print(f"Database synced to {destination}")
+# Buffer used when hashing and copying; large reads and writes suit USB mass storage best
+COPY_BUFFER_SIZE = 4 << 20
+SYNC_THREADS = 4
+
+def file_digest(path):
+    """Hash a file's content."""
+    digest = hashlib.blake2b()
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(COPY_BUFFER_SIZE)
+            if not chunk:
+                break
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def files_match(source_file, dest_file):
+    """Check whether the destination already holds the same content; sizes are compared before hashing."""
+    if not os.path.isfile(dest_file):
+        return False
+    if os.path.getsize(source_file) != os.path.getsize(dest_file):
+        return False
+    return file_digest(source_file) == file_digest(dest_file)
+
+def stage_file(source_file, dest_file):
+    """Copy a file next to its destination under a temporary name and return that name.
+
+    Returns None when the destination is already up to date.
+    """
+    if files_match(source_file, dest_file):
+        return None
+    tmp_file = dest_file + ".tmp"
+    try:
+        with open(source_file, 'rb') as fsrc, open(tmp_file, 'wb') as fdst:
+            shutil.copyfileobj(fsrc, fdst, COPY_BUFFER_SIZE)
+            fdst.flush()
+            os.fsync(fdst.fileno())
+    except Exception:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+        raise
+    return tmp_file
+
+def sync_database(source, destination, jobs=SYNC_THREADS):
+    """Copies the database to the Rockbox device.
+
+    The source may be a single file or a whole database directory. Files whose size and hash
+    already match the destination are skipped; the others are copied by a small thread pool to
+    temporary files, which are then renamed into place together once every copy has succeeded.
+    Returns a report with the number of files and bytes copied and skipped.
+    """
+    if not os.path.exists(source):
+        print(f"Source database file {source} not found.")
+        return None
+
+    if os.path.isdir(source):
+        os.makedirs(destination, exist_ok=True)
+        names = sorted(
+            name for name in os.listdir(source)
+            # The manifests and the lookup offset tables are only needed on the computer
+            if os.path.isfile(os.path.join(source, name)) and not name.endswith((".tmp", OFFSET_TABLE_SUFFIX)) and name not in (MANIFEST_FILE, CHECKSUM_FILE)
+        )
+        pairs = [(os.path.join(source, name), os.path.join(destination, name)) for name in names]
     else:
-        print(f"Source database file {source} not found.")
\ No newline at end of file
+        dest_file = os.path.join(destination, os.path.basename(source)) if os.path.isdir(destination) else destination
+        pairs = [(source, dest_file)]
+
+    report = {"copied": 0, "skipped": 0, "bytes_copied": 0, "bytes_skipped": 0}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        futures = [pool.submit(stage_file, source_file, dest_file) for source_file, dest_file in pairs]
+
+    staged = []
+    failed = False
+    for future, (source_file, _) in zip(futures, pairs):
+        try:
+            staged.append(future.result())
+        except OSError as e:
+            logging.error("Failed to copy %s: %s", source_file, e)
+            staged.append(None)
+            failed = True
+    if failed:
+        # Leave the device untouched rather than mixing old and new database files
+        for tmp_file in staged:
+            if tmp_file:
+                os.remove(tmp_file)
+        print(f"Sync to {destination} failed; no files were replaced.")
+        return None
+
+    # Swap everything in only once all copies succeeded; the master index goes last
+    swaps = sorted(
+        ((tmp_file, dest_file) for tmp_file, (_, dest_file) in zip(staged, pairs) if tmp_file),
+        key=lambda swap: os.path.basename(swap[1]) == INDEX_FILE
+    )
+    for tmp_file, dest_file in swaps:
+        os.replace(tmp_file, dest_file)
+
+    for tmp_file, (source_file, _) in zip(staged, pairs):
+        size = os.path.getsize(source_file)
+        if tmp_file:
+            report["copied"] += 1
+            report["bytes_copied"] += size
+            logging.info("Copied %s (%s bytes)", source_file, size)
+        else:
+            report["skipped"] += 1
+            report["bytes_skipped"] += size
+
+    print(f"Database synced to {destination}: {report['copied']} files copied ({report['bytes_copied']} bytes), "
+          f"{report['skipped']} unchanged files skipped ({report['bytes_skipped']} bytes)")
+    return report
@@ -0,0 +1,358 @@
+import os
+import struct
+from mutagen import File
+from mutagen.id3 import ID3, TCON
+
+# Fields read from every file; each maps to a list of string values
+TAG_FIELDS = ("title", "artist", "album", "genre", "composer", "comment", "albumartist", "grouping")
+
+ID3_FRAMES = {
+    "TIT2": "title", "TPE1": "artist", "TALB": "album", "TCON": "genre",
+    "TCOM": "composer", "COMM": "comment", "TPE2": "albumartist", "TIT1": "grouping",
+}
+# ID3v2.2 uses three-character frame ids
+ID3V22_FRAMES = {
+    "TT2": "title", "TP1": "artist", "TAL": "album", "TCO": "genre",
+    "TCM": "composer", "COM": "comment", "TP2": "albumartist", "TT1": "grouping",
+}
+# Native keys of the other tag formats, lowercased: Vorbis comments (FLAC, Ogg, Opus), MP4 atoms,
+# APEv2 (Monkey's Audio, WavPack) and ASF (WMA)
+NATIVE_KEYS = {
+    "title": "title", "artist": "artist", "album": "album", "genre": "genre", "composer": "composer",
+    "comment": "comment", "description": "comment", "albumartist": "albumartist", "album artist": "albumartist",
+    "grouping": "grouping", "contentgroup": "grouping",
+    "\xa9nam": "title", "\xa9art": "artist", "\xa9alb": "album", "\xa9gen": "genre", "\xa9wrt": "composer",
+    "\xa9cmt": "comment", "aart": "albumartist", "\xa9grp": "grouping",
+    "author": "artist", "wm/albumtitle": "album", "wm/genre": "genre", "wm/composer": "composer",
+    "wm/albumartist": "albumartist", "wm/contentgroupdescription": "grouping",
+}
+
+# ID3 text encodings and the terminator used between their values
+ID3_ENCODINGS = {0: ("latin-1", b"\x00"), 1: ("utf-16", b"\x00\x00"), 2: ("utf-16-be", b"\x00\x00"), 3: ("utf-8", b"\x00")}
+# Tag-level flags: unsynchronisation, and for ID3v2.2 compression
+ID3_UNSUPPORTED_TAG_FLAGS = {2: 0xC0, 3: 0x80, 4: 0x80}
+# Frame format flags: compression, encryption, grouping, unsynchronisation, data length indicator
+ID3_UNSUPPORTED_FRAME_FLAGS = {3: 0x00E0, 4: 0x004F}
+FLAC_VORBIS_COMMENT = 4
+
+class UnsupportedTag(Exception):
+    """Raised by a fast reader for a tag it does not handle; the file is then read with mutagen."""
+
+def synchsafe(data):
+    """Decode a big-endian integer stored in 7 bits per byte."""
+    value = 0
+    for byte in data:
+        value = (value << 7) | (byte & 0x7F)
+    return value
+
+def split_values(data, terminator):
+    """Split terminator-separated values; two-byte terminators only match on character boundaries."""
+    if len(terminator) == 1:
+        values = data.split(terminator)
+    else:
+        values = []
+        start = 0
+        for i in range(0, len(data) - 1, 2):
+            if data[i] == 0 and data[i + 1] == 0:
+                values.append(data[start:i])
+                start = i + 2
+        values.append(data[start:])
+    # A trailing terminator does not start another value
+    while len(values) > 1 and not values[-1]:
+        values.pop()
+    return values
+
+def id3_encoding(byte):
+    """The codec and value terminator of an ID3 text encoding byte."""
+    if byte not in ID3_ENCODINGS:
+        raise UnsupportedTag(f"Unknown ID3 text encoding {byte}")
+    return ID3_ENCODINGS[byte]
+
+def decode_id3_text(body):
+    """Decode the values of an ID3 text frame."""
+    encoding, terminator = id3_encoding(body[0])
+    return [value.decode(encoding, 'replace') for value in split_values(body[1:], terminator)]
+
+def decode_id3_comment(body):
+    """Decode a COMM frame into its description and values."""
+    encoding, terminator = id3_encoding(body[0])
+    # After the language code, the description is the first value and the comment text the rest
+    parts = split_values(body[4:], terminator)
+    return parts[0].decode(encoding, 'replace'), [value.decode(encoding, 'replace') for value in parts[1:]]
+
+def read_id3v2_header(f):
+    """Read the header of an ID3v2 tag at the start of f, leaving f at its first frame.
+
+    Returns (major version, end offset of the tag), or None when the file has no ID3v2 tag.
+    Raises UnsupportedTag for unsynchronised or compressed tags.
+    """
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return None
+    major, flags = header[3], header[5]
+    if major not in ID3_UNSUPPORTED_TAG_FLAGS or flags & ID3_UNSUPPORTED_TAG_FLAGS[major]:
+        raise UnsupportedTag(f"ID3v2.{major} flags {flags:#x}")
+    end = 10 + synchsafe(header[6:10])
+
+    if flags & 0x40:
+        # Extended header: its size excludes itself in ID3v2.3 and includes itself in ID3v2.4
+        size = f.read(4)
+        f.seek(struct.unpack('>I', size)[0] if major == 3 else synchsafe(size) - 4, 1)
+    return major, end
+
+def iter_id3v2_frames(f, major, end):
+    """Yield the (frame id, size, format flags) of every frame of the tag, reading only the frame headers.
+
+    When a frame is yielded f is at its body, which the caller may read; the next frame header is
+    read from its own offset either way, so skipped bodies, cover art included, cost a seek.
+    """
+    header_size = 6 if major == 2 else 10
+    pos = f.tell()
+    while pos + header_size <= end:
+        f.seek(pos)
+        frame_header = f.read(header_size)
+        if len(frame_header) < header_size or frame_header[0] == 0:
+            # Padding
+            return
+        if major == 2:
+            frame_id, size, frame_flags = frame_header[:3], int.from_bytes(frame_header[3:6], 'big'), 0
+        else:
+            frame_id = frame_header[:4]
+            size = synchsafe(frame_header[4:8]) if major == 4 else struct.unpack('>I', frame_header[4:8])[0]
+            frame_flags = int.from_bytes(frame_header[8:10], 'big')
+        pos += header_size + size
+        if pos > end:
+            raise UnsupportedTag(f"Frame {frame_id!r} runs past the end of the tag")
+        yield frame_id.decode('latin-1'), size, frame_flags
+
+def read_id3v2(f):
+    """Read the wanted frames of an ID3v2 tag at the start of f.
+
+    Only the header of every frame is read; frames that are not needed, embedded cover art
+    included, are skipped with a seek. Returns None when the file has no ID3v2 tag and raises
+    UnsupportedTag for unsynchronised, compressed or encrypted tags.
+    """
+    header = read_id3v2_header(f)
+    if header is None:
+        return None
+    major, end = header
+
+    frames = ID3V22_FRAMES if major == 2 else ID3_FRAMES
+    fields = {}
+    comments = []
+    for frame_id, size, frame_flags in iter_id3v2_frames(f, major, end):
+        name = frames.get(frame_id)
+        if name is None or (name in fields and name != "comment"):
+            continue
+        if frame_flags & ID3_UNSUPPORTED_FRAME_FLAGS.get(major, 0):
+            raise UnsupportedTag(f"Frame {frame_id!r} flags {frame_flags:#x}")
+        body = f.read(size)
+        if not body:
+            continue
+        if name == "comment":
+            comments.append(decode_id3_comment(body))
+        elif name == "genre":
+            # Resolve ID3v1 genre numbers such as "(17)" the way mutagen does
+            fields[name] = TCON(encoding=3, text=decode_id3_text(body)).genres
+        else:
+            fields[name] = decode_id3_text(body)
+
+    if comments:
+        fields["comment"] = preferred_comment(comments)
+    return fields
+
+def preferred_comment(comments):
+    """Pick the values of the comment without a description, or else of the first comment."""
+    for description, values in comments:
+        if not description:
+            return values
+    return comments[0][1]
+
+def iter_vorbis_comment(data):
+    """Yield the raw (key, value) of every entry of a Vorbis comment block."""
+    vendor_length = struct.unpack_from('<I', data, 0)[0]
+    pos = 4 + vendor_length
+    count = struct.unpack_from('<I', data, pos)[0]
+    pos += 4
+    for _ in range(count):
+        length = struct.unpack_from('<I', data, pos)[0]
+        key, _, value = data[pos + 4:pos + 4 + length].partition(b"=")
+        pos += 4 + length
+        yield key, value
+
+def parse_vorbis_comment(data):
+    """Map the entries of a Vorbis comment block onto the tag fields."""
+    fields = {}
+    for key, value in iter_vorbis_comment(data):
+        name = NATIVE_KEYS.get(key.decode('utf-8', 'replace').lower())
+        if name:
+            fields.setdefault(name, []).append(value.decode('utf-8', 'replace'))
+    return fields
+
+def seek_vorbis_comment(f):
+    """Position f at the Vorbis comment block of a FLAC file, seeking past every other metadata block.
+
+    Picture blocks are never read. Returns the size of the block, 0 when the file has no Vorbis
+    comment and None when it is not a FLAC file.
+    """
+    magic = f.read(4)
+    if magic[:3] == b"ID3":
+        # Some taggers put an ID3v2 tag in front of the stream
+        header = magic + f.read(6)
+        f.seek(10 + synchsafe(header[6:10]))
+        magic = f.read(4)
+    if magic != b"fLaC":
+        return None
+    while True:
+        header = f.read(4)
+        if len(header) < 4:
+            raise UnsupportedTag("Truncated FLAC metadata")
+        size = int.from_bytes(header[1:4], 'big')
+        if header[0] & 0x7F == FLAC_VORBIS_COMMENT:
+            return size
+        if header[0] & 0x80:
+            # Last metadata block: the file has no tags
+            return 0
+        f.seek(size, 1)
+
+def read_flac(f):
+    """Read the Vorbis comment block of a FLAC file. Returns None when the file is not a FLAC file."""
+    size = seek_vorbis_comment(f)
+    if not size:
+        return size if size is None else {}
+    return parse_vorbis_comment(f.read(size))
+
+# Fast readers by file extension; everything else goes through mutagen
+FAST_READERS = {".mp3": read_id3v2, ".flac": read_flac}
+
+def text_values(value):
+    """Flatten a mutagen tag value to a list of strings."""
+    if isinstance(value, (list, tuple)):
+        return [text for item in value for text in text_values(item)]
+    return str(value).split("\x00")
+
+def read_tags_mutagen(path):
+    """Read the tag fields of any format mutagen understands, mapping its native keys."""
+    audio = File(path)
+    if audio is None:
+        raise ValueError("Unrecognized audio format")
+    tags = audio.tags
+    fields = {}
+    if tags is None:
+        return fields
+    if isinstance(tags, ID3):
+        for frame_id, name in ID3_FRAMES.items():
+            frames = tags.getall(frame_id)
+            if not frames:
+                continue
+            if name == "comment":
+                fields[name] = preferred_comment([(frame.desc, list(frame.text)) for frame in frames])
+            else:
+                fields[name] = [str(text) for text in frames[0].text]
+        return fields
+    for key, value in tags.items():
+        name = NATIVE_KEYS.get(key.lower())
+        if name:
+            fields.setdefault(name, []).extend(text_values(value))
+    return fields
+
+def read_tags(path):
+    """Read the tag fields of an audio file as {field: [values]}.
+
+    MP3 and FLAC files go through a fast reader that only reads the tag headers and the frames it
+    needs; other formats, and tags the fast readers do not handle, are read with mutagen.
+    """
+    reader = FAST_READERS.get(os.path.splitext(path)[1].lower())
+    if reader is not None:
+        try:
+            with open(path, 'rb') as f:
+                fields = reader(f)
+            if fields is not None:
+                return fields
+        except (UnsupportedTag, struct.error):
+            # Tags the fast reader does not handle, or truncated ones
+            pass
+    return read_tags_mutagen(path)
+
+def id3_frame_key(frame_id, body=None):
+    """Key a frame is listed under: its id, plus the description of user-defined text frames."""
+    if body and frame_id in ("TXXX", "TXX") and body[0] in ID3_ENCODINGS:
+        encoding, terminator = id3_encoding(body[0])
+        return f"{frame_id}:{split_values(body[1:], terminator)[0].decode(encoding, 'replace')}"
+    return frame_id
+
+def list_id3v2_keys(f):
+    """List the frames of an ID3v2 tag at the start of f, reading only the frame headers.
+
+    Only user-defined text frames are read, for their description. Returns (format, keys) or
+    None when the file has no ID3v2 tag; raises UnsupportedTag for unsynchronised tags.
+    """
+    header = read_id3v2_header(f)
+    if header is None:
+        return None
+    major, end = header
+    keys = []
+    for frame_id, size, frame_flags in iter_id3v2_frames(f, major, end):
+        if frame_id in ("TXXX", "TXX") and not frame_flags & ID3_UNSUPPORTED_FRAME_FLAGS.get(major, 0):
+            keys.append(id3_frame_key(frame_id, f.read(size)))
+        else:
+            keys.append(frame_id)
+    return f"ID3v2.{major}", keys
+
+def vorbis_comment_keys(data):
+    """List the keys of a Vorbis comment block, upper-cased as they are case-insensitive."""
+    return [key.decode('ascii', 'replace').upper() for key, _ in iter_vorbis_comment(data)]
+
+def list_flac_keys(f):
+    """List the Vorbis comment keys of a FLAC file. Returns (format, keys) or None when it is not FLAC."""
+    size = seek_vorbis_comment(f)
+    if size is None:
+        return None
+    return "Vorbis", vorbis_comment_keys(f.read(size)) if size else []
+
+# Fast key listers by file extension; everything else goes through mutagen
+FAST_KEY_LISTERS = {".mp3": list_id3v2_keys, ".flac": list_flac_keys}
+
+# Tag formats by mutagen tag class
+MUTAGEN_TAG_FORMATS = {
+    "VCFLACDict": "Vorbis", "OggVCommentDict": "Vorbis", "OggOpusVComment": "Vorbis", "OggSpeexVComment": "Vorbis",
+    "OggTheoraCommentDict": "Vorbis", "OggFLACVComment": "Vorbis", "MP4Tags": "MP4", "APEv2": "APEv2", "ASFTags": "ASF",
+}
+
+def list_tag_keys_mutagen(path):
+    """List the tag keys of any format mutagen understands."""
+    audio = File(path)
+    if audio is None:
+        raise ValueError("Unrecognized audio format")
+    tags = audio.tags
+    if tags is None:
+        return "none", []
+    if isinstance(tags, ID3):
+        keys = [f"TXXX:{frame.desc}" if frame.FrameID == "TXXX" else frame.FrameID for frame in tags.values()]
+        return f"ID3v2.{tags.version[1]}", keys
+    tag_format = MUTAGEN_TAG_FORMATS.get(type(tags).__name__, type(tags).__name__)
+    keys = [key.upper() if tag_format == "Vorbis" else key for key in tags.keys()]
+    return tag_format, keys
+
+def list_tag_keys(path):
+    """List the tag keys present in an audio file as (format, keys), without decoding any values.
+
+    Keys are frame ids for ID3v2 (with the description of TXXX frames) and native keys for the
+    other formats; each is listed once. MP3 and FLAC files only have their tag headers read.
+    """
+    lister = FAST_KEY_LISTERS.get(os.path.splitext(path)[1].lower())
+    listed = None
+    if lister is not None:
+        try:
+            with open(path, 'rb') as f:
+                listed = lister(f)
+        except (UnsupportedTag, struct.error):
+            pass
+    if listed is None:
+        listed = list_tag_keys_mutagen(path)
+    tag_format, keys = listed
+    return tag_format, list(dict.fromkeys(keys))
+
+def mapped_field(key):
+    """The tag field a listed key is read into, or None when it is not read."""
+    return ID3_FRAMES.get(key) or ID3V22_FRAMES.get(key) or NATIVE_KEYS.get(key.lower())
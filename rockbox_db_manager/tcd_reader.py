@@ -0,0 +1,203 @@
+import os
+import sys
+import mmap
+import hashlib
+import struct
+from array import array
+from rockbox_db_manager import profiling
+from rockbox_db_manager.tcd_writer import OFFSET_TABLE_SUFFIX, OFFSET_TABLE_MAGIC, OFFSET_TABLE_HEADER, TAG_FILES
+
+# Master index rows read at a time
+INDEX_CHUNK_ROWS = 1 << 14
+
+_unpack_length = struct.Struct('<I').unpack_from
+
+class TcdFormatError(ValueError):
+    """Raised when a .tcd entry does not fit in the file."""
+
+    def __init__(self, offset, message):
+        super().__init__(f"{message} at offset {offset}")
+        self.offset = offset
+
+class OffsetTable:
+    """Memory-mapped sidecar holding the offset of every entry of a sorted tag file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = self._file.seek(0, 2)
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        if size < OFFSET_TABLE_HEADER.size:
+            self.close()
+            raise TcdFormatError(0, "Truncated offset table header")
+        magic, self.count, self.tcd_size = OFFSET_TABLE_HEADER.unpack_from(self._mmap)
+        if magic != OFFSET_TABLE_MAGIC or size != OFFSET_TABLE_HEADER.size + 4 * self.count:
+            self.close()
+            raise TcdFormatError(0, "Not an offset table")
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        return _unpack_length(self._mmap, OFFSET_TABLE_HEADER.size + 4 * index)[0]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+        self._file.close()
+
+class TcdReader:
+    """Read-only, memory-mapped view of a .tcd tag file.
+
+    Entries are located lazily by walking the length prefixes; their bytes are exposed as
+    memoryview slices of the mapping and only decoded on demand, so even very large files are
+    read in constant memory. Entries can also be read directly by offset, e.g. from the master
+    index.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        self.size = self._file.seek(0, 2)
+        profiling.count("tcd_bytes_mapped", self.size)
+        # mmap cannot map an empty file
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self.size else None
+        self._view = memoryview(self._mmap) if self._mmap is not None else memoryview(b'')
+        self._offset_table = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self.size
+
+    def close(self):
+        if self._offset_table:
+            self._offset_table.close()
+        self._view.release()
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A caller still holds an entry view; the mapping is freed once it is released
+                pass
+        self._file.close()
+
+    def digest(self):
+        """Hash the file's content from the mapping; equal to sync.file_digest of the file."""
+        return hashlib.blake2b(self._view).hexdigest()
+
+    def entry_length(self, offset):
+        """Return the length of the entry starting at offset, checking it fits in the file."""
+        if offset + 4 > self.size:
+            raise TcdFormatError(offset, "Truncated length prefix")
+        length = _unpack_length(self._view, offset)[0]
+        if offset + 4 + length > self.size:
+            raise TcdFormatError(offset, f"Entry of {length} bytes runs past the end of the file")
+        return length
+
+    def entry(self, offset):
+        """Return the raw bytes of the entry at offset as a zero-copy memoryview."""
+        length = self.entry_length(offset)
+        return self._view[offset + 4:offset + 4 + length]
+
+    def decode_entry(self, offset, errors='ignore'):
+        """Decode the entry at offset to a string."""
+        return str(self.entry(offset), 'utf-8', errors)
+
+    def iter_entries(self, start=0):
+        """Yield the (offset, length) of every entry, without reading any entry data."""
+        offset = start
+        while offset < self.size:
+            length = self.entry_length(offset)
+            yield offset, length
+            offset += 4 + length
+
+    def iter_raw(self):
+        """Yield (offset, bytes) for every entry, the bytes as a zero-copy memoryview."""
+        view = self._view
+        for offset, length in self.iter_entries():
+            yield offset, view[offset + 4:offset + 4 + length]
+
+    def iter_strings(self, errors='ignore'):
+        """Yield (offset, length, string) for every entry, decoding each one as it is reached."""
+        view = self._view
+        for offset, length in self.iter_entries():
+            yield offset, length, str(view[offset + 4:offset + 4 + length], 'utf-8', errors)
+
+    def offset_table(self):
+        """Return the file's sidecar offset table, or None when it is missing or out of date."""
+        if self._offset_table is None:
+            self._offset_table = False
+            path = self.path + OFFSET_TABLE_SUFFIX
+            if os.path.exists(path):
+                try:
+                    table = OffsetTable(path)
+                except (OSError, TcdFormatError):
+                    return None
+                if table.tcd_size == self.size:
+                    self._offset_table = table
+                else:
+                    table.close()
+        return self._offset_table or None
+
+    def lookup(self, value):
+        """Find the entries equal to value ignoring case, as a list of (offset, string) pairs.
+
+        With a valid offset table, the sorted file is binary searched and only O(log n) entries are
+        decoded; otherwise every entry is scanned.
+        """
+        folded = value.casefold()
+        table = self.offset_table()
+        if table is None:
+            return [(offset, entry) for offset, _, entry in self.iter_strings() if entry.casefold() == folded]
+
+        low, high = 0, len(table)
+        while low < high:
+            middle = (low + high) // 2
+            if self.decode_entry(table[middle]).casefold() < folded:
+                low = middle + 1
+            else:
+                high = middle
+        matches = []
+        for index in range(low, len(table)):
+            entry = self.decode_entry(table[index])
+            if entry.casefold() != folded:
+                break
+            matches.append((table[index], entry))
+        return matches
+
+def index_track_count(path):
+    """Return the track count of a master index, checking it holds one full row per track."""
+    columns = len(TAG_FILES)
+    with open(path, 'rb') as f:
+        header = f.read(4)
+        size = os.fstat(f.fileno()).st_size
+    if len(header) < 4:
+        raise TcdFormatError(0, "Truncated index header")
+    tracks = _unpack_length(header)[0]
+    expected = 4 + tracks * columns * 4
+    if size != expected:
+        raise TcdFormatError(min(size, expected), f"Index holds {size} bytes, expected {expected} for {tracks} tracks")
+    return tracks
+
+def iter_index_rows(path, chunk_rows=INDEX_CHUNK_ROWS):
+    """Yield the rows of a master index as array('I') chunks of up to chunk_rows rows.
+
+    Rows are flattened, one offset per tag file in TAG_FILES order, so column c of a chunk is
+    chunk[c::len(TAG_FILES)]. Memory does not grow with the number of tracks.
+    """
+    with open(path, 'rb') as f:
+        f.seek(4)
+        while True:
+            chunk = f.read(chunk_rows * len(TAG_FILES) * 4)
+            if not chunk:
+                return
+            rows = array('I')
+            rows.frombytes(chunk)
+            if sys.byteorder != 'little':
+                rows.byteswap()
+            yield rows
@@ -0,0 +1,153 @@
+import os
+import sys
+import struct
+from array import array
+from itertools import accumulate, islice
+from rockbox_db_manager import profiling
+
+# Tag files generated for each tag, in Rockbox's tag order; also the columns of the master index
+TAG_FILES = {
+    'artist': 'database_0.tcd',
+    'album': 'database_1.tcd',
+    'genre': 'database_2.tcd',
+    'title': 'database_3.tcd',
+    'filename': 'database_4.tcd',
+    'composer': 'database_5.tcd',
+    'comment': 'database_6.tcd',
+    'albumartist': 'database_7.tcd',
+    'grouping': 'database_8.tcd'
+}
+# Master index: a track count followed by one row of tag file offsets per track
+INDEX_FILE = 'database_idx.tcd'
+
+# Size of the in-memory buffer entries are packed into before being flushed to disk
+WRITE_BUFFER_SIZE = 1 << 20
+# Number of entries encoded and length-prefixed together
+ENTRY_BATCH_SIZE = 4096
+
+# Sidecar holding the offset of every entry of a sorted tag file, for binary search
+OFFSET_TABLE_SUFFIX = ".offsets"
+OFFSET_TABLE_MAGIC = b"TCDX"
+OFFSET_TABLE_HEADER = struct.Struct('<4sII')  # magic, number of entries, size of the tag file
+
+_pack_length = struct.Struct('<I').pack
+
+def collation_key(value):
+    """Sort key of tag file entries: case-folded first, the exact string breaking ties."""
+    return value.casefold(), value
+
+def encode_string(value):
+    """Encode a tag string the way it is stored in a .tcd file."""
+    if not isinstance(value, str):
+        value = str(value)  # Ensure it's a string
+    return value.encode('utf-8')
+
+def entry_offsets(entries):
+    """Byte offset of every length-prefixed entry, as they would be laid out in a .tcd file."""
+    offsets = array('I')
+    offset = 0
+    for entry in entries:
+        offsets.append(offset)
+        offset += 4 + len(encode_string(entry))
+    return offsets
+
+class AtomicTcdWriter:
+    """Buffered writer for .tcd files that replaces the target atomically.
+
+    Data is packed into a preallocated bytearray and flushed in large chunks to a temporary file
+    next to the target. On a clean exit the temporary file is synced and renamed over the target;
+    on error it is removed, so a crash never leaves a half-written .tcd behind.
+    """
+
+    def __init__(self, path, buffer_size=None):
+        self.path = path
+        self.tmp_path = path + ".tmp"
+        self.buffer_size = buffer_size or WRITE_BUFFER_SIZE
+        self.offset = 0  # Bytes written so far, i.e. the offset of the next entry
+
+    def __enter__(self):
+        self._file = open(self.tmp_path, 'wb', buffering=0)
+        self._buffer = bytearray(self.buffer_size)
+        self._pos = 0
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            self._file.close()
+            self._discard()
+            return False
+        try:
+            # Flushing or syncing fails e.g. when the disk is full
+            self.flush()
+            os.fsync(self._file.fileno())
+            self._file.close()
+            os.replace(self.tmp_path, self.path)
+        except BaseException:
+            self._file.close()
+            self._discard()
+            raise
+        profiling.count("files_written")
+        profiling.count("bytes_written", self.offset)
+        return False
+
+    def _discard(self):
+        """Remove the temporary file, leaving the target as it was."""
+        if os.path.exists(self.tmp_path):
+            os.remove(self.tmp_path)
+
+    def flush(self):
+        """Write the buffered bytes to the temporary file."""
+        if self._pos:
+            self._file.write(memoryview(self._buffer)[:self._pos])
+            self._pos = 0
+
+    def write(self, data):
+        """Append raw bytes, flushing the buffer when it is full."""
+        size = len(data)
+        if self._pos + size > len(self._buffer):
+            self.flush()
+            if size >= len(self._buffer):
+                # Larger than the buffer: no point in copying it first
+                self._file.write(data)
+                self.offset += size
+                return
+        self._buffer[self._pos:self._pos + size] = data
+        self._pos += size
+        self.offset += size
+
+    def write_entries(self, entries):
+        """Append length-prefixed entries and return the offset of each one in the file.
+
+        Entries are encoded, length-prefixed and joined a batch at a time, which keeps the Python
+        work per entry to a few C-level calls.
+        """
+        offsets = array('I')
+        entries = iter(entries)
+        while True:
+            batch = [entry if type(entry) is str else str(entry) for entry in islice(entries, ENTRY_BATCH_SIZE)]
+            if not batch:
+                return offsets
+            encoded = [entry.encode('utf-8') for entry in batch]
+            lengths = list(map(len, encoded))
+
+            parts = [None] * (2 * len(encoded))
+            parts[0::2] = list(map(_pack_length, lengths))
+            parts[1::2] = encoded
+
+            # Each entry starts where the previous one (4-byte length + data) ends
+            offsets.extend(islice(accumulate(map((4).__add__, lengths), initial=self.offset), len(lengths)))
+            self.write(b''.join(parts))
+
+def write_tcd_entries(path, entries, buffer_size=None):
+    """Write the entries as a .tcd tag file and return the byte offset of every entry."""
+    with AtomicTcdWriter(path, buffer_size) as writer:
+        return writer.write_entries(entries)
+
+def write_offset_table(tcd_path, offsets, tcd_size):
+    """Write the sidecar offset table of a sorted tag file, replacing it atomically."""
+    with AtomicTcdWriter(tcd_path + OFFSET_TABLE_SUFFIX) as writer:
+        writer.write(OFFSET_TABLE_HEADER.pack(OFFSET_TABLE_MAGIC, len(offsets), tcd_size))
+        table = array('I', offsets)
+        if sys.byteorder != 'little':
+            table.byteswap()
+        writer.write(table.tobytes())
@@ -0,0 +1,70 @@
+import sys
+
+# Field order of a track record, matching the legacy 9-tuple and the cache's JSON lists
+TRACK_FIELDS = ("title", "artists", "album", "genre", "filename", "composer", "comment", "albumartist", "grouping")
+
+def intern_value(value):
+    """Intern strings so repeated values (defaults, artists, albums...) share a single object."""
+    return sys.intern(value) if type(value) is str else value
+
+class TrackRecord:
+    """Metadata of a single track.
+
+    Uses __slots__ instead of a per-instance dict, and interns every field that repeats across
+    tracks, so hundreds of thousands of records stay compact. Titles and filenames are nearly
+    always unique and are stored as-is.
+    """
+    __slots__ = TRACK_FIELDS
+
+    def __init__(self, title, artists, album, genre, filename, composer, comment, albumartist, grouping):
+        self.title = title
+        self.artists = tuple(intern_value(artist) for artist in artists)
+        self.album = intern_value(album)
+        self.genre = intern_value(genre)
+        self.filename = filename
+        self.composer = intern_value(composer)
+        self.comment = intern_value(comment)
+        self.albumartist = intern_value(albumartist)
+        self.grouping = intern_value(grouping)
+
+    @classmethod
+    def from_list(cls, values):
+        """Build a record from the positional list stored in the cache."""
+        return cls(*values)
+
+    def to_list(self):
+        """Serialize the record to the positional list stored in the cache."""
+        values = [getattr(self, field) for field in TRACK_FIELDS]
+        values[1] = list(self.artists)
+        return values
+
+    def __iter__(self):
+        # Allows positional unpacking like the legacy tuples
+        return (getattr(self, field) for field in TRACK_FIELDS)
+
+    def __eq__(self, other):
+        if not isinstance(other, TrackRecord):
+            return NotImplemented
+        return tuple(self) == tuple(other)
+
+    __hash__ = None
+
+    def __reduce__(self):
+        # Rebuild through __init__ so records coming back from worker processes are interned again
+        return (TrackRecord, tuple(self))
+
+    def __repr__(self):
+        fields = ", ".join(f"{field}={getattr(self, field)!r}" for field in TRACK_FIELDS)
+        return f"TrackRecord({fields})"
+
+def as_record(metadata):
+    """Return metadata as a TrackRecord, converting the cache's serialized list form if needed."""
+    if isinstance(metadata, TrackRecord):
+        return metadata
+    return TrackRecord.from_list(metadata)
+
+def encode_record(obj):
+    """json.dump default hook that serializes TrackRecords as positional lists."""
+    if isinstance(obj, TrackRecord):
+        return obj.to_list()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
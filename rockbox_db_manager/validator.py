@@ -0,0 +1,131 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from rockbox_db_manager.manifest import load_checksums, save_checksums, CHECKSUM_VERSION
+from rockbox_db_manager.sync import file_digest
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError, index_track_count, iter_index_rows
+from rockbox_db_manager.tcd_writer import TAG_FILES, INDEX_FILE
+
+# Tag files checked by validate --deep, in the order of the master index columns
+TAG_FILE_NAMES = list(TAG_FILES.values())
+
+def file_stamp(path):
+    """The [size, mtime_ns] of a file, used to skip hashing files untouched since the last validation."""
+    st = os.stat(path)
+    return [st.st_size, st.st_mtime_ns]
+
+def check_index_column(index_path, column, boundaries, size):
+    """Find the first track whose offset in the column does not start an entry of the tag file.
+
+    boundaries is a bitmap of the entry offsets. Returns (track, offset) or None when every
+    offset is valid.
+    """
+    columns = len(TAG_FILE_NAMES)
+    track = 0
+    for rows in iter_index_rows(index_path):
+        for offset in rows[column::columns]:
+            if offset >= size or not boundaries[offset >> 3] & (1 << (offset & 7)):
+                return track, offset
+            track += 1
+    return None
+
+def check_tag_file(task):
+    """Check one tag file, and its column of the master index; runs in a worker process.
+
+    task is (path, column, index_path, expected_digest). Every length prefix must fit in the file
+    and every entry must be valid UTF-8; with index_path, every offset of the file's column must
+    land on an entry. Files whose digest equals expected_digest are not checked again. The file is
+    hashed and walked through the same mapping, so it is only read once. Returns a result dict
+    with the first bad offset, if any.
+    """
+    path, column, index_path, expected_digest = task
+    result = {"file": os.path.basename(path), "entries": 0, "error": None, "bad_offset": None,
+              "skipped": False, "digest": None, "stamp": None}
+    try:
+        result["stamp"] = file_stamp(path)
+        with TcdReader(path) as reader:
+            result["digest"] = reader.digest()
+            if expected_digest is not None and result["digest"] == expected_digest:
+                result["skipped"] = True
+                return result
+            size = len(reader)
+            boundaries = bytearray((size >> 3) + 1)
+            offset = 0
+            try:
+                for offset, entry in reader.iter_raw():
+                    str(entry, 'utf-8')
+                    boundaries[offset >> 3] |= 1 << (offset & 7)
+                    result["entries"] += 1
+            except TcdFormatError as e:
+                result["error"], result["bad_offset"] = str(e), e.offset
+                return result
+            except UnicodeDecodeError as e:
+                result["error"], result["bad_offset"] = f"Invalid UTF-8 ({e.reason}) at offset {offset}", offset
+                return result
+        if index_path is not None:
+            bad = check_index_column(index_path, column, boundaries, size)
+            if bad is not None:
+                track, offset = bad
+                result["error"] = f"Track {track} of {INDEX_FILE} points at offset {offset}, which does not start an entry"
+                result["bad_offset"] = offset
+    except OSError as e:
+        result["error"] = str(e)
+    return result
+
+def deep_validate(db_dir, jobs=None):
+    """Check the structure of every tag file and of the master index, in parallel across files.
+
+    A checksum manifest of the files that passed is kept in the database directory. A tag file is
+    skipped when neither it nor the index changed since it passed: untouched files (same size and
+    modification time) are not even read, others only hashed. Returns {file: result}; a result's
+    bad_offset is the first bad offset found in that file.
+    """
+    checksums = load_checksums(db_dir)
+    previous = checksums["files"] if checksums.get("version") == CHECKSUM_VERSION else {}
+    results = {}
+
+    index_path = os.path.join(db_dir, INDEX_FILE)
+    index = {"file": INDEX_FILE, "entries": None, "error": None, "bad_offset": None, "skipped": False, "digest": None, "stamp": None}
+    if os.path.exists(index_path):
+        index["stamp"] = file_stamp(index_path)
+        recorded = previous.get(INDEX_FILE)
+        index["digest"] = recorded["digest"] if recorded and recorded["stamp"] == index["stamp"] else file_digest(index_path)
+        try:
+            index["entries"] = index_track_count(index_path)
+        except TcdFormatError as e:
+            index["error"], index["bad_offset"] = str(e), e.offset
+    else:
+        index["error"] = f"{INDEX_FILE} not found"
+    index_ok = index["error"] is None
+    index_unchanged = index_ok and previous.get(INDEX_FILE, {}).get("digest") == index["digest"]
+    results[INDEX_FILE] = index
+
+    tasks = []
+    for column, name in enumerate(TAG_FILE_NAMES):
+        path = os.path.join(db_dir, name)
+        if not os.path.exists(path):
+            results[name] = {"file": name, "entries": None, "error": f"{name} not found", "bad_offset": None,
+                             "skipped": False, "digest": None, "stamp": None}
+            continue
+        recorded = previous.get(name) if index_unchanged else None
+        if recorded and recorded["stamp"] == file_stamp(path):
+            results[name] = {"file": name, "entries": recorded["entries"], "error": None, "bad_offset": None,
+                             "skipped": True, "digest": recorded["digest"], "stamp": recorded["stamp"]}
+            continue
+        tasks.append((path, column, index_path if index_ok else None, recorded["digest"] if recorded else None))
+
+    jobs = jobs or min(len(tasks), os.cpu_count() or 1)
+    if jobs > 1 and len(tasks) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            checked = list(pool.map(check_tag_file, tasks))
+    else:
+        checked = [check_tag_file(task) for task in tasks]
+    for result in checked:
+        if result["skipped"]:
+            result["entries"] = previous[result["file"]]["entries"]
+        results[result["file"]] = result
+
+    # Only files that passed are recorded; bad ones are checked again every time
+    passed = {name: {"stamp": result["stamp"], "digest": result["digest"], "entries": result["entries"]}
+              for name, result in results.items() if result["error"] is None and result["digest"] is not None}
+    save_checksums(db_dir, {"version": CHECKSUM_VERSION, "files": passed})
+    return {name: results[name] for name in TAG_FILE_NAMES + [INDEX_FILE]}
@@ -0,0 +1,230 @@
+import os
+import time
+import logging
+import threading
+from rockbox_db_manager import scanner
+from rockbox_db_manager.cache import get_cache, save_cache
+from rockbox_db_manager.config import load_config
+from rockbox_db_manager.database import build_tag_data, write_changed_database_files
+from rockbox_db_manager.manifest import MANIFEST_VERSION, load_manifest, save_manifest, snapshot_listing, diff_listing, options_digest
+
+try:
+    # Optional: inotify (and the other native backends) through watchdog
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Seconds without a new change before a burst of changes (e.g. an album import) is applied
+DEBOUNCE_SECONDS = 2.0
+# Longest a continuous stream of changes can hold back a database update
+MAX_DELAY_SECONDS = 30.0
+# Seconds between two snapshots of the library when no filesystem events are available
+POLL_INTERVAL = 10.0
+# Granularity of the watch loop
+TICK_SECONDS = 0.5
+
+class ChangeHandler(FileSystemEventHandler):
+    """Forward filesystem events for the library to the watcher."""
+
+    def __init__(self, watcher):
+        super().__init__()
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        if event.is_directory and event.event_type not in ("created", "deleted", "moved"):
+            # A directory's own modification only means its listing changed; the entries report themselves
+            return
+        for path in (event.src_path, getattr(event, "dest_path", None)):
+            if path and (event.is_directory or self.watcher.is_music_file(path)):
+                self.watcher.mark_changed(os.fsdecode(path))
+
+class LibraryWatcher:
+    """Keep the database of a music directory up to date from filesystem changes.
+
+    The metadata of every track stays in memory between updates. Changed paths, reported by
+    watchdog when it is installed or found by comparing polling snapshots otherwise, are collected
+    in a set, so repeated writes to a file and both sides of a rename coalesce into one update per
+    path. Once no change arrived for `debounce` seconds, or changes kept arriving for `max_delay`
+    seconds, only those paths are read again and the database files whose content changed are
+    rewritten.
+    """
+
+    def __init__(self, output_dir, music_dir, config_file, exclude=None, only_artist=None, only_album=None, jobs=1,
+                 debounce=DEBOUNCE_SECONDS, max_delay=MAX_DELAY_SECONDS, poll_interval=POLL_INTERVAL):
+        self.output_dir = output_dir
+        self.music_dir = music_dir
+        self.config = load_config(config_file)
+        self.options = options_digest(config_file, exclude, only_artist, only_album)
+        self.exclude = exclude
+        self.only_artist = only_artist
+        self.only_album = only_album
+        self.jobs = jobs
+        self.debounce = debounce
+        self.max_delay = max_delay
+        self.poll_interval = poll_interval
+        self.extensions, self.dir_pattern = scanner.compile_exclusions(exclude)
+        self.cache = get_cache(root=music_dir)
+
+        self.tracks = {}   # path -> TrackRecord of every track passing the filters
+        self.listing = {}  # path -> [mtime, size] of every supported file, as in the manifest
+        self.digests = {}
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._first_change = None
+        self._last_change = None
+
+    def is_music_file(self, path):
+        """Check a path against the supported formats and the exclusion rules."""
+        path = os.fsdecode(path)
+        if os.path.splitext(path)[1].lower() not in self.extensions:
+            return False
+        return not (self.dir_pattern and self.dir_pattern.search(os.path.dirname(path)))
+
+    def mark_changed(self, path):
+        """Record a changed path; safe to call from the event thread."""
+        now = time.monotonic()
+        with self._lock:
+            self._changed.add(path)
+            if self._first_change is None:
+                self._first_change = now
+            self._last_change = now
+
+    def is_due(self, now=None):
+        """Whether the pending changes have settled, or have waited long enough, to be applied."""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            if not self._changed:
+                return False
+            return now - self._last_change >= self.debounce or now - self._first_change >= self.max_delay
+
+    def _read(self, entries):
+        """Extract the metadata of (path, stat_result) entries into the in-memory tracks."""
+        for path, st in entries:
+            self.listing[path] = [st.st_mtime, st.st_size]
+        tracks = scanner.iter_tracks(self.music_dir, self.cache, only_artist=self.only_artist, only_album=self.only_album,
+                                     jobs=self.jobs, files=entries)
+        for path, file_metadata in tracks:
+            self.tracks[path] = file_metadata
+        save_cache(self.cache)
+
+    def _forget(self, path):
+        """Drop a path, or every path under it when it was a directory."""
+        if path in self.listing:
+            del self.listing[path]
+            self.tracks.pop(path, None)
+            return
+        prefix = path + os.sep
+        for file in [file for file in self.listing if file.startswith(prefix)]:
+            del self.listing[file]
+            self.tracks.pop(file, None)
+
+    def build(self):
+        """Scan the whole library once and write the database."""
+        entries = list(scanner.iter_music_entries(self.music_dir, self.exclude))
+        previous = load_manifest(self.output_dir)
+        # Digests are only comparable when the options did not change
+        self.digests = previous["tags"] if previous["options"] == self.options else {}
+        self.listing = {}
+        self.tracks = {}
+        self._read(entries)
+        self.write()
+
+    def poll(self):
+        """Compare a fresh snapshot of the library with the known files and mark the differences."""
+        listing = snapshot_listing(scanner.iter_music_entries(self.music_dir, self.exclude))
+        added, removed, changed = diff_listing(self.listing, listing)
+        for path in added + removed + changed:
+            self.mark_changed(path)
+        return len(added) + len(removed) + len(changed)
+
+    def apply_changes(self):
+        """Re-read every changed path and update the in-memory tracks. Returns the number of paths applied."""
+        with self._lock:
+            changed, self._changed = self._changed, set()
+            self._first_change = self._last_change = None
+
+        entries = []
+        for path in sorted(changed):
+            self._forget(path)
+            if os.path.isdir(path):
+                # A directory was created or moved in: pick up everything inside it
+                entries.extend(scanner.iter_music_entries(path, self.exclude))
+            elif self.is_music_file(path):
+                try:
+                    entries.append((path, os.stat(path)))
+                except FileNotFoundError:
+                    # Deleted, or the source of a rename
+                    pass
+        self._read(entries)
+        logging.info("Applied %s changed paths, %s files read", len(changed), len(entries))
+        return len(changed)
+
+    def write(self):
+        """Aggregate the in-memory tracks and rewrite the database files whose content changed.
+
+        When no track is left, an empty database is written, so the device and the manifest never
+        keep tracks that are gone.
+        """
+        ordered = sorted(self.tracks, key=scanner.walk_order_key)
+        tag_data, track_count = build_tag_data(((path, self.tracks[path]) for path in ordered), self.config)
+        if not track_count:
+            logging.warning("No supported audio files left in the directory: %s. Writing an empty database.", self.music_dir)
+        self.digests, written = write_changed_database_files(self.output_dir, tag_data, self.digests)
+        # Keep the manifest current so a later create-db --incremental starts from here
+        save_manifest(self.output_dir, {
+            "version": MANIFEST_VERSION,
+            "files": self.listing,
+            "tags": self.digests,
+            "options": self.options,
+            "track_count": track_count
+        })
+        logging.info("Database updated: %s files rewritten for %s tracks", len(written), track_count)
+        return written
+
+    def flush(self):
+        """Apply the pending changes and write the database if there were any."""
+        if self.apply_changes():
+            return self.write()
+        return []
+
+    def run(self, stop_event=None):
+        """Build the database, then keep it up to date until interrupted or stop_event is set."""
+        stop_event = stop_event or threading.Event()
+        self.build()
+
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(ChangeHandler(self), self.music_dir, recursive=True)
+            observer.start()
+            logging.info("Watching %s for filesystem events", self.music_dir)
+        else:
+            logging.info("watchdog is not installed; polling %s every %s seconds", self.music_dir, self.poll_interval)
+
+        next_poll = time.monotonic() + self.poll_interval
+        try:
+            while not stop_event.wait(TICK_SECONDS):
+                now = time.monotonic()
+                if observer is None and now >= next_poll:
+                    self.poll()
+                    next_poll = time.monotonic() + self.poll_interval
+                if self.is_due(now):
+                    self.flush()
+        except KeyboardInterrupt:
+            logging.info("Stopping watch mode")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+            self.flush()
+
+def watch_library(output_dir, music_dir, config_file, **options):
+    """Build the database for a music directory and keep it updated as the library changes."""
+    music_dir = scanner.resolve_music_directory(music_dir)
+    if music_dir is None:
+        return None
+    watcher = LibraryWatcher(output_dir, music_dir, config_file, **options)
+    watcher.run()
+    return watcher
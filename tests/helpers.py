@@ -0,0 +1,14 @@
+import os
+from unittest.mock import patch
+
+def isolate_cache(test, directory):
+    """Keep a test's metadata cache in directory, starting with no cache loaded.
+
+    The patches are undone when the test finishes.
+    """
+    for name, value in [("CACHE_FILE", os.path.join(directory, "cache.db")),
+                        ("JSON_CACHE_FILE", os.path.join(directory, "cache.json")),
+                        ("CACHE_DIR", None), ("_shared_cache", None)]:
+        cache_patch = patch(f"rockbox_db_manager.cache.{name}", value)
+        cache_patch.start()
+        test.addCleanup(cache_patch.stop)
@@ -0,0 +1,115 @@
+import asyncio
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import async_scan, bench, cache, scanner
+from rockbox_db_manager.database import create_rockbox_database
+from helpers import isolate_cache
+
+# Simulated round trip of a network mount, per filesystem call
+LATENCY = 0.02
+
+class LatentFileSystem(async_scan.LocalFileSystem):
+    """Local filesystem where every call takes LATENCY seconds, recording how many overlap."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.calls = 0
+
+    def delayed(self, func, *args):
+        with self.lock:
+            self.calls += 1
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            time.sleep(LATENCY)
+            return func(*args)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    def list_dir(self, path):
+        return self.delayed(super().list_dir, path)
+
+    def stat(self, path):
+        return self.delayed(super().stat, path)
+
+    def read_metadata(self, path):
+        return self.delayed(super().read_metadata, path)
+
+    def fingerprint(self, path, size):
+        return self.delayed(super().fingerprint, path, size)
+
+class TestAsyncScan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.music_dir = os.path.join(self.tmp.name, "music")
+        bench.generate_library(self.music_dir, 40, tracks_per_album=5, albums_per_artist=2)
+        isolate_cache(self, self.tmp.name)
+
+    def test_latency_is_overlapped(self):
+        """With injected latency the calls overlap, up to the limit, and give the serial results."""
+        fs = LatentFileSystem()
+        store = {}
+        start = time.perf_counter()
+        tracks = asyncio.run(async_scan.scan_tracks_async(self.music_dir, store, concurrency=8, fs=fs))
+        elapsed = time.perf_counter() - start
+
+        serial = list(scanner.iter_tracks(self.music_dir, {}))
+        self.assertEqual([path for path, _ in tracks], [path for path, _ in serial])
+        self.assertEqual([tuple(metadata) for _, metadata in tracks], [tuple(metadata) for _, metadata in serial])
+        self.assertEqual(len(store), 40)
+
+        # Listings, then a stat, a tag read and a fingerprint per file, one round trip each
+        self.assertGreater(fs.calls, 120)
+        self.assertLessEqual(fs.max_in_flight, 8)
+        self.assertGreater(fs.max_in_flight, 1)
+        self.assertLess(elapsed, fs.calls * LATENCY / 3)
+
+    def test_cached_files_are_not_read(self):
+        """A warm cache only costs the listings and stats."""
+        store = {}
+        asyncio.run(async_scan.scan_tracks_async(self.music_dir, store))
+        fs = LatentFileSystem()
+        with patch.object(fs, "read_metadata") as mock_read:
+            tracks = asyncio.run(async_scan.scan_tracks_async(self.music_dir, store, fs=fs))
+        mock_read.assert_not_called()
+        self.assertEqual(len(tracks), 40)
+
+    def test_cache_is_used_off_the_event_loop(self):
+        """Cache lookups, which may hash files to recognize moves, never run on the event loop thread."""
+        threads = set()
+        lookup = async_scan.get_file_metadata_from_cache
+
+        def recording_lookup(*args):
+            threads.add(threading.get_ident())
+            return lookup(*args)
+
+        store = cache.get_cache(root=self.music_dir)
+        with patch("rockbox_db_manager.async_scan.get_file_metadata_from_cache", side_effect=recording_lookup):
+            tracks = asyncio.run(async_scan.scan_tracks_async(self.music_dir, store))
+        cache.save_cache(store)
+        self.assertEqual(len(tracks), 40)
+        self.assertEqual(len(threads), 1)
+        self.assertNotIn(threading.get_ident(), threads)
+
+    def test_create_db_output_matches_serial(self):
+        """create-db writes the same files through the asyncio path."""
+        outputs = {}
+        for async_io in (0, 4):
+            outputs[async_io] = os.path.join(self.tmp.name, f"out_{async_io}")
+            with patch("rockbox_db_manager.cache._shared_cache", None):
+                create_rockbox_database(outputs[async_io], self.music_dir, "missing-config.json", async_io=async_io)
+        for name in sorted(os.listdir(outputs[0])):
+            with open(os.path.join(outputs[0], name), "rb") as serial, open(os.path.join(outputs[4], name), "rb") as overlapped:
+                self.assertEqual(serial.read(), overlapped.read(), name)
+
+if __name__ == '__main__':
+    unittest.main()
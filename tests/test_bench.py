@@ -0,0 +1,51 @@
+import os
+import tempfile
+import unittest
+from mutagen import File
+from rockbox_db_manager import bench, cache
+from rockbox_db_manager.track import TrackRecord
+from helpers import isolate_cache
+
+class TestBench(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        isolate_cache(self, self.tmp.name)
+
+    def test_generate_library(self):
+        """The synthetic library holds tagged MP3 and FLAC files laid out by artist and album."""
+        with tempfile.TemporaryDirectory() as tmp:
+            bench.generate_library(tmp, 20, flac_ratio=0.5, cover_size=256)
+            files = sorted(os.path.join(root, name) for root, _, names in os.walk(tmp) for name in names)
+            self.assertEqual(len(files), 20)
+            extensions = {os.path.splitext(f)[1] for f in files}
+            self.assertEqual(extensions, {".mp3", ".flac"})
+
+            mp3 = File(next(f for f in files if f.endswith(".mp3")))
+            self.assertTrue(str(mp3["TALB"]).startswith("Album "))
+            self.assertEqual(len(mp3.tags.getall("APIC")[0].data), 256)
+            flac = File(next(f for f in files if f.endswith(".flac")))
+            self.assertTrue(flac["album"][0].startswith("Album "))
+            self.assertEqual(len(flac.pictures[0].data), 256)
+
+    def test_run_benchmarks(self):
+        """Every stage is timed and the cache settings are restored afterwards."""
+        cache_file = cache.CACHE_FILE
+        results = bench.run_benchmarks(tracks=12, repeat=2, config_file="missing-config.json")
+        self.assertEqual(cache.CACHE_FILE, cache_file)
+        self.assertEqual(results["parameters"]["tracks"], 12)
+        self.assertEqual(set(results["stages"]), {"generate", "cold_scan", "warm_scan", "write_tcd", "read_tcd", "analyze_db"})
+        self.assertEqual(len(results["stages"]["cold_scan"]["runs"]), 2)
+        self.assertLessEqual(results["stages"]["warm_scan"]["min"], results["stages"]["warm_scan"]["median"])
+
+    def test_shared_cache_usable_after_benchmarks(self):
+        """The cache loaded before a benchmark is saved and can be used again afterwards."""
+        store = cache.get_cache()
+        store["track.mp3"] = {"mtime": 0, "metadata": TrackRecord("Title", ["Artist"], "Album", "Genre", "track.mp3", "", "", "", "")}
+        bench.run_benchmarks(tracks=2, repeat=1, config_file="missing-config.json")
+        self.assertEqual(list(cache.get_cache()), ["track.mp3"])
+        cache.get_cache().close()
+
+if __name__ == '__main__':
+    unittest.main()
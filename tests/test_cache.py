@@ -0,0 +1,257 @@
+import json
+import logging
+import os
+import shutil
+import tempfile
+import unittest
+from concurrent.futures import ProcessPoolExecutor
+from unittest.mock import patch
+from rockbox_db_manager import bench, cache, metadata
+from rockbox_db_manager.cli import main
+from rockbox_db_manager.track import TrackRecord
+from helpers import isolate_cache
+
+METADATA = TrackRecord("Title", ["Artist"], "Album", "Genre", "track.mp3", "Composer", "Comment", "Artist", "Grouping")
+
+def commit_json_entries(path, worker, count):
+    """Commit count entries one at a time to a JSON cache shared with other processes."""
+    store = cache.JsonCache(path)
+    for i in range(count):
+        store[f"{worker}/{i}.mp3"] = {"mtime": i, "metadata": METADATA.to_list()}
+        store.commit()
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        isolate_cache(self, self.tmp.name)
+        self.db_path = cache.CACHE_FILE
+        self.json_path = cache.JSON_CACHE_FILE
+        self.track = os.path.join(self.tmp.name, "track.mp3")
+        open(self.track, "wb").close()
+
+    def test_sqlite_entries_persist_only_after_commit(self):
+        """Staged updates are visible immediately but only written by save_cache."""
+        store = cache.load_cache()
+        cache.update_file_metadata_in_cache(store, self.track, METADATA)
+        self.assertEqual(cache.get_file_metadata_from_cache(store, self.track), METADATA)
+
+        uncommitted = cache.SQLiteCache(self.db_path)
+        self.assertNotIn(self.track, uncommitted)
+        uncommitted.close()
+
+        cache.save_cache(store)
+        store.close()
+        reopened = cache.load_cache()
+        entry = reopened[self.track]
+        self.assertEqual(entry["metadata"], METADATA.to_list())
+        self.assertEqual(entry["size"], 0)
+        self.assertEqual(entry["inode"], os.stat(self.track).st_ino)
+        reopened.close()
+
+    def test_stale_entry_is_ignored(self):
+        """A changed modification time invalidates the cached entry."""
+        store = cache.load_cache()
+        cache.update_file_metadata_in_cache(store, self.track, METADATA)
+        os.utime(self.track, (0, 0))
+        self.assertIsNone(cache.get_file_metadata_from_cache(store, self.track))
+        store.close()
+
+    def test_json_cache_is_migrated_once(self):
+        """A legacy JSON cache is imported when the SQLite store is created."""
+        with open(self.json_path, "w") as f:
+            json.dump({self.track: {"mtime": os.path.getmtime(self.track), "version": cache.METADATA_VERSION, "metadata": METADATA.to_list()}}, f)
+
+        store = cache.load_cache()
+        self.assertEqual(cache.get_file_metadata_from_cache(store, self.track), METADATA)
+        del store[self.track]
+        store.commit()
+        store.close()
+
+        # The existing store is reused; the JSON file is not imported again
+        store = cache.load_cache()
+        self.assertEqual(len(store), 0)
+        store.close()
+
+    def test_json_backend(self):
+        """The legacy JSON backend still round-trips through the same API."""
+        store = cache.load_cache(backend="json")
+        cache.update_file_metadata_in_cache(store, self.track, METADATA)
+        cache.save_cache(store)
+        self.assertEqual(cache.load_cache(backend="json")[self.track]["metadata"], METADATA.to_list())
+
+    def test_records_are_interned(self):
+        """Records read back from the cache share repeated strings."""
+        first = TrackRecord.from_list(json.loads(json.dumps(METADATA.to_list())))
+        second = TrackRecord.from_list(json.loads(json.dumps(METADATA.to_list())))
+        self.assertEqual(first, METADATA)
+        self.assertIs(first.genre, second.genre)
+        self.assertIs(first.artists[0], second.artists[0])
+
+    def test_renamed_file_reuses_entry(self):
+        """A renamed file is found by size and inode and its entry moves to the new path."""
+        with open(self.track, "wb") as f:
+            f.write(b"audio" * 100)
+        store = cache.load_cache()
+        cache.update_file_metadata_in_cache(store, self.track, METADATA)
+        store.commit()
+
+        renamed = os.path.join(self.tmp.name, "renamed.mp3")
+        os.rename(self.track, renamed)
+        with patch("rockbox_db_manager.cache.file_fingerprint") as fingerprint:
+            metadata = cache.get_file_metadata_from_cache(store, renamed)
+        fingerprint.assert_not_called()
+        self.assertEqual(metadata.title, "Title")
+        self.assertEqual(metadata.filename, "renamed.mp3")
+        self.assertNotIn(self.track, store)
+        self.assertIn(renamed, store)
+        store.close()
+
+    def test_copied_file_matches_fingerprint(self):
+        """A file moved with a new inode and mtime is recognized by its content fingerprint."""
+        with open(self.track, "wb") as f:
+            f.write(os.urandom(3 * cache.FINGERPRINT_CHUNK))
+        store = cache.load_cache(backend="json")
+        cache.update_file_metadata_in_cache(store, self.track, METADATA)
+
+        copy = os.path.join(self.tmp.name, "copy.mp3")
+        shutil.copyfile(self.track, copy)
+        os.utime(copy, (0, 0))
+        # The original is still there, so the copy is a file of its own
+        self.assertIsNone(cache.get_file_metadata_from_cache(store, copy))
+        os.remove(self.track)
+        self.assertEqual(cache.get_file_metadata_from_cache(store, copy).filename, "copy.mp3")
+        self.assertNotIn(self.track, store)
+
+        # Same size, different content
+        other = os.path.join(self.tmp.name, "other.mp3")
+        with open(other, "wb") as f:
+            f.write(os.urandom(3 * cache.FINGERPRINT_CHUNK))
+        self.assertIsNone(cache.get_file_metadata_from_cache(store, other))
+
+    def test_libraries_laid_out_alike_share_the_default_store(self):
+        """The single cache file keeps absolute keys, so libraries with the same layout stay warm side by side."""
+        libraries = [os.path.join(self.tmp.name, name) for name in ("libA", "libD")]
+        records = [TrackRecord(f"Title {i}", ["Artist"], "Album", "Genre", "01.mp3", "", "", "", "") for i in range(2)]
+        for library, record in zip(libraries, records):
+            os.makedirs(os.path.join(library, "Album"))
+            shutil.copy2(self.track, os.path.join(library, "Album", "01.mp3"))
+            store = cache.get_cache(root=library)
+            cache.update_file_metadata_in_cache(store, os.path.join(library, "Album", "01.mp3"), record)
+        cache.save_cache(store)
+        for library, record in zip(libraries, records):
+            store = cache.get_cache(root=library)
+            with patch("rockbox_db_manager.cache.find_moved_entry") as find_moved:
+                self.assertEqual(cache.get_file_metadata_from_cache(store, os.path.join(library, "Album", "01.mp3")), record)
+            find_moved.assert_not_called()
+        self.assertEqual(sorted(store), sorted(os.path.join(library, "Album", "01.mp3") for library in libraries))
+
+        # A moved library is followed through the fingerprint index
+        moved = os.path.join(self.tmp.name, "mnt", "libA")
+        os.makedirs(os.path.dirname(moved))
+        shutil.move(libraries[0], moved)
+        store = cache.get_cache(root=moved)
+        self.assertEqual(cache.get_file_metadata_from_cache(store, os.path.join(moved, "Album", "01.mp3")).title, "Title 0")
+        self.assertNotIn(os.path.join(libraries[0], "Album", "01.mp3"), store)
+        store.close()
+
+    def test_libraries_get_separate_shards(self):
+        """Libraries with the same layout keep their own entries, and only changed shards are written."""
+        libraries = [os.path.join(self.tmp.name, name, "music") for name in ("player1", "player2")]
+        for library in libraries:
+            os.makedirs(library)
+            shutil.copy2(self.track, os.path.join(library, "track.mp3"))
+        shard_dir = os.path.join(self.tmp.name, "shards")
+        records = [TrackRecord(f"Title {i}", ["Artist"], "Album", "Genre", "track.mp3", "", "", "", "") for i in range(2)]
+
+        for backend in ("sqlite", "json"):
+            with patch("rockbox_db_manager.cache.CACHE_BACKEND", backend):
+                cache.set_cache_dir(shard_dir)
+                for library, record in zip(libraries, records):
+                    store = cache.get_cache(root=library)
+                    cache.update_file_metadata_in_cache(store, os.path.join(library, "track.mp3"), record)
+                cache.save_cache(store)
+                shards = [store.shard(library).path for library in libraries]
+                self.assertEqual(len(set(shards)), 2)
+
+                cache.set_cache_dir(shard_dir)
+                for library, record in zip(libraries, records):
+                    store = cache.get_cache(root=library)
+                    self.assertEqual(cache.get_file_metadata_from_cache(store, os.path.join(library, "track.mp3")), record)
+
+                os.utime(shards[1], (0, 0))
+                store = cache.get_cache(root=libraries[0])
+                cache.update_file_metadata_in_cache(store, os.path.join(libraries[0], "other.mp3"), records[0], os.stat(self.track))
+                cache.save_cache(store)
+                self.assertEqual(os.path.getmtime(shards[1]), 0)
+                self.assertIn("other.mp3", store.shard(libraries[0]))
+                cache.set_cache_dir(None)
+                shutil.rmtree(shard_dir)
+
+    def test_moved_library_takes_over_its_shard(self):
+        """With --cache-dir, a moved library reuses its old entries by fingerprint, and a copy gets its own shard."""
+        library = os.path.join(self.tmp.name, "old", "music")
+        bench.generate_library(library, 3)
+        library_files = sorted(os.path.relpath(os.path.join(path, name), library) for path, _, names in os.walk(library) for name in names)
+        shard_dir = os.path.join(self.tmp.name, "shards")
+        self.addCleanup(cache.set_cache_dir, None)
+        self.addCleanup(logging.getLogger().setLevel, logging.getLogger().level)
+        self.addCleanup(setattr, logging.getLogger(), "handlers", logging.getLogger().handlers[:])
+
+        def create_db(music_dir):
+            args = ["main.py", "--cache-dir", shard_dir, "create-db", os.path.join(self.tmp.name, "out"), music_dir,
+                    "--config", os.path.join(self.tmp.name, "missing.json")]
+            with patch("sys.argv", args), patch("rockbox_db_manager.metadata.read_metadata", wraps=metadata.read_metadata) as mock_read:
+                main()
+            return mock_read.call_count
+
+        def shard_sizes():
+            store = cache.ShardedCache(shard_dir)
+            sizes = {name: len(store._open(name)) for name in store.libraries()}
+            store.close()
+            return sizes
+
+        self.assertEqual(create_db(library), 3)
+        moved = os.path.join(self.tmp.name, "new", "renamed")
+        os.makedirs(os.path.dirname(moved))
+        shutil.move(library, moved)
+        self.assertEqual(create_db(moved), 0)
+        self.assertEqual(sorted(shard_sizes().values()), [0, 3])
+
+        # A copy is another library: parsed into its own shard, leaving the original's entries alone
+        copy = os.path.join(self.tmp.name, "copy")
+        shutil.copytree(moved, copy)
+        self.assertEqual(create_db(copy), 3)
+        self.assertEqual(create_db(moved), 0)
+        self.assertEqual(sorted(shard_sizes().values()), [0, 3, 3])
+
+        # Nothing is written into the libraries themselves
+        for root in (moved, copy):
+            self.assertEqual(sorted(os.path.relpath(os.path.join(path, name), root) for path, _, names in os.walk(root) for name in names), library_files)
+
+    def test_concurrent_json_commits_are_merged(self):
+        """Processes committing to the same JSON cache keep each other's entries."""
+        with ProcessPoolExecutor(max_workers=4) as pool:
+            list(pool.map(commit_json_entries, [self.json_path] * 4, range(4), [10] * 4))
+        store = cache.JsonCache(self.json_path)
+        self.assertEqual(len(store), 40)
+
+        # Deletions are merged too
+        other = cache.JsonCache(self.json_path)
+        del store["0/0.mp3"]
+        other["4/0.mp3"] = {"mtime": 0, "metadata": METADATA.to_list()}
+        store.commit()
+        other.commit()
+        self.assertEqual(len(cache.JsonCache(self.json_path)), 40)
+        self.assertNotIn("0/0.mp3", cache.JsonCache(self.json_path))
+
+    def test_clear_cache_removes_files(self):
+        """clear_cache removes the store and forgets the shared cache."""
+        cache.get_cache().commit()
+        cache.clear_cache()
+        self.assertFalse(os.path.exists(self.db_path))
+        self.assertIsNone(cache._shared_cache)
+
+if __name__ == '__main__':
+    unittest.main()
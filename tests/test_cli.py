@@ -10,7 +10,40 @@ class TestCLI(unittest.TestCase):
         test_args = ["create-db", "output", "music", "--config", "config.json"]
         with patch("sys.argv", ["main.py"] + test_args):
             main()
-        mock_create_db.assert_called_once_with("output", "music", "config.json")
+        mock_create_db.assert_called_once_with(
+            "output", "music", "config.json",
+            verbose=False, show_songs=False, dry_run=False, exclude=None,
+            only_artist=None, only_album=None, jobs=1, incremental=False, offset_tables=False, async_io=0
+        )
+
+    @patch("rockbox_db_manager.cli.database.create_rockbox_database")
+    def test_create_db_jobs_option(self, mock_create_db):
+        """Test that --jobs is passed through to create-db."""
+        test_args = ["create-db", "output", "music", "--jobs", "4"]
+        with patch("sys.argv", ["main.py"] + test_args):
+            main()
+        self.assertEqual(mock_create_db.call_args.kwargs["jobs"], 4)
+
+    @patch("rockbox_db_manager.cli.cache.set_cache_dir")
+    @patch("rockbox_db_manager.cli.database.create_rockbox_database")
+    def test_cache_dir_option(self, mock_create_db, mock_set_cache_dir):
+        """Test that --cache-dir selects the sharded cache before the command runs."""
+        test_args = ["--cache-dir", "/tmp/cache", "create-db", "output", "music"]
+        with patch("sys.argv", ["main.py"] + test_args):
+            main()
+        mock_set_cache_dir.assert_called_once_with("/tmp/cache")
+        mock_create_db.assert_called_once()
+
+    @patch("rockbox_db_manager.cli.watcher.watch_library")
+    def test_watch_command(self, mock_watch):
+        """Test the watch command."""
+        test_args = ["watch", "output", "music", "--debounce", "5"]
+        with patch("sys.argv", ["main.py"] + test_args):
+            main()
+        mock_watch.assert_called_once_with(
+            "output", "music", "config.json",
+            exclude=None, only_artist=None, only_album=None, jobs=1, debounce=5.0, poll_interval=10.0
+        )
 
     @patch("rockbox_db_manager.cli.database.validate_database")
     def test_validate_command(self, mock_validate):
@@ -18,7 +51,7 @@ class TestCLI(unittest.TestCase):
         test_args = ["validate", "output"]
         with patch("sys.argv", ["main.py"] + test_args):
             main()
-        mock_validate.assert_called_once_with("output")
+        mock_validate.assert_called_once_with("output", deep=False, jobs=None)
 
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,57 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager.comparator import compare_databases
+from rockbox_db_manager.tcd_writer import write_tcd_entries
+
+class TestComparator(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.working = os.path.join(self.tmp.name, "working")
+        self.generated = os.path.join(self.tmp.name, "generated")
+        os.makedirs(self.working)
+        os.makedirs(self.generated)
+        artists = [f"Artist {i}" for i in range(200)]
+        write_tcd_entries(os.path.join(self.working, "database_0.tcd"), artists + ["Beyoncé", "Old Artist"])
+        write_tcd_entries(os.path.join(self.generated, "database_0.tcd"), ["New Artist", "BEYONCÉ"] + artists)
+        for directory in (self.working, self.generated):
+            write_tcd_entries(os.path.join(directory, "database_2.tcd"), ["Rock", "Jazz"])
+        write_tcd_entries(os.path.join(self.working, "database_1.tcd"), ["Album"])
+
+    def compare(self):
+        output = os.path.join(self.tmp.name, "report.json")
+        compare_databases(self.working, self.generated, output_file=output)
+        with open(output, encoding='utf-8') as f:
+            return json.load(f)["files"]
+
+    def test_entry_level_diff(self):
+        """Added, removed and changed strings are reported per tag file."""
+        files = self.compare()
+        self.assertEqual(files["database_2.tcd"]["status"], "identical")
+        self.assertEqual(files["database_1.tcd"]["status"], "missing_generated")
+        artists = files["database_0.tcd"]
+        self.assertEqual(artists["status"], "differs")
+        self.assertEqual(artists["added"], ["New Artist"])
+        self.assertEqual(artists["removed"], ["Old Artist"])
+        self.assertEqual(artists["changed"], [{"working": "Beyoncé", "generated": "BEYONCÉ"}])
+
+    def test_partitioned_diff_matches_in_memory_diff(self):
+        """Hash-partitioning large files gives the same result as diffing them in memory."""
+        in_memory = self.compare()
+        with patch("rockbox_db_manager.comparator.PARTITION_THRESHOLD", 16), \
+                patch("rockbox_db_manager.comparator.PARTITION_SIZE", 256):
+            partitioned = self.compare()
+        for key in ("added", "removed", "changed", "added_count"):
+            self.assertEqual(partitioned["database_0.tcd"][key], in_memory["database_0.tcd"][key])
+
+    def test_reordered_file(self):
+        """Files with the same strings in another order are reported as reordered."""
+        write_tcd_entries(os.path.join(self.generated, "database_2.tcd"), ["Jazz", "Rock"])
+        self.assertEqual(self.compare()["database_2.tcd"]["status"], "reordered")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,20 +1,155 @@
+import os
+import struct
+import tempfile
 import unittest
-from unittest.mock import patch, mock_open
-from rockbox_db_manager.database import create_tag_file, clean_metadata
+from unittest.mock import patch
+from mutagen.id3 import ID3, TIT2, TPE1, TALB, TCON
+from rockbox_db_manager.database import create_tag_file, clean_metadata, create_rockbox_tagcache, build_tag_data, write_tag_files, create_master_index_file, TAG_FILES
+from rockbox_db_manager.tcd_reader import TcdReader
+from rockbox_db_manager.tcd_writer import OFFSET_TABLE_SUFFIX
+from rockbox_db_manager.track import TrackRecord
+
+# A silent MPEG-1 Layer III frame (128 kbps, 44.1 kHz) so mutagen recognizes the file
+MP3_FRAME = b'\xff\xfb\x90\x00' + b'\x00' * 413
+
+def write_test_mp3(path, title, artist, album, genre):
+    """Write a tiny tagged MP3 file."""
+    with open(path, 'wb') as f:
+        f.write(MP3_FRAME * 4)
+    tags = ID3()
+    tags.add(TIT2(encoding=3, text=title))
+    tags.add(TPE1(encoding=3, text=artist))
+    tags.add(TALB(encoding=3, text=album))
+    tags.add(TCON(encoding=3, text=genre))
+    tags.save(path)
 
 class TestDatabase(unittest.TestCase):
 
-    @patch("builtins.open", new_callable=mock_open)
-    def test_create_tag_file(self, mock_file):
+    def test_create_tag_file(self):
         """Test that tag files are created properly."""
-        tag_data = {"Artist 1", "Artist 2"}
-        create_tag_file("test.tcd", tag_data)
-        mock_file.assert_called_with("test.tcd", 'wb')
+        tag_data = ["Artist 1", "Ärtist 2", "x" * 300]
+        with tempfile.TemporaryDirectory() as tmp:
+            tag_file = os.path.join(tmp, "test.tcd")
+            with patch("rockbox_db_manager.tcd_writer.WRITE_BUFFER_SIZE", 64):
+                offsets = create_tag_file(tag_file, tag_data)
+            with open(tag_file, 'rb') as f:
+                content = f.read()
+            self.assertEqual(os.listdir(tmp), ["test.tcd"])
+
+        expected = b''.join(struct.pack('<I', len(e.encode('utf-8'))) + e.encode('utf-8') for e in tag_data)
+        self.assertEqual(content, expected)
+        self.assertEqual(list(offsets), [0, 12, 25])
+
+    def test_failed_write_keeps_previous_file(self):
+        """A write that fails midway leaves the existing tag file untouched and no temp file."""
+        def entries():
+            yield "Artist 1"
+            raise IOError("device removed")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            tag_file = os.path.join(tmp, "test.tcd")
+            with open(tag_file, 'wb') as f:
+                f.write(b"previous")
+            create_tag_file(tag_file, entries())
+            with open(tag_file, 'rb') as f:
+                self.assertEqual(f.read(), b"previous")
+            self.assertEqual(os.listdir(tmp), ["test.tcd"])
+
+    def test_failed_sync_removes_temp_file(self):
+        """A flush or sync failing after the last entry, e.g. on a full disk, leaves no temp file."""
+        with tempfile.TemporaryDirectory() as tmp:
+            tag_file = os.path.join(tmp, "test.tcd")
+            with open(tag_file, 'wb') as f:
+                f.write(b"previous")
+            with patch("rockbox_db_manager.tcd_writer.os.fsync", side_effect=OSError(28, "No space left on device")):
+                create_tag_file(tag_file, ["Artist 1"])
+            with open(tag_file, 'rb') as f:
+                self.assertEqual(f.read(), b"previous")
+            self.assertEqual(os.listdir(tmp), ["test.tcd"])
 
     def test_clean_metadata(self):
         """Test that metadata is cleaned and defaults are applied correctly."""
         self.assertEqual(clean_metadata("   ", "Unknown Artist"), "Unknown Artist")
         self.assertEqual(clean_metadata("Valid Artist", "Unknown Artist"), "Valid Artist")
 
+    def test_master_index_points_at_track_entries(self):
+        """Every index row holds, per tag file, the offset of that track's entry."""
+        tracks = [
+            ("a.mp3", TrackRecord("One", ["Alpha", "Beta"], "First", "Rock", "a.mp3", "", "", "Alpha", "")),
+            ("b.mp3", TrackRecord("Two", ["Beta"], "First", "Jazz", "b.mp3", "", "", "", "")),
+            ("c.mp3", TrackRecord("Three", ["Alpha"], "Second", "Rock", "c.mp3", "", "", "Alpha", "")),
+        ]
+        tag_data, track_count = build_tag_data(tracks, {})
+        with tempfile.TemporaryDirectory() as tmp:
+            offsets, _, _ = write_tag_files(tmp, tag_data)
+            create_master_index_file(tmp, tag_data, offsets)
+
+            contents = {}
+            for tag, filename in TAG_FILES.items():
+                with open(os.path.join(tmp, filename), 'rb') as f:
+                    contents[tag] = f.read()
+            with open(os.path.join(tmp, "database_idx.tcd"), 'rb') as f:
+                index = f.read()
+
+        def entry_at(tag, offset):
+            length = struct.unpack_from('<I', contents[tag], offset)[0]
+            return contents[tag][offset + 4:offset + 4 + length].decode('utf-8')
+
+        self.assertEqual(struct.unpack_from('<I', index)[0], 3)
+        self.assertEqual(len(index), 4 + 3 * len(TAG_FILES) * 4)
+        rows = [struct.unpack_from(f'<{len(TAG_FILES)}I', index, 4 + i * len(TAG_FILES) * 4) for i in range(3)]
+        resolved = [{tag: entry_at(tag, offset) for tag, offset in zip(TAG_FILES, row)} for row in rows]
+        self.assertEqual([r['artist'] for r in resolved], ["Alpha", "Beta", "Alpha"])
+        self.assertEqual([r['genre'] for r in resolved], ["Rock", "Jazz", "Rock"])
+        self.assertEqual([r['filename'] for r in resolved], ["a.mp3", "b.mp3", "c.mp3"])
+        self.assertEqual(resolved[1]['albumartist'], "Unknown Albumartist")
+
+    def test_tag_files_are_sorted(self):
+        """Tag files are sorted case-insensitively and written with offset tables on request."""
+        tracks = [(f"{name}.mp3", TrackRecord(name, [artist], "Album", "Rock", f"{name}.mp3", "", "", "", ""))
+                  for name, artist in [("b", "beta"), ("a", "Alpha"), ("c", "Beta"), ("d", "alpha")]]
+        tag_data, _ = build_tag_data(tracks, {})
+        with tempfile.TemporaryDirectory() as tmp:
+            offsets, _, _ = write_tag_files(tmp, tag_data, offset_tables=True)
+            artist_file = os.path.join(tmp, TAG_FILES['artist'])
+            with TcdReader(artist_file) as reader:
+                self.assertEqual([entry for _, _, entry in reader.iter_strings()], ["Alpha", "alpha", "Beta", "beta"])
+                self.assertEqual([reader.decode_entry(offsets['artist'][i]) for i in tag_data.tracks['artist']],
+                                 ["beta", "Alpha", "Beta", "alpha"])
+                self.assertEqual([entry for _, entry in reader.lookup("BETA")], ["Beta", "beta"])
+                self.assertIsNotNone(reader.offset_table())
+
+            # Without offset tables, rewritten files drop their now stale sidecar
+            write_tag_files(tmp, tag_data)
+            self.assertFalse(os.path.exists(artist_file + OFFSET_TABLE_SUFFIX))
+
+    def test_parallel_output_matches_serial(self):
+        """Generating with a process pool writes exactly the same files as the serial path."""
+        with tempfile.TemporaryDirectory() as tmp:
+            music_files = []
+            for i in range(12):
+                path = os.path.join(tmp, f"track_{i:02d}.mp3")
+                write_test_mp3(path, f"Title {i}", f"Artist {i % 3}, Guest {i % 2}", f"Album {i % 4}", "Rock")
+                music_files.append(path)
+            open(os.path.join(tmp, "broken.mp3"), 'wb').close()
+            music_files.append(os.path.join(tmp, "broken.mp3"))
+
+            caches = {}
+            outputs = {}
+            for jobs in (1, 2):
+                caches[jobs] = {}
+                outputs[jobs] = os.path.join(tmp, f"out_{jobs}")
+                with patch("rockbox_db_manager.database.get_cache", return_value=caches[jobs]), \
+                        patch("rockbox_db_manager.database.save_cache"), \
+                        patch("rockbox_db_manager.metadata.PARALLEL_BATCH_SIZE", 5):
+                    count = create_rockbox_tagcache(outputs[jobs], music_files, "missing-config.json", jobs=jobs)
+                self.assertEqual(count, len(music_files))
+
+            self.assertEqual(caches[1], caches[2])
+            self.assertEqual(len(caches[1]), 12)
+            for filename in list(TAG_FILES.values()) + ["database_idx.tcd"]:
+                with open(os.path.join(outputs[1], filename), 'rb') as serial, open(os.path.join(outputs[2], filename), 'rb') as parallel:
+                    self.assertEqual(serial.read(), parallel.read(), filename)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
@@ -0,0 +1,64 @@
+import logging
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import logs
+from rockbox_db_manager.cli import main
+
+class TestLogs(unittest.TestCase):
+
+    def setUp(self):
+        root = logging.getLogger()
+        handlers, level = root.handlers[:], root.level
+        self.addCleanup(setattr, root, "handlers", handlers)
+        self.addCleanup(root.setLevel, level)
+        logs._per_file.clear()
+        self.addCleanup(logs._per_file.clear)
+
+    def test_per_file_messages_are_rate_limited(self):
+        """Past the burst, per-file messages are counted and summarized on flush."""
+        logging.getLogger().setLevel(logging.INFO)
+        with patch("rockbox_db_manager.logs.PER_FILE_BURST", 3), self.assertLogs(level="INFO") as captured:
+            for i in range(10):
+                logs.per_file(logging.INFO, "Using cached metadata for %s", f"track{i}.mp3")
+            logs.flush_per_file()
+        messages = [record.getMessage() for record in captured.records]
+        self.assertEqual(messages[:3], ["Using cached metadata for track0.mp3", "Using cached metadata for track1.mp3",
+                                        "Using cached metadata for track2.mp3"])
+        self.assertEqual(len(messages), 4)
+        self.assertIn("7 more messages like \"Using cached metadata for %s\"", messages[3])
+
+    def test_errors_are_never_rate_limited(self):
+        """Every failing file is named, however many there are."""
+        with patch("rockbox_db_manager.logs.PER_FILE_BURST", 3), self.assertLogs(level="ERROR") as captured:
+            for i in range(10):
+                logs.per_file(logging.ERROR, "Failed to read %s", f"track{i}.mp3")
+            logs.flush_per_file()
+        messages = [record.getMessage() for record in captured.records]
+        self.assertEqual(messages, [f"Failed to read track{i}.mp3" for i in range(10)])
+
+    def test_disabled_level_is_not_formatted(self):
+        """Messages below the level are dropped without formatting their arguments."""
+        logging.getLogger().setLevel(logging.INFO)
+
+        class Unformattable:
+            def __str__(self):
+                raise AssertionError("formatted")
+
+        logs.per_file(logging.DEBUG, "Processing file: %s", Unformattable())
+        self.assertEqual(logs._per_file, {})
+
+    def test_log_file_option(self):
+        """--log-file writes the log of the run to the file."""
+        with tempfile.TemporaryDirectory() as tmp:
+            log_file = os.path.join(tmp, "run.log")
+            with patch("sys.argv", ["main.py", "--log-file", log_file, "validate", tmp]):
+                main()
+            for handler in logging.getLogger().handlers:
+                handler.close()
+            with open(log_file, encoding="utf-8") as f:
+                self.assertIn("ERROR - Missing files", f.read())
+
+if __name__ == '__main__':
+    unittest.main()
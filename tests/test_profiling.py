@@ -0,0 +1,73 @@
+import json
+import os
+import pstats
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import profiling
+from rockbox_db_manager.database import create_rockbox_database
+from rockbox_db_manager.track import TrackRecord
+from helpers import isolate_cache
+
+def fake_read_metadata(file):
+    name = os.path.basename(file)
+    return TrackRecord("Title " + name, ["Artist"], "Album", "Genre", name, "Composer", "Comment", "Artist", "Grouping"), None
+
+class TestProfiling(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.music_dir = os.path.join(self.tmp.name, "music")
+        os.makedirs(self.music_dir)
+        for i in range(5):
+            with open(os.path.join(self.music_dir, f"{i}.mp3"), "wb") as f:
+                f.write(b"x" * (i + 1))
+        isolate_cache(self, self.tmp.name)
+        read_patch = patch("rockbox_db_manager.metadata.read_metadata", side_effect=fake_read_metadata)
+        read_patch.start()
+        self.addCleanup(read_patch.stop)
+
+    def profile_build(self):
+        report_file = os.path.join(self.tmp.name, "profile.json")
+        with profiling.profile_run(report_file, command="create-db"):
+            create_rockbox_database(os.path.join(self.tmp.name, "db"), self.music_dir, "missing-config.json")
+        with open(report_file) as f:
+            return json.load(f)
+
+    def test_report_counts_cache_and_io(self):
+        """The report holds stage timings, cache hits and misses, bytes and the slowest files."""
+        cold = self.profile_build()
+        self.assertEqual(cold["command"], "create-db")
+        self.assertEqual(cold["counters"]["cache_misses"], 5)
+        self.assertEqual(cold["counters"]["files_parsed"], 5)
+        self.assertEqual(cold["counters"]["bytes_parsed_files"], 15)
+        self.assertEqual(cold["counters"]["files_written"], 10)
+        self.assertGreater(cold["counters"]["bytes_written"], 0)
+        for name in ("walk", "scan", "cache_lookup", "parse", "cache_save", "build_tag_data", "write_tags", "write_index"):
+            self.assertIn(name, cold["stages"])
+        self.assertEqual(cold["stages"]["parse"]["calls"], 5)
+        self.assertEqual(len(cold["slowest"]["parse"]), 5)
+
+        warm = self.profile_build()
+        self.assertEqual(warm["counters"]["cache_hits"], 5)
+        self.assertNotIn("parse", warm["stages"])
+
+    def test_pstats_capture(self):
+        """The run can also be captured with cProfile."""
+        pstats_file = os.path.join(self.tmp.name, "run.prof")
+        with profiling.profile_run(pstats_file=pstats_file):
+            create_rockbox_database(os.path.join(self.tmp.name, "db"), self.music_dir, "missing-config.json")
+        self.assertGreater(pstats.Stats(pstats_file).total_calls, 0)
+
+    def test_disabled_by_default(self):
+        """Without a report file nothing is recorded."""
+        with profiling.profile_run() as profile:
+            self.assertIsNone(profile)
+            self.assertFalse(profiling.is_active())
+            self.assertIs(profiling.stage("parse"), profiling.stage("walk"))
+            iterable = [1, 2]
+            self.assertIs(profiling.timed_iter("walk", iterable), iterable)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,193 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import cache, database, metadata, scanner
+from rockbox_db_manager.database import create_rockbox_database
+from rockbox_db_manager.tcd_reader import TcdReader
+from rockbox_db_manager.track import TrackRecord
+from helpers import isolate_cache
+
+def fake_metadata(file, cache, verbose=False, st=None):
+    """Return deterministic metadata derived from the file name."""
+    name = os.path.basename(file)
+    artist = "Artist A" if name.startswith("a") else "Artist B"
+    return TrackRecord("Title " + name, [artist], "Album", "Genre", name, "Composer", "Comment", artist, "Grouping")
+
+class TestScanner(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.music_dir = os.path.join(self.tmp.name, "music")
+        os.makedirs(os.path.join(self.music_dir, "sub"))
+        for name in ["a1.mp3", "a2.flac", "b1.mp3", os.path.join("sub", "b2.ogg"), "cover.jpg"]:
+            open(os.path.join(self.music_dir, name), "wb").close()
+        isolate_cache(self, self.tmp.name)
+        self.addCleanup(self.tmp.cleanup)
+
+    def test_iter_music_files_skips_unsupported(self):
+        """Only supported audio formats are yielded."""
+        files = sorted(os.path.basename(f) for f in scanner.iter_music_files(self.music_dir))
+        self.assertEqual(files, ["a1.mp3", "a2.flac", "b1.mp3", "b2.ogg"])
+
+    def test_exclusions_prune_directories_and_extensions(self):
+        """Directory rules prune whole subtrees and extension rules drop formats."""
+        os.makedirs(os.path.join(self.music_dir, "sub", "deeper"))
+        open(os.path.join(self.music_dir, "sub", "deeper", "c1.mp3"), "wb").close()
+        exclude = [os.path.join(self.music_dir, "sub"), ".flac"]
+        files = [os.path.basename(f) for f in scanner.iter_music_files(self.music_dir, exclude)]
+        self.assertEqual(files, ["a1.mp3", "b1.mp3"])
+
+    @patch("rockbox_db_manager.metadata.read_metadata", side_effect=lambda file: (fake_metadata(file, None), None))
+    def test_walk_stat_is_reused_by_cache(self, mock_read):
+        """The stat taken during the walk is reused, so the cache never stats files itself."""
+        store = {}
+        with patch("rockbox_db_manager.cache.os.stat") as mock_stat, patch("rockbox_db_manager.cache.os.path.getmtime") as mock_getmtime:
+            first = list(scanner.iter_tracks(self.music_dir, store))
+            second = list(scanner.iter_tracks(self.music_dir, store))
+        mock_stat.assert_not_called()
+        mock_getmtime.assert_not_called()
+        self.assertEqual(mock_read.call_count, 4)
+        self.assertEqual(first, second)
+
+    @patch("rockbox_db_manager.metadata.read_metadata", side_effect=lambda file: (fake_metadata(file, None), None))
+    def test_filtered_build_uses_tag_index(self, mock_read):
+        """With a warm cache, filtered runs only look up the files the indexes match, ignoring case."""
+        for backend in ("sqlite", "json"):
+            with patch("rockbox_db_manager.cache.CACHE_BACKEND", backend), patch("rockbox_db_manager.cache._shared_cache", None):
+                cache.clear_cache()
+                list(scanner.iter_tracks(self.music_dir, cache.get_cache(root=self.music_dir)))
+                cache.save_cache(cache.get_cache())
+                cache._shared_cache.close()
+                cache._shared_cache = None
+
+                def looked_up(**filters):
+                    store = cache.get_cache(root=self.music_dir)
+                    with patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", wraps=metadata.extract_full_metadata) as mock_extract:
+                        tracks = [os.path.basename(path) for path, _ in scanner.iter_tracks(self.music_dir, store, **filters)]
+                    return tracks, sorted(os.path.basename(call.args[0]) for call in mock_extract.call_args_list)
+
+                self.assertEqual(looked_up(only_artist="artist a"), (["a1.mp3", "a2.flac"], ["a1.mp3", "a2.flac"]))
+                self.assertEqual(looked_up(only_artist=["ARTIST A", "Artist B"], only_album="album")[0], ["a1.mp3", "a2.flac", "b1.mp3", "b2.ogg"])
+                self.assertEqual(looked_up(only_album="Other"), ([], []))
+
+                # A new file has no entry yet, so it is parsed and filtered as usual
+                with open(os.path.join(self.music_dir, "a3.mp3"), "wb") as f:
+                    f.write(b"a3")
+                self.assertEqual(looked_up(only_artist="Artist A"), (["a1.mp3", "a2.flac", "a3.mp3"], ["a1.mp3", "a2.flac", "a3.mp3"]))
+                os.remove(os.path.join(self.music_dir, "a3.mp3"))
+                cache._shared_cache.close()
+
+    @patch("rockbox_db_manager.metadata.read_metadata", side_effect=lambda file: (fake_metadata(file, None), None))
+    def test_identical_files_are_parsed_separately(self, mock_read):
+        """A duplicate of a cached file, such as a second rip, is parsed instead of inheriting its entry."""
+        original, duplicate = os.path.join(self.music_dir, "a1.mp3"), os.path.join(self.music_dir, "b1.mp3")
+        with open(original, "wb") as f:
+            f.write(b"same audio" * 100)
+        os.remove(duplicate)
+        store = cache.get_cache(root=self.music_dir)
+        list(scanner.iter_tracks(self.music_dir, store))
+        cache.save_cache(store)
+
+        with open(duplicate, "wb") as f:
+            f.write(b"same audio" * 100)
+        mock_read.reset_mock()
+        tracks = dict(scanner.iter_tracks(self.music_dir, store))
+        self.assertEqual([call.args[0] for call in mock_read.call_args_list], [duplicate])
+        self.assertEqual(tracks[original].artists, ("Artist A",))
+        self.assertEqual(tracks[duplicate].artists, ("Artist B",))
+        self.assertIn(original, store)
+        store.close()
+
+    def test_iter_tracks_is_lazy(self):
+        """Nothing is parsed until the generator is consumed."""
+        with patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata) as mock_extract:
+            tracks = scanner.iter_tracks(self.music_dir, {})
+            mock_extract.assert_not_called()
+            next(tracks)
+            self.assertEqual(mock_extract.call_count, 1)
+
+    @patch("rockbox_db_manager.cache.load_cache", return_value={})
+    @patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata)
+    def test_scan_loads_cache_once(self, mock_extract, mock_load):
+        """The cache is read from disk once per process, not once per file."""
+        scanner.scan_music_directory(self.music_dir, only_artist="Artist A")
+        scanner.scan_music_directory(self.music_dir, only_album="Album")
+        self.assertEqual(mock_extract.call_count, 8)
+        mock_load.assert_called_once()
+
+    @patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata)
+    def test_create_db_parses_each_file_once(self, mock_extract):
+        """A filtered create-db run extracts metadata for each file exactly once."""
+        output_dir = os.path.join(self.tmp.name, "out")
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", only_artist="Artist A")
+
+        parsed = [call.args[0] for call in mock_extract.call_args_list]
+        self.assertEqual(len(parsed), 4)
+        self.assertEqual(len(set(parsed)), 4)
+        self.assertTrue(os.path.exists(os.path.join(output_dir, "database_0.tcd")))
+        with open(os.path.join(output_dir, "database_idx.tcd"), "rb") as f:
+            self.assertEqual(int.from_bytes(f.read(4), "little"), 2)
+
+    @patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata)
+    def test_incremental_rewrites_only_changed_tag_files(self, mock_extract):
+        """An unchanged library rewrites nothing; a new file only rewrites tags whose content changed."""
+        output_dir = os.path.join(self.tmp.name, "out")
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        self.assertEqual(mock_extract.call_count, 4)
+
+        mock_extract.reset_mock()
+        with patch("rockbox_db_manager.database.create_tag_file") as mock_write:
+            create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        mock_extract.assert_not_called()
+        mock_write.assert_not_called()
+
+        open(os.path.join(self.music_dir, "a3.mp3"), "wb").close()
+        with patch("rockbox_db_manager.database.create_tag_file", wraps=database.create_tag_file) as mock_write:
+            create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        written = sorted(os.path.basename(call.args[0]) for call in mock_write.call_args_list)
+        self.assertEqual(written, ["database_3.tcd", "database_4.tcd"])
+        with open(os.path.join(output_dir, "database_idx.tcd"), "rb") as f:
+            self.assertEqual(int.from_bytes(f.read(4), "little"), 5)
+
+    @patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata)
+    def test_full_run_invalidates_manifest(self, mock_extract):
+        """An incremental run after a filtered full run rebuilds the whole database."""
+        output_dir = os.path.join(self.tmp.name, "out")
+        index_file = os.path.join(output_dir, "database_idx.tcd")
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", only_artist="Artist A")
+        with open(index_file, "rb") as f:
+            self.assertEqual(int.from_bytes(f.read(4), "little"), 2)
+
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        with open(index_file, "rb") as f:
+            self.assertEqual(int.from_bytes(f.read(4), "little"), 4)
+
+    @patch("rockbox_db_manager.scanner.metadata.extract_full_metadata", side_effect=fake_metadata)
+    def test_failed_tag_file_write_is_retried(self, mock_extract):
+        """A tag file that failed to write is not recorded in the manifest, so the next run rewrites it."""
+        output_dir = os.path.join(self.tmp.name, "out")
+        artist_file = os.path.join(output_dir, "database_0.tcd")
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        for name in ["a1.mp3", "a2.flac"]:
+            os.rename(os.path.join(self.music_dir, name), os.path.join(self.music_dir, "c" + name[1:]))
+
+        write = database.write_tcd_entries
+        def failing_write(path, entries):
+            if path == artist_file:
+                raise OSError(28, "No space left on device")
+            return write(path, entries)
+
+        with patch("rockbox_db_manager.database.write_tcd_entries", side_effect=failing_write):
+            with self.assertLogs(level="ERROR"):
+                create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        with TcdReader(artist_file) as reader:
+            self.assertEqual([entry for _, _, entry in reader.iter_strings()], ["Artist A", "Artist B"])
+
+        create_rockbox_database(output_dir, self.music_dir, "missing-config.json", incremental=True)
+        with TcdReader(artist_file) as reader:
+            self.assertEqual([entry for _, _, entry in reader.iter_strings()], ["Artist B"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import stats
+from rockbox_db_manager.database import build_tag_data, write_tag_files, create_master_index_file, show_stats
+from rockbox_db_manager.track import TrackRecord
+
+class TestStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        tracks = [
+            ("a.mp3", TrackRecord("One", ["Alpha"], "First", "Rock", "a.mp3", "", "", "Alpha", "")),
+            ("b.mp3", TrackRecord("Two", ["Beta"], "First", "Jazz", "b.mp3", "", "", "", "")),
+            ("c.mp3", TrackRecord("Three", ["Alpha"], "Second", "Rock", "c.mp3", "", "", "", "")),
+        ]
+        tag_data, _ = build_tag_data(tracks, {})
+        offsets, _, _ = write_tag_files(self.tmp.name, tag_data)
+        create_master_index_file(self.tmp.name, tag_data, offsets)
+
+    def test_database_stats(self):
+        """Entries, distinct values, lengths, defaults and the tracks using them are reported per file."""
+        report = stats.database_stats(self.tmp.name, jobs=2)
+        artist = report["files"]["database_0.tcd"]
+        self.assertEqual((artist["entries"], artist["distinct"], artist["distinct_exact"]), (2, 2, True))
+        self.assertEqual(artist["total_length"], len("Alpha") + len("Beta"))
+        self.assertEqual(artist["longest"][0], (5, "Alpha"))
+        albumartist = report["files"]["database_7.tcd"]
+        self.assertEqual(albumartist["unknown_entries"], 1)
+        self.assertEqual(albumartist["unknown_tracks"], 2)
+        self.assertEqual(report["index"]["tracks"], 3)
+        self.assertIsNone(report["index"]["error"])
+
+    def test_missing_index(self):
+        """A missing master index is reported instead of failing the command."""
+        os.remove(os.path.join(self.tmp.name, "database_idx.tcd"))
+        with self.assertLogs(level="WARNING"):
+            report = show_stats(self.tmp.name, jobs=1)
+        self.assertIsNone(report["index"]["tracks"])
+        self.assertEqual(report["files"]["database_0.tcd"]["entries"], 2)
+
+    def test_distinct_estimate(self):
+        """Past the exact limit, the distinct count is a close estimate."""
+        with patch("rockbox_db_manager.stats.EXACT_DISTINCT_LIMIT", 1000):
+            counter = stats.DistinctCounter()
+            for i in range(50000):
+                counter.add(f"value {i % 20000}".encode())
+        count, exact = counter.count()
+        self.assertFalse(exact)
+        self.assertAlmostEqual(count, 20000, delta=1000)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,53 @@
+import os
+import tempfile
+import unittest
+from rockbox_db_manager.sync import sync_database
+
+class TestSync(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.source = os.path.join(self.tmp.name, "generated")
+        self.device = os.path.join(self.tmp.name, "device")
+        os.makedirs(self.source)
+        for i in range(3):
+            self.write(os.path.join(self.source, f"database_{i}.tcd"), f"tag file {i}".encode())
+        self.write(os.path.join(self.source, "database_idx.tcd"), b"index")
+
+    def write(self, path, content):
+        with open(path, 'wb') as f:
+            f.write(content)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def test_mirrors_directory(self):
+        """Every database file is copied on the first sync."""
+        report = sync_database(self.source, self.device)
+        self.assertEqual(report["copied"], 4)
+        self.assertEqual(report["bytes_copied"], 3 * 10 + 5)
+        self.assertEqual(sorted(os.listdir(self.device)), sorted(os.listdir(self.source)))
+        self.assertEqual(self.read(os.path.join(self.device, "database_1.tcd")), b"tag file 1")
+
+    def test_skips_unchanged_files(self):
+        """Only files whose content changed are copied again, even when the size is the same."""
+        sync_database(self.source, self.device)
+        self.write(os.path.join(self.source, "database_2.tcd"), b"tag file X")
+
+        report = sync_database(self.source, self.device, jobs=2)
+        self.assertEqual((report["copied"], report["skipped"]), (1, 3))
+        self.assertEqual((report["bytes_copied"], report["bytes_skipped"]), (10, 25))
+        self.assertEqual(self.read(os.path.join(self.device, "database_2.tcd")), b"tag file X")
+        self.assertFalse(any(name.endswith(".tmp") for name in os.listdir(self.device)))
+
+    def test_single_file(self):
+        """A single file is still copied into the destination directory."""
+        os.makedirs(self.device)
+        report = sync_database(os.path.join(self.source, "database_idx.tcd"), self.device)
+        self.assertEqual(report["copied"], 1)
+        self.assertEqual(self.read(os.path.join(self.device, "database_idx.tcd")), b"index")
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,161 @@
+import io
+import os
+import tempfile
+import unittest
+from unittest.mock import patch, MagicMock
+from mutagen.id3 import ID3, TIT2, TPE1, TCON, COMM, APIC, TXXX
+from rockbox_db_manager import bench, tags
+from rockbox_db_manager.database import list_tags
+from rockbox_db_manager.metadata import read_metadata
+from helpers import isolate_cache
+
+TAGS = {"title": "Title", "artists": ["Artist A", "Artist B"], "albumartist": "Artist A", "album": "Album",
+        "genre": "Jazz", "composer": "Composer"}
+COVER = b"\xff" * (256 << 10)
+
+class CountingFile(io.BufferedReader):
+    """File object counting the bytes it returns."""
+    bytes_read = 0
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.bytes_read += len(data)
+        return data
+
+class TestTags(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def read_counting(self, reader, path):
+        with CountingFile(io.FileIO(path)) as f:
+            return reader(f), f.bytes_read
+
+    def test_id3v2_fast_path_skips_cover_art(self):
+        """ID3v2.3 and v2.4 tags read the same as with mutagen, without reading the picture."""
+        path = self.path("track.mp3")
+        for version in (3, 4):
+            with open(path, "wb") as f:
+                f.write(bench.MP3_FRAME * 4)
+            id3 = ID3()
+            id3.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=COVER))
+            id3.add(TIT2(encoding=1, text="Tïtle"))
+            id3.add(TPE1(encoding=3, text="Artist A, Artist B"))
+            id3.add(TCON(encoding=0, text="(8)"))
+            id3.add(COMM(encoding=3, lang="eng", desc="iTunNORM", text="ignored"))
+            id3.add(COMM(encoding=1, lang="eng", desc="", text="Comment"))
+            id3.save(path, v2_version=version)
+
+            fields, bytes_read = self.read_counting(tags.read_id3v2, path)
+            self.assertEqual(fields, tags.read_tags_mutagen(path))
+            self.assertEqual(fields["genre"], ["Jazz"])
+            self.assertEqual(fields["comment"], ["Comment"])
+            self.assertLess(bytes_read, 1024)
+
+    def test_flac_fast_path_maps_vorbis_comments(self):
+        """FLAC files get their Vorbis comments instead of Unknown values."""
+        path = self.path("track.flac")
+        bench.write_flac(path, TAGS, COVER)
+
+        fields, bytes_read = self.read_counting(tags.read_flac, path)
+        self.assertEqual(fields, tags.read_tags_mutagen(path))
+        self.assertLess(bytes_read, 1024)
+
+        metadata, error = read_metadata(path)
+        self.assertIsNone(error)
+        self.assertEqual((metadata.title, metadata.artists, metadata.album, metadata.genre, metadata.albumartist),
+                         ("Title", ("Artist A", "Artist B"), "Album", "Jazz", "Artist A"))
+
+    def test_id3v22_fast_path(self):
+        """ID3v2.2 tags, with their three-character frame ids, are read without mutagen."""
+        frames = b"".join(frame_id + len(body).to_bytes(3, "big") + body for frame_id, body in [
+            (b"TT2", b"\x00Title"), (b"TP1", b"\x00Artist A"), (b"TAL", b"\x00Album"), (b"COM", b"\x00eng\x00Comment"),
+        ])
+        size = bytes((len(frames) >> shift) & 0x7F for shift in (21, 14, 7, 0))
+        path = self.path("track.mp3")
+        with open(path, "wb") as f:
+            f.write(b"ID3\x02\x00\x00" + size + frames + bench.MP3_FRAME * 4)
+
+        with patch("rockbox_db_manager.tags.read_tags_mutagen", wraps=tags.read_tags_mutagen) as mock_mutagen:
+            fields = tags.read_tags(path)
+        mock_mutagen.assert_not_called()
+        self.assertEqual(fields, {"title": ["Title"], "artist": ["Artist A"], "album": ["Album"], "comment": ["Comment"]})
+        self.assertEqual(fields, tags.read_tags_mutagen(path))
+
+    def test_unsupported_tag_falls_back_to_mutagen(self):
+        """Tags the fast reader does not handle are read by mutagen."""
+        path = self.path("track.mp3")
+        bench.write_mp3(path, TAGS)
+        with patch("rockbox_db_manager.tags.read_id3v2", side_effect=tags.UnsupportedTag("unsync")) as fast, \
+                patch.dict(tags.FAST_READERS, {".mp3": tags.read_id3v2}):
+            fields = tags.read_tags(path)
+        fast.assert_called_once()
+        self.assertEqual(fields["album"], ["Album"])
+
+    def test_native_keys_of_other_formats(self):
+        """MP4 atoms and other native keys are mapped onto the same fields."""
+        audio = MagicMock()
+        audio.tags = {"\xa9nam": ["Title"], "\xa9ART": ["Artist"], "aART": ["Album Artist"], "\xa9grp": ["Group"],
+                      "covr": [b"image"], "WM/AlbumTitle": ["Album"]}
+        with patch("rockbox_db_manager.tags.File", return_value=audio):
+            fields = tags.read_tags(self.path("track.m4a"))
+        self.assertEqual(fields, {"title": ["Title"], "artist": ["Artist"], "albumartist": ["Album Artist"],
+                                  "grouping": ["Group"], "album": ["Album"]})
+
+    def test_unreadable_file_reports_error(self):
+        """A file that is not audio keeps the default metadata and reports the error."""
+        path = self.path("broken.mp3")
+        with open(path, "wb") as f:
+            f.write(b"not audio")
+        metadata, error = read_metadata(path)
+        self.assertIsNotNone(error)
+        self.assertEqual(metadata.title, "Unknown Title")
+
+    def test_list_tag_keys_reads_headers_only(self):
+        """Frame ids and Vorbis keys are listed without reading the cover art."""
+        path = self.path("track.mp3")
+        with open(path, "wb") as f:
+            f.write(bench.MP3_FRAME * 4)
+        id3 = ID3()
+        id3.add(APIC(encoding=3, mime="image/jpeg", type=3, desc="Cover", data=COVER))
+        id3.add(TIT2(encoding=3, text="Title"))
+        id3.add(TXXX(encoding=3, desc="REPLAYGAIN_TRACK_GAIN", text="-6 dB"))
+        id3.save(path, v2_version=4)
+        listed, bytes_read = self.read_counting(tags.list_id3v2_keys, path)
+        self.assertEqual(listed[0], "ID3v2.4")
+        self.assertEqual(sorted(listed[1]), ["APIC", "TIT2", "TXXX:REPLAYGAIN_TRACK_GAIN"])
+        self.assertLess(bytes_read, 1024)
+        self.assertEqual(sorted(tags.list_tag_keys_mutagen(path)[1]), sorted(listed[1]))
+
+        path = self.path("track.flac")
+        bench.write_flac(path, TAGS, COVER)
+        (tag_format, keys), bytes_read = self.read_counting(tags.list_flac_keys, path)
+        self.assertEqual(tag_format, "Vorbis")
+        self.assertEqual(sorted(set(keys)), ["ALBUM", "ALBUMARTIST", "ARTIST", "COMPOSER", "GENRE", "TITLE"])
+        self.assertLess(bytes_read, 1024)
+
+    def test_list_tags_reuses_cached_listings(self):
+        """list-tags counts keys per format, and a second run does not open the files."""
+        music_dir = self.path("music")
+        bench.generate_library(music_dir, 8, flac_ratio=0.25)
+        isolate_cache(self, self.tmp.name)
+
+        flac = sum(name.endswith(".flac") for _, _, names in os.walk(music_dir) for name in names)
+        report = list_tags(music_dir, jobs=2)
+        self.assertEqual(report["extensions"], {".mp3": 8 - flac, ".flac": flac})
+        self.assertEqual(report["formats"]["Vorbis"]["files"], flac)
+        self.assertEqual(report["formats"]["Vorbis"]["keys"]["TITLE"], flac)
+        id3 = [name for name in report["formats"] if name.startswith("ID3")]
+        self.assertEqual(sum(report["formats"][name]["files"] for name in id3), 8 - flac)
+        self.assertEqual(sum(report["formats"][name]["keys"]["TIT2"] for name in id3), 8 - flac)
+
+        with patch("rockbox_db_manager.metadata.list_tag_keys") as mock_list:
+            self.assertEqual(list_tags(music_dir, jobs=1), report)
+        mock_list.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import io
+import os
+import struct
+import tempfile
+import unittest
+from contextlib import redirect_stdout
+from unittest.mock import patch
+from rockbox_db_manager.analyzer import analyze_database
+from rockbox_db_manager.read_binary import read_binary_tcd_file
+from rockbox_db_manager.tcd_reader import TcdReader, TcdFormatError
+from rockbox_db_manager.tcd_writer import write_tcd_entries, write_offset_table, collation_key, TAG_FILES, INDEX_FILE
+
+class TestTcdReader(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.tag_file = os.path.join(self.tmp.name, "database_0.tcd")
+        self.entries = [f"Artist {i}" for i in range(25)] + ["Ünïcode"]
+        self.offsets = write_tcd_entries(self.tag_file, self.entries)
+
+    def test_iterates_entries_lazily(self):
+        """Entries are yielded with their offsets and decoded on demand."""
+        with TcdReader(self.tag_file) as reader:
+            self.assertEqual([offset for offset, _ in reader.iter_entries()], list(self.offsets))
+            self.assertEqual([entry for _, _, entry in reader.iter_strings()], self.entries)
+
+    def test_random_access_by_offset(self):
+        """Entries can be read directly at the offsets recorded by the writer."""
+        with TcdReader(self.tag_file) as reader:
+            self.assertEqual(reader.decode_entry(self.offsets[-1]), "Ünïcode")
+            self.assertEqual(bytes(reader.entry(self.offsets[3])), b"Artist 3")
+
+    def test_truncated_file(self):
+        """An entry running past the end of the file is reported with its offset."""
+        with open(self.tag_file, 'r+b') as f:
+            f.truncate(os.path.getsize(self.tag_file) - 2)
+        with TcdReader(self.tag_file) as reader:
+            with self.assertRaises(TcdFormatError) as ctx:
+                list(reader.iter_entries())
+        self.assertEqual(ctx.exception.offset, self.offsets[-1])
+
+    def write_sorted(self, entries):
+        entries = sorted(entries, key=collation_key)
+        offsets = write_tcd_entries(self.tag_file, entries)
+        write_offset_table(self.tag_file, offsets, os.path.getsize(self.tag_file))
+        return entries
+
+    def test_lookup_binary_searches_offset_table(self):
+        """With an offset table, a lookup decodes O(log n) entries and matches ignoring case."""
+        self.write_sorted([f"Artist {i:04d}" for i in range(1000)] + ["abba", "ABBA", "Abba"])
+        with TcdReader(self.tag_file) as reader:
+            self.assertIsNotNone(reader.offset_table())
+            decode = reader.decode_entry
+            with patch.object(reader, "decode_entry", side_effect=decode) as mock_decode:
+                matches = reader.lookup("aBbA")
+                self.assertLess(mock_decode.call_count, 20)
+            self.assertEqual([entry for _, entry in matches], ["ABBA", "Abba", "abba"])
+            self.assertEqual([decode(offset) for offset, _ in matches], ["ABBA", "Abba", "abba"])
+            self.assertEqual(reader.lookup("Artist 0500")[0][1], "Artist 0500")
+            self.assertEqual(reader.lookup("missing"), [])
+
+    def test_lookup_ignores_stale_offset_table(self):
+        """An offset table left from another version of the file falls back to a scan."""
+        self.write_sorted(["Alpha", "Beta"])
+        write_tcd_entries(self.tag_file, ["Gamma", "Alpha", "Delta Beta"])
+        with TcdReader(self.tag_file) as reader:
+            self.assertIsNone(reader.offset_table())
+            self.assertEqual(reader.lookup("alpha"), [(9, "Alpha")])
+
+    def test_empty_file(self):
+        """An empty file has no entries."""
+        open(self.tag_file, 'wb').close()
+        with TcdReader(self.tag_file) as reader:
+            self.assertEqual(len(reader), 0)
+            self.assertEqual(list(reader.iter_entries()), [])
+
+    def test_analyze_database_report(self):
+        """The analysis report lists the entry count and the first entries."""
+        report = os.path.join(self.tmp.name, "report.txt")
+        analyze_database(self.tmp.name, report)
+        with open(report, encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn("database_0.tcd contains 26 entries:", content)
+        self.assertIn("  - Artist 9\n", content)
+        self.assertNotIn("Artist 10", content)
+        self.assertIn("...and 16 more.", content)
+
+    def write_index(self, rows):
+        index_file = os.path.join(self.tmp.name, INDEX_FILE)
+        with open(index_file, 'wb') as f:
+            f.write(struct.pack('<I', len(rows)))
+            for row in rows:
+                f.write(struct.pack(f'<{len(TAG_FILES)}I', *row))
+        return index_file
+
+    def test_analyze_database_reads_index_as_offsets(self):
+        """The master index is reported by its track and offset counts, not decoded as strings."""
+        self.write_index([[self.offsets[1]] * len(TAG_FILES), [self.offsets[2]] * len(TAG_FILES)])
+        report = os.path.join(self.tmp.name, "report.txt")
+        with self.assertLogs(level='WARNING') as logs:
+            analyze_database(self.tmp.name, report)
+        self.assertFalse([line for line in logs.output if INDEX_FILE in line])
+        with open(report, encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn(f"{INDEX_FILE} contains 2 tracks, {2 * len(TAG_FILES)} offsets", content)
+
+    def test_read_binary_index(self):
+        """read-binary prints each track's row of offsets for the master index."""
+        index_file = self.write_index([list(range(len(TAG_FILES)))])
+        out = io.StringIO()
+        with redirect_stdout(out):
+            read_binary_tcd_file(index_file)
+        self.assertIn(f"Tracks: 1, Offsets: {len(TAG_FILES)}", out.getvalue())
+        self.assertIn(f"Track 0: {list(range(len(TAG_FILES)))}", out.getvalue())
+
+if __name__ == '__main__':
+    unittest.main()
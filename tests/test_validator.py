@@ -0,0 +1,80 @@
+import os
+import struct
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager import validator
+from rockbox_db_manager.sync import file_digest
+from rockbox_db_manager.database import build_tag_data, write_tag_files, create_master_index_file, validate_database
+from rockbox_db_manager.track import TrackRecord
+
+class TestDeepValidate(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db_dir = self.tmp.name
+        tracks = [
+            ("a.mp3", TrackRecord("One", ["Alpha"], "First", "Rock", "a.mp3", "", "", "Alpha", "")),
+            ("b.mp3", TrackRecord("Two", ["Beta"], "First", "Jazz", "b.mp3", "", "", "", "")),
+        ]
+        tag_data, _ = build_tag_data(tracks, {})
+        offsets, _, _ = write_tag_files(self.db_dir, tag_data)
+        create_master_index_file(self.db_dir, tag_data, offsets)
+
+    def path(self, name):
+        return os.path.join(self.db_dir, name)
+
+    def test_valid_database_is_skipped_once_recorded(self):
+        """A valid database passes, and unchanged files are skipped by the next validation."""
+        self.assertTrue(validate_database(self.db_dir, deep=True, jobs=2))
+        results = validator.deep_validate(self.db_dir, jobs=1)
+        self.assertTrue(all(result["skipped"] for name, result in results.items() if name != validator.INDEX_FILE))
+        self.assertEqual(results["database_0.tcd"]["entries"], 2)
+
+        # Touched but unchanged files are hashed, not checked again
+        os.utime(self.path("database_0.tcd"), ns=(0, 0))
+        self.assertTrue(validator.deep_validate(self.db_dir, jobs=1)["database_0.tcd"]["skipped"])
+
+    def test_tag_files_are_read_once(self):
+        """New tag files are hashed from the mapping they are walked through, not read again to hash them."""
+        with patch("rockbox_db_manager.validator.file_digest", wraps=file_digest) as mock_digest:
+            results = validator.deep_validate(self.db_dir, jobs=1)
+        self.assertEqual([os.path.basename(call.args[0]) for call in mock_digest.call_args_list], [validator.INDEX_FILE])
+        self.assertEqual(results["database_3.tcd"]["digest"], file_digest(self.path("database_3.tcd")))
+
+    def test_first_bad_offset_is_reported(self):
+        """Bad length prefixes, invalid UTF-8 and index offsets off entry boundaries are caught."""
+        validator.deep_validate(self.db_dir, jobs=1)
+        with open(self.path("database_0.tcd"), "r+b") as f:
+            # Second entry ("Beta", at offset 9) claims to run past the end of the file
+            f.seek(9)
+            f.write(struct.pack("<I", 1000))
+        with open(self.path("database_1.tcd"), "r+b") as f:
+            f.seek(4)
+            f.write(b"\xff")
+        with open(self.path("database_idx.tcd"), "r+b") as f:
+            # Genre column of the first track points inside an entry
+            f.seek(4 + 2 * 4)
+            f.write(struct.pack("<I", 1))
+
+        results = validator.deep_validate(self.db_dir, jobs=1)
+        self.assertEqual(results["database_0.tcd"]["bad_offset"], 9)
+        self.assertIn("runs past the end", results["database_0.tcd"]["error"])
+        self.assertEqual(results["database_1.tcd"]["bad_offset"], 0)
+        self.assertIn("UTF-8", results["database_1.tcd"]["error"])
+        self.assertEqual(results["database_2.tcd"]["bad_offset"], 1)
+        self.assertIn("Track 0", results["database_2.tcd"]["error"])
+        self.assertIsNone(results["database_3.tcd"]["error"])
+        self.assertFalse(validate_database(self.db_dir, deep=True, jobs=1))
+
+    def test_truncated_index(self):
+        """An index that does not hold a full row per track fails instead of being read."""
+        with open(self.path("database_idx.tcd"), "r+b") as f:
+            f.truncate(20)
+        results = validator.deep_validate(self.db_dir, jobs=1)
+        self.assertIn("expected", results[validator.INDEX_FILE]["error"])
+        self.assertIsNone(results["database_0.tcd"]["error"])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+from rockbox_db_manager.database import create_rockbox_database
+from rockbox_db_manager.manifest import load_manifest
+from rockbox_db_manager.tcd_reader import TcdReader
+from rockbox_db_manager.watcher import LibraryWatcher
+from rockbox_db_manager.track import TrackRecord
+from helpers import isolate_cache
+
+def fake_read_metadata(file):
+    """Return deterministic metadata derived from the file name."""
+    name = os.path.basename(file)
+    artist = "Artist " + name[0].upper()
+    return TrackRecord("Title " + name, [artist], "Album", "Genre", name, "Composer", "Comment", artist, "Grouping"), None
+
+def read_strings(path):
+    with TcdReader(path) as reader:
+        return [entry for _, _, entry in reader.iter_strings()]
+
+class TestWatcher(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.music_dir = os.path.join(self.tmp.name, "music")
+        self.output_dir = os.path.join(self.tmp.name, "db")
+        os.makedirs(os.path.join(self.music_dir, "sub"))
+        for name in ["a1.mp3", "b1.mp3", os.path.join("sub", "c1.mp3")]:
+            self.write_file(name, b"x")
+        isolate_cache(self, self.tmp.name)
+        read_patch = patch("rockbox_db_manager.metadata.read_metadata", side_effect=fake_read_metadata)
+        self.mock_read = read_patch.start()
+        self.addCleanup(read_patch.stop)
+        self.watcher = LibraryWatcher(self.output_dir, self.music_dir, "missing-config.json", debounce=1.0, max_delay=5.0)
+        self.watcher.build()
+
+    def write_file(self, name, content):
+        with open(os.path.join(self.music_dir, name), "wb") as f:
+            f.write(content)
+
+    def test_changes_are_coalesced_and_applied(self):
+        """A burst of changes is applied once, re-reading only the changed files."""
+        self.mock_read.reset_mock()
+        self.write_file("d1.mp3", b"new")
+        self.write_file("d1.mp3", b"newer")
+        os.rename(os.path.join(self.music_dir, "b1.mp3"), os.path.join(self.music_dir, "sub", "b2.mp3"))
+        os.remove(os.path.join(self.music_dir, "sub", "c1.mp3"))
+        self.assertEqual(self.watcher.poll(), 4)
+
+        written = self.watcher.flush()
+        # Only the new file is parsed: the renamed one keeps its cached metadata
+        self.assertEqual([os.path.basename(call.args[0]) for call in self.mock_read.call_args_list], ["d1.mp3"])
+        self.assertIn("database_4.tcd", written)
+        self.assertEqual(read_strings(os.path.join(self.output_dir, "database_4.tcd")), ["a1.mp3", "b2.mp3", "d1.mp3"])
+        self.assertEqual(self.watcher.flush(), [])
+
+    def test_output_matches_full_build(self):
+        """The files written after an update are the ones create-db would produce."""
+        self.write_file(os.path.join("sub", "a0.mp3"), b"new")
+        self.watcher.poll()
+        self.watcher.flush()
+
+        full_dir = os.path.join(self.tmp.name, "full")
+        create_rockbox_database(full_dir, self.music_dir, "missing-config.json")
+        for name in sorted(os.listdir(full_dir)):
+            with open(os.path.join(full_dir, name), "rb") as full, open(os.path.join(self.output_dir, name), "rb") as watched:
+                self.assertEqual(full.read(), watched.read(), name)
+
+    def test_emptied_library_writes_empty_database(self):
+        """Once every track is gone, the database and manifest are emptied instead of left stale."""
+        for name in ["a1.mp3", "b1.mp3", os.path.join("sub", "c1.mp3")]:
+            os.remove(os.path.join(self.music_dir, name))
+        self.watcher.poll()
+        self.assertIn("database_idx.tcd", self.watcher.flush())
+        self.assertEqual(read_strings(os.path.join(self.output_dir, "database_4.tcd")), [])
+        with open(os.path.join(self.output_dir, "database_idx.tcd"), "rb") as f:
+            self.assertEqual(int.from_bytes(f.read(4), "little"), 0)
+        manifest = load_manifest(self.output_dir)
+        self.assertEqual((manifest["files"], manifest["track_count"]), ({}, 0))
+
+    def test_debounce(self):
+        """Changes are applied once they settled, or after the maximum delay."""
+        with patch("rockbox_db_manager.watcher.time.monotonic", return_value=100.0):
+            self.watcher.mark_changed(os.path.join(self.music_dir, "a1.mp3"))
+        self.assertFalse(self.watcher.is_due(100.5))
+        self.assertTrue(self.watcher.is_due(101.0))
+
+        for now in (101.0, 102.0, 103.0, 104.0, 105.0):
+            with patch("rockbox_db_manager.watcher.time.monotonic", return_value=now):
+                self.watcher.mark_changed(os.path.join(self.music_dir, "b1.mp3"))
+            self.assertEqual(self.watcher.is_due(now + 0.5), now + 0.5 - 100.0 >= 5.0)
+
+if __name__ == '__main__':
+    unittest.main()